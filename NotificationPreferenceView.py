@@ -4,19 +4,26 @@ import discord  # Added import for discord
 import prompt_manager
 
 class NotificationPreferenceView(View):
-    def __init__(self, member_id, callback):
+    """
+    Buttons for a member to turn response notifications on or off.
+
+    The buttons have fixed custom IDs and act for whoever presses them, so a single
+    instance registered with bot.add_view handles the buttons of every welcome
+    message, including those sent before the bot restarted.
+    """
+
+    def __init__(self, callback):
         super().__init__(timeout=None)
-        self.member_id = str(member_id)
         self.callback = callback  # Store the callback function
 
-    @discord.ui.button(label="Enable Notifications", style=discord.ButtonStyle.green)
+    @discord.ui.button(label="Enable Notifications", style=discord.ButtonStyle.green, custom_id="notification_preference:enable")
     async def enable_notifications(self, interaction: discord.Interaction, button: Button):
         await interaction.response.send_message("Notifications have been enabled for you.", ephemeral=True)
         if self.callback:
-            await self.callback(self.member_id, True)  # Invoke the callback with the member ID and value
+            await self.callback(interaction.guild_id, str(interaction.user.id), True)  # Invoke the callback with the guild, member ID and value
 
-    @discord.ui.button(label="Disable Notifications", style=discord.ButtonStyle.red)
+    @discord.ui.button(label="Disable Notifications", style=discord.ButtonStyle.red, custom_id="notification_preference:disable")
     async def disable_notifications(self, interaction: discord.Interaction, button: Button):
         await interaction.response.send_message("Notifications have been disabled for you.", ephemeral=True)
         if self.callback:
-            await self.callback(self.member_id, False)  # Invoke the callback with the member ID and value
+            await self.callback(interaction.guild_id, str(interaction.user.id), False)  # Invoke the callback with the guild, member ID and value
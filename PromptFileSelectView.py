@@ -1,27 +1,165 @@
-from discord.ui import View, Button
-from discord import ButtonStyle, Interaction
-import prompt_manager
+import discord
+from discord.ui import View, Button, Select, Modal, TextInput, DynamicItem
+from discord import ButtonStyle, Interaction, SelectOption
+
+SEARCH_MAX_LENGTH = 50  # Keeps the search query short enough to fit in the page buttons' custom IDs
+
+
+async def get_prompt_text(interaction):
+    """
+    Reads the prompt being filed from the message the file selection replies to.
+
+    :return: The prompt text, or None if that message is gone.
+    """
+    reference = interaction.message.reference if interaction.message else None
+    if reference is None:
+        return None
+    message = reference.resolved if isinstance(reference.resolved, discord.Message) else reference.cached_message
+    if message is None:
+        try:
+            message = await interaction.channel.fetch_message(reference.message_id)
+        except discord.NotFound:
+            return None
+    return message.content.strip()
+
+
+class PromptFileControl:
+    """
+    Shared state of the file selection's components. discord.py recreates them from
+    their custom IDs on every interaction, so they cannot hold a manager themselves.
+    """
+
+    manager = None  # The bot's AsyncPromptManager, set by PromptFileSelectView
+
+
+class PromptFileMenu(PromptFileControl, DynamicItem[Select], template=r"prompt_files:select"):
+    def __init__(self, entries=(), placeholder=None):
+        super().__init__(Select(
+            custom_id="prompt_files:select",
+            placeholder=placeholder,
+            options=[
+                SelectOption(
+                    label=entry["file_name"][:100],
+                    value=entry["file_name"][:100],
+                    description=f"{entry['count']} prompts"
+                )
+                for entry in entries
+            ]
+        ))
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls()
+
+    async def callback(self, interaction: Interaction):
+        file_name = self.item.values[0]
+        prompt_text = await get_prompt_text(interaction)
+        if prompt_text is None:
+            await interaction.response.send_message("The prompt message was deleted.", ephemeral=True)
+            return
+        # Look for near-duplicates before the prompt is added, so it doesn't match itself
+        similar = await self.manager.find_similar_prompts(prompt_text)
+        if not await self.manager.write_prompt(file_name, prompt_text):
+            await interaction.response.send_message("That prompt is already in the library.", ephemeral=True)
+            return
+        message = f"Prompt added to {file_name}."
+        if similar:
+            message += "\nIt looks similar to:" + "".join(
+                f"\n- \"{similar_text[:200]}\" ({similar_file}, {similarity:.0%} similar)"
+                for similarity, similar_file, similar_text in similar
+            )
+        await interaction.response.send_message(message, ephemeral=True)
+
+
+class PromptFilePageButton(PromptFileControl, DynamicItem[Button],
+                           template=r"prompt_files:(?P<direction>previous|next):(?P<page>\d+):(?P<query>.*)"):
+    def __init__(self, direction, page, query=None, disabled=False):
+        self.page = page
+        self.query = query or None
+        super().__init__(Button(
+            label=direction.capitalize(),
+            style=ButtonStyle.secondary,
+            disabled=disabled,
+            custom_id=f"prompt_files:{direction}:{page}:{query or ''}"
+        ))
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match["direction"], int(match["page"]), match["query"])
+
+    async def callback(self, interaction: Interaction):
+        view = await PromptFileSelectView.create(self.manager, self.page, self.query)
+        await interaction.response.edit_message(view=view)
+
+
+class PromptFileSearchButton(PromptFileControl, DynamicItem[Button], template=r"prompt_files:search"):
+    def __init__(self, query=None):
+        super().__init__(Button(
+            label="Search" if not query else f"Search: {query}"[:80],
+            style=ButtonStyle.primary,
+            custom_id="prompt_files:search"
+        ))
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls()
+
+    async def callback(self, interaction: Interaction):
+        await interaction.response.send_modal(PromptFileSearchModal(self.manager))
+
 
 class PromptFileSelectView(View):
-    def __init__(self, prompt_text):
+    """
+    Paginated, searchable selection of the prompt file to add a prompt to.
+
+    The view is posted as a reply to the prompt, and every component keeps its
+    state (page and search query) in its custom ID, so nothing is held in memory
+    per message. Once register has been called at startup, selections posted
+    before a restart keep working. Views are built with create, which looks the
+    page up on the storage worker.
+    """
+
+    def __init__(self, manager, entries, page, page_count, query=None):
+        """
+        :param entries: The page's catalog entries, as returned by the catalog's get_page.
+        """
         super().__init__(timeout=None)
-        self.prompt_text = prompt_text
-
-        # Add buttons for existing prompt files with prompt count
-        for file_name in prompt_manager.PromptManager().list_prompt_files():
-            prompt_count = prompt_manager.PromptManager().get_prompt_count(file_name)  # Get the count of prompts in the file
-            button = Button(
-                label=f"{file_name} ({prompt_count})",  # Include the count in the label
-                style=ButtonStyle.primary
-            )
-            button.callback = self.create_button_callback(file_name)
-            self.add_item(button)
-
-    def create_button_callback(self, file_name):
-        async def callback(interaction: Interaction):
-            # Save the second-to-last message (prompt text) to the selected file
-            prompt_manager.PromptManager().write_prompt(file_name, self.prompt_text)
-            await interaction.response.send_message(
-                f"Prompt added to {file_name}.", ephemeral=True
-            )
-        return callback
+        PromptFileControl.manager = manager  # The bot's AsyncPromptManager, so writes go to its storage worker
+        self.page = page
+        self.page_count = page_count
+        if entries:
+            self.add_item(PromptFileMenu(entries, f"Choose a prompt file (page {self.page + 1}/{self.page_count})"))
+
+        self.add_item(PromptFilePageButton("previous", max(self.page - 1, 0), query, disabled=self.page == 0))
+        self.add_item(PromptFilePageButton("next", min(self.page + 1, self.page_count - 1), query,
+                                           disabled=self.page >= self.page_count - 1))
+        self.add_item(PromptFileSearchButton(query))
+
+    @classmethod
+    async def create(cls, manager, page=0, query=None):
+        """
+        Builds the view for one page of prompt files. File details missing from the
+        catalog's cache are read from storage, so the page is looked up on the worker.
+        """
+        entries, page, page_count = await manager.get_prompt_file_page(page, query)
+        return cls(manager, entries, page, page_count, query)
+
+    @staticmethod
+    def register(bot, manager):
+        """
+        Registers the file selection's components with the bot, so selections posted
+        before a restart respond again.
+        """
+        PromptFileControl.manager = manager
+        bot.add_dynamic_items(PromptFileMenu, PromptFilePageButton, PromptFileSearchButton)
+
+class PromptFileSearchModal(Modal, title="Search prompt files"):
+    query = TextInput(label="File name contains", required=False, max_length=SEARCH_MAX_LENGTH)
+
+    def __init__(self, manager):
+        super().__init__()
+        self.manager = manager
+
+    async def on_submit(self, interaction: Interaction):
+        view = await PromptFileSelectView.create(self.manager, 0, self.query.value or None)
+        await interaction.response.edit_message(view=view)
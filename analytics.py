@@ -0,0 +1,231 @@
+from datetime import datetime, timezone
+import numpy as np
+
+LENGTH_BUCKETS = (50, 200, 500, 1000)  # Upper bounds (in characters) of the response length buckets
+
+
+def _epoch(timestamp):
+    # Used prompts store their completion time as "YYYY-MM-DD HH:MM:SS" in UTC
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    try:
+        return datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class Columns:
+    """
+    A table stored as one NumPy array per column. Rows are appended in batches,
+    and the arrays grow by doubling, so appending a round is amortized O(1).
+    """
+
+    def __init__(self, **dtypes):
+        self.arrays = {name: np.zeros(0, dtype=dtype) for name, dtype in dtypes.items()}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, name):
+        return self.arrays[name][:self.size]
+
+    def append(self, **columns):
+        """
+        Appends rows given as one list of values per column.
+        """
+        count = len(next(iter(columns.values())))
+        needed = self.size + count
+        for name, array in self.arrays.items():
+            if needed > len(array):
+                grown = np.zeros(max(needed, 2 * len(array), 64), dtype=array.dtype)
+                grown[:self.size] = array[:self.size]
+                self.arrays[name] = array = grown
+            array[self.size:needed] = columns[name]
+        self.size = needed
+
+
+def _group_medians(groups, values, group_count):
+    # Median of each group's values, ignoring NaN; groups without values get NaN
+    known = ~np.isnan(values)
+    groups, values = groups[known], values[known]
+    # Sort by value, then stably by group (a fast integer sort), rather than a slower lexsort
+    order = np.argsort(values)
+    groups, values = groups[order], values[order]
+    order = np.argsort(groups, kind="stable")
+    groups, values = groups[order], values[order]
+    starts = np.searchsorted(groups, np.arange(group_count), side="left")
+    ends = np.searchsorted(groups, np.arange(group_count), side="right")
+    counts = ends - starts
+    medians = np.full(group_count, np.nan)
+    has_values = counts > 0
+    low = starts[has_values] + (counts[has_values] - 1) // 2
+    high = starts[has_values] + counts[has_values] // 2
+    medians[has_values] = (values[low] + values[high]) / 2
+    return medians, counts
+
+
+class RoundAnalytics:
+    """
+    Columnar view of a guild's completed rounds for the !stats report.
+
+    Rounds and responses are kept in two tables of NumPy columns, with prompt
+    files and members encoded as small integers. The view is built once from the
+    used prompt archive and extended as rounds complete, so a report is a few
+    vectorized passes over the arrays however long the history is.
+    """
+
+    def __init__(self):
+        self.files = []  # File code -> prompt file name
+        self.file_codes = {}
+        self.members = []  # Member code -> user ID (as a string)
+        self.member_codes = {}
+        self.prompt_ids = set()
+        self.rounds = Columns(file=np.int32, started=np.float64, completed=np.float64,
+                              expected=np.int32, responded=np.int32)
+        self.responses = Columns(round=np.int32, member=np.int32, latency=np.float64, length=np.int32)
+
+    def __len__(self):
+        return len(self.rounds)
+
+    def _code(self, value, values, codes):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def add_rounds(self, records):
+        """
+        Appends completed rounds to the tables. Rounds already added are skipped.
+
+        :param records: An iterable of (prompt_id, prompt_data) pairs of used prompts.
+        """
+        rounds = {name: [] for name in self.rounds.arrays}
+        responses = {name: [] for name in self.responses.arrays}
+        for prompt_id, prompt_data in records:
+            if prompt_id in self.prompt_ids:
+                continue
+            self.prompt_ids.add(prompt_id)
+
+            # When each member was sent the prompt; resumed deliveries may have sent it twice
+            delivered = {}
+            for message_data in prompt_data.get("message_ids", {}).values():
+                user_id = str(message_data["user_id"])
+                delivered[user_id] = min(delivered.get(user_id, np.inf), message_data["timestamp"])
+            expected = prompt_data["recipients"] if "recipients" in prompt_data else delivered
+            response_times = prompt_data.get("response_times", {})
+
+            round_index = len(self.rounds) + len(rounds["file"])
+            rounds["file"].append(self._code(prompt_data.get("selected_file") or "unknown", self.files, self.file_codes))
+            rounds["started"].append(prompt_data.get("started", np.nan))
+            rounds["completed"].append(_epoch(prompt_data.get("timestamp")))
+            rounds["expected"].append(len(expected))
+            rounds["responded"].append(sum(1 for user_id in prompt_data.get("responses", {}) if user_id in expected))
+
+            for user_id, response in prompt_data.get("responses", {}).items():
+                responses["round"].append(round_index)
+                responses["member"].append(self._code(str(user_id), self.members, self.member_codes))
+                # Rounds recorded before responses were timed have no latency
+                if user_id in response_times and user_id in delivered:
+                    responses["latency"].append(response_times[user_id] - delivered[user_id])
+                else:
+                    responses["latency"].append(np.nan)
+                responses["length"].append(len(response or ""))
+
+        if rounds["file"]:
+            self.rounds.append(**rounds)
+        if responses["round"]:
+            self.responses.append(**responses)
+
+    def report(self, limit=10):
+        """
+        Computes the figures of the !stats report.
+
+        :param limit: Number of members listed in the latency table.
+        :return: A dictionary of plain Python values.
+        """
+        expected = self.rounds["expected"]
+        responded = self.rounds["responded"]
+        # Completion times are stored to the second, so a round can appear to end before it started
+        durations = np.maximum(self.rounds["completed"] - self.rounds["started"], 0)
+        latencies = self.responses["latency"]
+        lengths = self.responses["length"]
+
+        # Response rate per prompt file
+        file_codes = self.rounds["file"]
+        file_rounds = np.bincount(file_codes, minlength=len(self.files))
+        file_expected = np.bincount(file_codes, weights=expected, minlength=len(self.files))
+        file_responded = np.bincount(file_codes, weights=responded, minlength=len(self.files))
+        files = [
+            (self.files[code], int(file_rounds[code]), float(file_responded[code] / file_expected[code]))
+            for code in np.argsort(-file_rounds, kind="stable") if file_expected[code]
+        ]
+
+        # Responses and median time to respond per member, most active first
+        member_codes = self.responses["member"]
+        member_responses = np.bincount(member_codes, minlength=len(self.members))
+        medians, timed = _group_medians(member_codes, latencies, len(self.members))
+        members = [
+            (self.members[code], int(member_responses[code]), None if np.isnan(medians[code]) else float(medians[code]))
+            for code in np.argsort(-member_responses, kind="stable")[:limit]
+        ]
+
+        # Response lengths, in buckets of LENGTH_BUCKETS characters
+        bucket_counts = np.bincount(np.searchsorted(LENGTH_BUCKETS, lengths, side="right"),
+                                    minlength=len(LENGTH_BUCKETS) + 1)
+
+        def quantiles(values):
+            values = values[~np.isnan(values)] if values.dtype.kind == "f" else values
+            if not len(values):
+                return None
+            return [float(q) for q in np.percentile(values, (50, 90))]
+
+        return {
+            "rounds": len(self.rounds),
+            "responses": len(self.responses),
+            "response_rate": float(responded.sum() / expected.sum()) if expected.sum() else None,
+            "round_duration": quantiles(durations),
+            "latency": quantiles(latencies),
+            "timed_responses": int(timed.sum()),
+            "length": quantiles(lengths.astype(np.float64)),
+            "length_buckets": [int(count) for count in bucket_counts],
+            "files": files,
+            "members": members,
+        }
+
+
+def format_round_stats(report, member_name, format_duration):
+    """
+    :param report: The report returned by RoundAnalytics.report.
+    :param member_name: Function returning the display name of a user ID.
+    :param format_duration: Function formatting a number of seconds.
+    :return: The sections of the !stats report, for render_digest.
+    """
+    if not report["rounds"]:
+        return ["No completed rounds yet."]
+
+    def median_p90(values, unit=format_duration):
+        return f"median {unit(values[0])}, p90 {unit(values[1])}" if values else "n/a"
+
+    rate = f"{report['response_rate']:.0%}" if report["response_rate"] is not None else "n/a"
+    lines = [
+        f"**Round history** ({report['rounds']} rounds, {report['responses']} responses, {rate} response rate)",
+        f"Round duration: {median_p90(report['round_duration'])}",
+        f"Time to respond: {median_p90(report['latency'])} ({report['timed_responses']} timed responses)",
+        f"Response length: {median_p90(report['length'], lambda value: f'{value:.0f} characters')}",
+    ]
+    bounds = ("0",) + tuple(str(bound) for bound in LENGTH_BUCKETS)
+    lines.append("Lengths: " + ", ".join(
+        f"{low}-{high}: {count}" for low, high, count in zip(bounds, LENGTH_BUCKETS, report["length_buckets"])
+    ) + f", {LENGTH_BUCKETS[-1]}+: {report['length_buckets'][-1]}")
+
+    files = ["**Response rate by prompt file**"]
+    for file_name, rounds, file_rate in report["files"]:
+        files.append(f"{file_name}: {file_rate:.0%} over {rounds} rounds")
+
+    members = ["**Most active members**"]
+    for user_id, responses, latency in report["members"]:
+        latency_text = f", median time to respond {format_duration(latency)}" if latency is not None else ""
+        members.append(f"{member_name(user_id)}: {responses} responses{latency_text}")
+    return ["\n".join(lines), "\n".join(files), "\n".join(members)]
@@ -0,0 +1,148 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics
+
+
+class AsyncPromptManager:
+    """
+    Async facade over a PromptManager for use on the event loop.
+
+    Every call that may read or write storage runs on one dedicated worker thread,
+    so a slow disk never stalls the event loop, and since there is only one worker,
+    writes reach storage one at a time and in the order they were made. Lookups
+    that only read the manager's in-memory state are passed straight through.
+    """
+
+    def __init__(self, manager):
+        """
+        :param manager: The PromptManager to wrap.
+        """
+        self.manager = manager
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prompt-storage")
+
+    def __getattr__(self, name):
+        # In-memory lookups (get_prompt, is_prompt_message, ...) stay synchronous
+        return getattr(self.manager, name)
+
+    async def run(self, function, *args):
+        """
+        Runs a function on the worker thread and waits for its result.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.worker, functools.partial(self._timed, function, *args))
+
+    def submit(self, function, *args):
+        """
+        Queues a function on the worker thread without waiting for it, for writes
+        made from synchronous code. Failures are printed.
+        """
+        future = self.worker.submit(self._timed, function, *args)
+        future.add_done_callback(self._report_failure)
+        return future
+
+    @staticmethod
+    def _timed(function, *args):
+        # Records how long each manager call takes on the worker, excluding time spent queued
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            metrics.observe("manager_call_seconds", time.perf_counter() - start, method=function.__name__)
+
+    @staticmethod
+    def _report_failure(future):
+        if future.exception():
+            print(f"Storage write failed: {future.exception()!r}")
+
+    def close(self):
+        """
+        Waits for queued writes to finish, then closes the manager.
+        """
+        self.worker.shutdown(wait=True)
+        self.manager.close()
+
+    async def warm_up(self):
+        return await self.run(self.manager.warm_up)
+
+    # Rounds
+
+    async def get_random_prompt(self, guild_id=None):
+        return await self.run(self.manager.get_random_prompt, guild_id)
+
+    async def plan_delivery(self, prompt_id, recipients):
+        return await self.run(self.manager.plan_delivery, prompt_id, recipients)
+
+    async def add_message_ids(self, prompt_id, deliveries):
+        return await self.run(self.manager.add_message_ids, prompt_id, deliveries)
+
+    async def add_recipient(self, prompt_id, user_id, channel_id):
+        return await self.run(self.manager.add_recipient, prompt_id, user_id, channel_id)
+
+    async def remove_recipient(self, prompt_id, user_id):
+        return await self.run(self.manager.remove_recipient, prompt_id, user_id)
+
+    async def record_reminders(self, prompt_id, reminders):
+        return await self.run(self.manager.record_reminders, prompt_id, reminders)
+
+    async def get_open_prompts(self, guild_id):
+        return await self.run(self.manager.get_open_prompts, guild_id)
+
+    async def get_undelivered(self, prompt_id):
+        return await self.run(self.manager.get_undelivered, prompt_id)
+
+    async def add_response(self, prompt_id, user_id, response):
+        return await self.run(self.manager.add_response, prompt_id, user_id, response)
+
+    async def move_prompt_to_used(self, prompt_id, comment_link):
+        return await self.run(self.manager.move_prompt_to_used, prompt_id, comment_link)
+
+    async def review_used_prompts(self, guild_id=None, page=0):
+        return await self.run(self.manager.review_used_prompts, guild_id, page)
+
+    async def get_used_prompts_page(self, guild_id, page=0, per_page=10, selected_file=None, date=None):
+        return await self.run(self.manager.get_used_prompts_page, guild_id, page, per_page, selected_file, date)
+
+    async def get_round_stats(self, guild_id, limit=10):
+        return await self.run(self.manager.get_round_stats, guild_id, limit)
+
+    # Prompt library
+
+    async def write_prompt(self, filename, prompt_text):
+        return await self.run(self.manager.write_prompt, filename, prompt_text)
+
+    async def import_prompts(self, filename, prompt_texts):
+        return await self.run(self.manager.import_prompts, filename, prompt_texts)
+
+    async def find_similar_prompts(self, prompt_text, limit=3):
+        return await self.run(self.manager.find_similar_prompts, prompt_text, limit)
+
+    async def find_duplicate_prompts(self):
+        return await self.run(self.manager.find_duplicate_prompts)
+
+    async def get_prompt_file_page(self, page=0, query=None):
+        return await self.run(self.manager.catalog.get_page, page, query)
+
+    async def create_prompt_file(self, file_name):
+        return await self.run(self.manager.create_prompt_file, file_name)
+
+    # Notifications and private channels
+
+    async def get_notifications(self, guild_id=None):
+        return await self.run(self.manager.get_notifications, guild_id)
+
+    async def set_notification(self, guild_id, user_id, enabled):
+        return await self.run(self.manager.set_notification, guild_id, user_id, enabled)
+
+    def set_private_channel(self, guild_id, member_id, channel_id):
+        # Called from the synchronous channel registry, so the write is queued rather than awaited
+        return self.submit(self.manager.set_private_channel, guild_id, member_id, channel_id)
+
+    # Round schedules
+
+    async def get_schedules(self):
+        return await self.run(self.manager.get_schedules)
+
+    async def set_schedule(self, guild_id, schedule):
+        return await self.run(self.manager.set_schedule, guild_id, schedule)
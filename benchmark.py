@@ -0,0 +1,373 @@
+"""
+Offline benchmarks for the bot's hot paths.
+
+Drives main.py's handlers (!init, !prompt, on_member_join, prompt replies and
+send_responses) and the prompt manager against the in-process guild from
+fake_discord.py, and reports throughput, latency percentiles, simulated API
+calls and file I/O for each phase. Each configuration runs in its own process
+and temporary folder, so no real state is touched.
+
+Usage:
+    python benchmark.py --members 10 100 1000 --prompts 1000 --latency 0.05
+"""
+import argparse
+import asyncio
+import builtins
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+DEFAULT_MEMBER_COUNTS = [10, 100, 1000, 10000]
+
+
+def percentile(samples, p):
+    """
+    :return: The p-th percentile (0-100) of samples, by nearest rank.
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class CountingFile:
+    """
+    Wraps a file object, counting the bytes read from and written to it.
+    """
+
+    def __init__(self, file, counter):
+        self._file = file
+        self._counter = counter
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._file.close()
+
+    def __iter__(self):
+        for line in self._file:
+            self._counter.counts["bytes_read"] += len(line)
+            yield line
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def read(self, *args):
+        data = self._file.read(*args)
+        self._counter.counts["bytes_read"] += len(data)
+        return data
+
+    def write(self, data):
+        self._counter.counts["bytes_written"] += len(data)
+        return self._file.write(data)
+
+
+class IOCounter:
+    """
+    Counts file opens, bytes read and written, fsyncs and atomic renames while installed.
+    """
+
+    def __init__(self):
+        self.counts = dict.fromkeys(["reads", "writes", "bytes_read", "bytes_written", "fsyncs", "renames"], 0)
+        self._originals = None
+
+    def snapshot(self):
+        return dict(self.counts)
+
+    def install(self):
+        self._originals = (builtins.open, os.fsync, os.replace)
+        open_file, fsync, replace = self._originals
+
+        def counting_open(file, mode="r", *args, **kwargs):
+            writing = any(flag in mode for flag in "wax+")
+            self.counts["writes" if writing else "reads"] += 1
+            return CountingFile(open_file(file, mode, *args, **kwargs), self)
+
+        def counting_fsync(fd):
+            self.counts["fsyncs"] += 1
+            return fsync(fd)
+
+        def counting_replace(src, dst, *args, **kwargs):
+            self.counts["renames"] += 1
+            return replace(src, dst, *args, **kwargs)
+
+        builtins.open, os.fsync, os.replace = counting_open, counting_fsync, counting_replace
+
+    def uninstall(self):
+        builtins.open, os.fsync, os.replace = self._originals
+
+
+class Phase:
+    """
+    Measures one benchmark phase: per-operation latencies, elapsed time, and the
+    API calls and file I/O made during it. A phase can be entered several times;
+    the measurements add up.
+    """
+
+    def __init__(self, name, api, io_counter):
+        self.name = name
+        self.api = api
+        self.io_counter = io_counter
+        self.samples = []
+        self.ops = 0
+        self.seconds = 0.0
+        self.api_calls = 0
+        self.io = dict.fromkeys(io_counter.counts, 0)
+
+    def __enter__(self):
+        self.api_before = sum(self.api.calls.values())
+        self.io_before = self.io_counter.snapshot()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds += time.perf_counter() - self.start
+        self.api_calls += sum(self.api.calls.values()) - self.api_before
+        for key, value in self.io_counter.snapshot().items():
+            self.io[key] += value - self.io_before[key]
+
+    async def time(self, awaitable):
+        start = time.perf_counter()
+        result = await awaitable
+        self.samples.append(time.perf_counter() - start)
+        self.ops += 1
+        return result
+
+    def result(self):
+        return {
+            "phase": self.name,
+            "ops": self.ops,
+            "seconds": self.seconds,
+            "throughput": self.ops / self.seconds if self.seconds else None,
+            "p50": percentile(self.samples, 50),
+            "p95": percentile(self.samples, 95),
+            "p99": percentile(self.samples, 99),
+            "api_calls": self.api_calls,
+            **self.io,
+        }
+
+
+def make_prompt_library(folder, prompt_count, file_count):
+    os.makedirs(folder, exist_ok=True)
+    per_file = -(-prompt_count // file_count)
+    for file_index in range(file_count):
+        prompts = [
+            f"Benchmark prompt {file_index}-{i}?"
+            for i in range(per_file)
+            if file_index * per_file + i < prompt_count
+        ]
+        with open(os.path.join(folder, f"Benchmark {file_index}.json"), "w") as f:
+            json.dump(prompts, f)
+
+
+async def run_scenario(bot_main, api, io_counter, member_count, joins, draws):
+    from fake_discord import FakeGuild, FakeTextChannel, FakeContext, FakeMessage, FakeReference
+
+    results = []
+    guild = FakeGuild(member_count, api)
+    admin = guild.members[1]
+    command_channel = FakeTextChannel(guild, "bot-commands")
+    ctx = FakeContext(guild, command_channel, admin)
+
+    async def no_commands(message):
+        pass  # Command parsing needs a logged in bot and is not part of the measured paths
+    bot_main.bot.process_commands = no_commands
+
+    # Time every send_responses call, including the one made by the final reply
+    send_responses = bot_main.send_responses
+
+    async def drain():
+        await bot_main.manager.run(lambda: None)  # Wait for writes queued on the storage worker
+
+    with Phase("init", api, io_counter) as phase:
+        await phase.time(bot_main.init(ctx))
+        await drain()
+        phase.ops = len(guild.text_channels)
+    results.append(phase.result())
+
+    with Phase("send_new_prompt", api, io_counter) as phase:
+        await phase.time(bot_main.send_new_prompt(ctx))
+        phase.ops = sum(1 for channel in guild.text_channels if channel.name.endswith("-private"))
+    results.append(phase.result())
+
+    prompt_id = next(iter(await bot_main.manager.get_open_prompts(guild.id)))
+
+    with Phase("on_member_join", api, io_counter) as phase:
+        for i in range(joins):
+            await phase.time(bot_main.on_member_join(guild.add_member(f"joiner{i}")))
+        await drain()
+    results.append(phase.result())
+
+    responses_phase = Phase("send_responses", api, io_counter)
+
+    async def timed_send_responses(guild, prompt_data):
+        with responses_phase:
+            await responses_phase.time(send_responses(guild, prompt_data))
+    bot_main.send_responses = timed_send_responses
+
+    replies = []
+    for message_id, user_id, _ in bot_main.manager.get_prompt(prompt_id).iter_messages():
+        member = guild.get_member(user_id)
+        channel = bot_main.registry.get_channel(guild, member.id)
+        replies.append(FakeMessage(channel, member, f"Response from {member.name}", FakeReference(message_id)))
+
+    with Phase("on_message (reply)", api, io_counter) as phase:
+        for message in replies:
+            await phase.time(bot_main.on_message(message))
+    results.append(phase.result())
+    results.append(responses_phase.result())
+    bot_main.send_responses = send_responses
+
+    # Prompt manager on its own, without Discord calls
+    manager = bot_main.manager.manager
+    with Phase("get_random_prompt", api, io_counter) as phase:
+        for _ in range(draws):
+            start = time.perf_counter()
+            prompt_text, _ = manager.get_random_prompt(guild.id)
+            phase.samples.append(time.perf_counter() - start)
+            if prompt_text is None:
+                break
+            phase.ops += 1
+    results.append(phase.result())
+
+    with Phase("get_prompt_by_message_id", api, io_counter) as phase:
+        for message in replies:
+            start = time.perf_counter()
+            manager.get_prompt_by_message_id(message.reference.message_id)
+            phase.samples.append(time.perf_counter() - start)
+            phase.ops += 1
+    results.append(phase.result())
+
+    return results
+
+
+def run_single(args):
+    """
+    Runs one configuration in a temporary folder and returns its results.
+    """
+    from fake_discord import FakeAPI
+
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        make_prompt_library("prompts", args.prompts, args.prompt_files)
+        try:
+            import config
+        except ImportError:
+            sys.modules["config"] = types.SimpleNamespace(BOT_TOKEN=None)  # Never used; the bot is not started
+        if args.backend:
+            sys.modules["config"].STORAGE_BACKEND = args.backend
+        if not args.rate_limits:
+            # Measure the handlers themselves rather than the pacing of outgoing messages
+            sys.modules["config"].OUTBOUND_RATE = None
+            sys.modules["config"].OUTBOUND_CHANNEL_RATE = None
+
+        # The state files live next to prompt_manager.py; keep the benchmark's in the temporary folder
+        from prompt_manager import PromptManager
+        for name in dir(PromptManager):
+            if name.endswith(("_FILE", "_FOLDER")) and os.path.isabs(getattr(PromptManager, name)):
+                setattr(PromptManager, name, os.path.join(folder, os.path.basename(getattr(PromptManager, name))))
+
+        io_counter = IOCounter()
+        io_counter.install()
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output):
+                start = time.perf_counter()
+                import main as bot_main
+                startup = time.perf_counter() - start
+                api = FakeAPI(args.latency, args.jitter)
+
+                async def run():
+                    bot_main.lag_monitor.report = lambda lag: None
+                    bot_main.lag_monitor.start()
+                    results = await run_scenario(bot_main, api, io_counter, args.single, args.joins, args.draws)
+                    bot_main.lag_monitor.stop()
+                    return results
+
+                results = asyncio.run(run())
+                bot_main.manager.close()
+        finally:
+            io_counter.uninstall()
+
+    return {
+        "members": args.single,
+        "prompts": args.prompts,
+        "latency": args.latency,
+        "startup": startup,
+        "max_loop_lag": bot_main.lag_monitor.max_lag,
+        "phases": results,
+    }
+
+
+def format_seconds(value):
+    if value is None:
+        return "-"
+    return f"{value * 1000:.2f}ms"
+
+
+def print_report(report):
+    print(
+        f"\n{report['members']} members, {report['prompts']} prompts, {report['latency'] * 1000:.0f}ms API latency "
+        f"(startup {format_seconds(report['startup'])}, max loop lag {format_seconds(report['max_loop_lag'])})"
+    )
+    print(f"{'phase':<26}{'ops':>7}{'ops/s':>11}{'p50':>13}{'p95':>13}{'p99':>13}{'api':>8}{'reads':>8}{'writes':>8}{'written':>12}")
+    for phase in report["phases"]:
+        throughput = f"{phase['throughput']:.1f}" if phase["throughput"] else "-"
+        print(
+            f"{phase['phase']:<26}{phase['ops']:>7}{throughput:>11}"
+            f"{format_seconds(phase['p50']):>13}{format_seconds(phase['p95']):>13}{format_seconds(phase['p99']):>13}"
+            f"{phase['api_calls']:>8}{phase['reads']:>8}{phase['writes']:>8}{phase['bytes_written']:>12}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bot's handlers against a simulated guild.")
+    parser.add_argument("--members", type=int, nargs="+", default=DEFAULT_MEMBER_COUNTS, help="Member counts to run")
+    parser.add_argument("--prompts", type=int, default=1000, help="Prompts in the library")
+    parser.add_argument("--prompt-files", type=int, default=10, help="Files the prompts are spread over")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated API latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random API latency, up to this many seconds")
+    parser.add_argument("--joins", type=int, default=20, help="Members joining while the prompt is open")
+    parser.add_argument("--draws", type=int, default=100, help="Prompts drawn in the get_random_prompt phase")
+    parser.add_argument("--backend", choices=["json", "sqlite"], help="Storage backend (defaults to config)")
+    parser.add_argument("--rate-limits", action="store_true", help="Pace outgoing messages as the bot does")
+    parser.add_argument("--json", metavar="FILE", help="Also write the results to FILE as JSON")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)  # Run one member count in this process
+    args = parser.parse_args()
+
+    if args.single is not None:
+        print(json.dumps(run_single(args)))
+        return
+
+    reports = []
+    for member_count in args.members:
+        command = [sys.executable, os.path.abspath(__file__), "--single", str(member_count)]
+        for option in ["prompts", "prompt_files", "latency", "jitter", "joins", "draws", "backend"]:
+            value = getattr(args, option)
+            if value is not None:
+                command += [f"--{option.replace('_', '-')}", str(value)]
+        if args.rate_limits:
+            command.append("--rate-limits")
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(f"Benchmark with {member_count} members failed:\n{completed.stderr}")
+            continue
+        report = json.loads(completed.stdout.strip().splitlines()[-1])
+        print_report(report)
+        reports.append(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
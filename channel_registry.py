@@ -0,0 +1,166 @@
+import discord
+
+
+class MemberStub:
+    """
+    Stand-in for a member with a private channel who is not in discord.py's member
+    cache (in lean mode): just enough to address them in their channel.
+    """
+
+    __slots__ = ("id", "guild")
+    bot = False
+
+    def __init__(self, guild, member_id):
+        self.id = member_id
+        self.guild = guild
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+
+class PrivateChannelRegistry:
+    """
+    Keeps track of which private channel belongs to which member.
+
+    The registry is built from a guild's channel list only the first time the
+    guild is seen; after that it is kept up to date from member and channel
+    events and persisted in each guild's storage, so lookups never scan the
+    channel list or compute channel member lists.
+
+    In lean mode discord.py doesn't cache members, and the registry's member IDs
+    are the bot's only record of the members it delivers prompts to.
+    """
+
+    def __init__(self, manager, lean=False):
+        """
+        :param manager: The PromptManager (or its async facade) persisting the registry.
+        :param lean: Whether discord.py's member cache is off, so members with a private
+                     channel are looked up as MemberStubs.
+        """
+        self.manager = manager
+        self.lean = lean
+        self.channels = {}  # guild_id -> {member_id: channel_id}
+        self.owners = {}  # channel_id -> (guild_id, member_id)
+
+        # Channels recorded before guilds were partitioned are copied into their guild's storage
+        legacy = manager.storage.load_private_channels()
+        guild_ids = {int(guild_id) for guild_id in legacy} | {guild_id for guild_id in manager.partitions if guild_id}
+        for guild_id in guild_ids:
+            if not manager.owns_guild(guild_id):
+                continue
+            storage = manager.get_storage(guild_id)
+            guild_channels = storage.load_private_channels().get(str(guild_id))
+            if guild_channels is None:
+                guild_channels = legacy.get(str(guild_id), {})
+                for member_id, channel_id in guild_channels.items():
+                    storage.set_private_channel(guild_id, member_id, channel_id)
+            for member_id, channel_id in guild_channels.items():
+                self.channels.setdefault(guild_id, {})[int(member_id)] = channel_id
+                self.owners[channel_id] = (guild_id, int(member_id))
+
+    @staticmethod
+    def is_private_channel(channel):
+        return isinstance(channel, discord.TextChannel) and "private" in channel.name
+
+    @staticmethod
+    def get_channel_owner(channel):
+        """
+        Finds the member a private channel belongs to from its permission overwrites.
+
+        :return: The member's ID, or None if the channel has no member overwrite.
+        """
+        bot_id = channel.guild.me.id if channel.guild.me else None
+        for target, overwrite in channel.overwrites.items():
+            if isinstance(target, discord.Role) or target.id == bot_id or getattr(target, "bot", False):
+                continue
+            if overwrite.read_messages:
+                return target.id
+        return None
+
+    def has_guild(self, guild):
+        return guild.id in self.channels
+
+    def build(self, guild):
+        """
+        Builds the registry for a guild from its channel list. This only scans the
+        channels the first time a guild is seen.
+        """
+        if self.has_guild(guild):
+            return
+        self.channels[guild.id] = {}
+        for channel in guild.text_channels:
+            if self.is_private_channel(channel):
+                member_id = self.get_channel_owner(channel)
+                if member_id is not None:
+                    self.register(guild.id, member_id, channel.id)
+
+    def register(self, guild_id, member_id, channel_id):
+        """
+        Records a member's private channel.
+        """
+        previous = self.channels.setdefault(guild_id, {}).get(member_id)
+        if previous == channel_id:
+            return
+        if previous is not None:
+            self.owners.pop(previous, None)
+        self.channels[guild_id][member_id] = channel_id
+        self.owners[channel_id] = (guild_id, member_id)
+        self.manager.set_private_channel(guild_id, member_id, channel_id)
+
+    def unregister_member(self, guild_id, member_id):
+        """
+        Forgets a member's private channel, e.g. when the member leaves.
+        """
+        channel_id = self.channels.get(guild_id, {}).pop(member_id, None)
+        if channel_id is not None:
+            self.owners.pop(channel_id, None)
+            self.manager.set_private_channel(guild_id, member_id, None)
+
+    def unregister_channel(self, channel_id):
+        """
+        Forgets a private channel, e.g. when it is deleted.
+        """
+        owner = self.owners.get(channel_id)
+        if owner:
+            self.unregister_member(*owner)
+
+    def update_channel(self, channel):
+        """
+        Re-evaluates a created or updated channel, registering or unregistering it
+        depending on its name and overwrites.
+        """
+        member_id = self.get_channel_owner(channel) if self.is_private_channel(channel) else None
+        owner = self.owners.get(channel.id)
+        if owner and owner[1] != member_id:
+            self.unregister_channel(channel.id)
+        if member_id is not None:
+            self.register(channel.guild.id, member_id, channel.id)
+
+    def get_channel(self, guild, member_id):
+        """
+        :return: The member's private channel, or None if they have none.
+        """
+        channel_id = self.channels.get(guild.id, {}).get(member_id)
+        return guild.get_channel(channel_id) if channel_id else None
+
+    def get_member(self, guild, member_id):
+        """
+        :return: The member, a MemberStub in lean mode if they have a private channel, or None.
+        """
+        member = guild.get_member(member_id)
+        if member is None and self.lean and member_id in self.channels.get(guild.id, {}):
+            member = MemberStub(guild, member_id)
+        return member
+
+    def get_targets(self, guild):
+        """
+        :return: A list of (channel, member) pairs for every member with a private channel.
+        """
+        targets = []
+        for member_id, channel_id in self.channels.get(guild.id, {}).items():
+            channel = guild.get_channel(channel_id)
+            member = self.get_member(guild, member_id)
+            if channel and member and not member.bot:
+                targets.append((channel, member))
+        return targets
@@ -0,0 +1,130 @@
+import asyncio
+import discord
+from outbound import BULK
+
+
+class PromptDelivery:
+    """
+    Sends a prompt to every private channel concurrently and records the delivered
+    messages in batches.
+
+    Before anything is sent the planned recipients are stored with the prompt, and
+    delivered message IDs are committed every checkpoint_every sends, so a delivery
+    interrupted by a crash or restart can be resumed for the members that were missed.
+    """
+
+    def __init__(self, manager, render, outbound, get_member=None, concurrency=10, checkpoint_every=25, history_limit=10):
+        """
+        :param manager: The AsyncPromptManager recording the delivery.
+        :param render: Callable (member, prompt_text) returning the message content for a member.
+        :param outbound: The OutboundDispatcher the prompts are sent through, at bulk priority.
+        :param get_member: Callable (guild, member_id) looking up a recipient; defaults to guild.get_member.
+        :param concurrency: Maximum number of sends in flight at once.
+        :param checkpoint_every: Number of delivered messages committed per batch.
+        :param history_limit: Recent messages searched per channel when resuming, to avoid double sends.
+        """
+        self.manager = manager
+        self.render = render
+        self.outbound = outbound
+        self.get_member = get_member or (lambda guild, member_id: guild.get_member(member_id))
+        self.concurrency = concurrency
+        self.checkpoint_every = checkpoint_every
+        self.history_limit = history_limit
+        self.active = set()  # IDs of prompts being delivered or resumed by this process
+
+    async def deliver(self, prompt_id, prompt_text, targets):
+        """
+        Plans and performs the delivery of a new prompt.
+
+        :param prompt_id: The ID of the in-progress prompt.
+        :param prompt_text: The text of the prompt.
+        :param targets: A list of (channel, member) pairs to deliver to.
+        :return: The number of messages delivered.
+        """
+        self.active.add(prompt_id)
+        try:
+            await self.manager.plan_delivery(prompt_id, {member.id: channel.id for channel, member in targets})
+            return await self._send_all(prompt_id, prompt_text, targets, check_history=False)
+        finally:
+            self.active.discard(prompt_id)
+
+    async def resume(self, guild, prompt_id):
+        """
+        Delivers an interrupted prompt to the planned recipients that have no recorded message.
+        A message that was sent but not yet recorded is found in the channel history and
+        recorded instead of being sent again. Prompts whose delivery is still running in
+        this process are skipped: their queued sends aren't in the channel history yet.
+
+        :param guild: The guild the prompt belongs to.
+        :param prompt_id: The ID of the in-progress prompt.
+        :return: The number of messages delivered or recovered.
+        """
+        if prompt_id in self.active:
+            return 0
+        self.active.add(prompt_id)
+        try:
+            prompt_round = self.manager.get_prompt(prompt_id)
+            targets = []
+            undelivered = await self.manager.get_undelivered(prompt_id)
+            for user_id, channel_id in undelivered.items():
+                channel = guild.get_channel(int(channel_id))
+                member = self.get_member(guild, user_id)
+                if channel and member:
+                    targets.append((channel, member))
+            if not targets:
+                return 0
+            return await self._send_all(prompt_id, prompt_round.prompt_text, targets, check_history=True)
+        finally:
+            self.active.discard(prompt_id)
+
+    async def deliver_late(self, prompt_id, channel, member):
+        """
+        Adds a member to a prompt that is already in progress and delivers it to them.
+
+        :param prompt_id: The ID of the in-progress prompt.
+        :param channel: The member's private channel.
+        :param member: The member joining the round.
+        :return: The number of messages delivered.
+        """
+        prompt_round = self.manager.get_prompt(prompt_id)
+        await self.manager.add_recipient(prompt_id, member.id, channel.id)
+        return await self._send_all(prompt_id, prompt_round.prompt_text, [(channel, member)], check_history=False)
+
+    async def _send_all(self, prompt_id, prompt_text, targets, check_history):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        delivered = []  # (message_id, user_id) pairs not yet committed
+        count = 0
+
+        async def send(channel, member):
+            async with semaphore:
+                if check_history:
+                    existing = await self._find_sent_message(channel, prompt_text)
+                    if existing:
+                        return existing, member
+                message = await self.outbound.send(channel, self.render(member, prompt_text), priority=BULK)
+                return message, member
+
+        tasks = [asyncio.ensure_future(send(channel, member)) for channel, member in targets]
+        try:
+            for task in asyncio.as_completed(tasks):
+                try:
+                    message, member = await task
+                except discord.HTTPException as e:
+                    print(f"Failed to deliver prompt {prompt_id}: {e}")
+                    continue
+                delivered.append((message.id, member.id))
+                count += 1
+                if len(delivered) >= self.checkpoint_every:
+                    await self.manager.add_message_ids(prompt_id, delivered)
+                    delivered = []
+        finally:
+            # Commit whatever was delivered, even if the delivery was interrupted
+            await self.manager.add_message_ids(prompt_id, delivered)
+        return count
+
+    async def _find_sent_message(self, channel, prompt_text):
+        bot_member = channel.guild.me
+        async for message in channel.history(limit=self.history_limit):
+            if message.author.id == bot_member.id and prompt_text in message.content:
+                return message
+        return None
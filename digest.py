@@ -0,0 +1,131 @@
+import asyncio
+import io
+import discord
+from outbound import NORMAL
+
+MESSAGE_LIMIT = 2000  # Discord's maximum message length
+
+
+def split_text(text, limit):
+    """
+    Splits text into pieces of at most limit characters, preferring to break at
+    newlines and then spaces.
+    """
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit)
+        if cut <= 0:
+            cut = limit
+        yield text[:cut]
+        text = text[cut:].lstrip()
+    if text:
+        yield text
+
+
+def render_sections(prompt_text, responses, resolve_name):
+    """
+    Yields the prompt header followed by one "**name**: response" section per responder.
+
+    :param prompt_text: The text of the prompt.
+    :param responses: A dictionary of user ID to response text.
+    :param resolve_name: Callable (user_id) returning the name to show for a responder.
+    """
+    yield f"**Prompt:** {prompt_text}"
+    for user_id, response in responses.items():
+        yield f"**{resolve_name(user_id)}**: {response}"
+
+
+def render_digest(sections, limit=MESSAGE_LIMIT):
+    """
+    Packs digest sections into chunks of at most limit characters, splitting
+    sections that are too long on their own. Chunks are produced one at a time,
+    so nothing beyond the current chunk is built until it is needed.
+    """
+    parts = []
+    length = 0
+    for section in sections:
+        for piece in split_text(section, limit):
+            # Sections are separated by a blank line within a chunk
+            added = len(piece) + (2 if parts else 0)
+            if parts and length + added > limit:
+                yield "\n\n".join(parts)
+                parts = []
+                length = 0
+                added = len(piece)
+            parts.append(piece)
+            length += added
+    if parts:
+        yield "\n\n".join(parts)
+
+
+class DigestPublisher:
+    """
+    Posts the digest of a completed prompt to the responses channel.
+
+    The first chunk goes to the channel; any further chunks are posted in order in
+    a thread started from it, each one rendered while the previous send is in
+    flight. Digests longer than max_chunks are attached as a text file instead.
+    """
+
+    def __init__(self, names, outbound, limit=MESSAGE_LIMIT, max_chunks=10):
+        """
+        :param names: The MemberNameCache used to resolve responder names.
+        :param outbound: The OutboundDispatcher the digest is posted through.
+        :param limit: Maximum length of a chunk.
+        :param max_chunks: Number of chunks above which the digest is sent as a file.
+        """
+        self.names = names
+        self.outbound = outbound
+        self.limit = limit
+        self.max_chunks = max_chunks
+
+    async def publish(self, channel, guild, prompt_round):
+        """
+        :param channel: The responses channel.
+        :param guild: The guild the prompt belongs to.
+        :param prompt_round: The in-progress Round, including its responses.
+        :return: The first message posted, which links to the digest.
+        """
+        chunks = render_digest(self._sections(guild, prompt_round), self.limit)
+
+        # Render only as far as needed to know whether the digest fits in max_chunks
+        rendered = []
+        for chunk in chunks:
+            rendered.append(chunk)
+            if len(rendered) > self.max_chunks:
+                return await self._publish_file(channel, guild, prompt_round)
+
+        first = await self.outbound.send(channel, rendered[0], priority=NORMAL)
+        if len(rendered) > 1:
+            thread = await self.outbound.submit(
+                channel.id, lambda: first.create_thread(name=self._thread_name(prompt_round)), NORMAL)
+            pending = None
+            for chunk in rendered[1:]:
+                if pending:
+                    await pending  # Keep the chunks in order
+                pending = asyncio.ensure_future(self.outbound.send(thread, chunk, priority=NORMAL))
+                await asyncio.sleep(0)  # Let the send start before preparing the next chunk
+            await pending
+        return first
+
+    async def _publish_file(self, channel, guild, prompt_round):
+        data = "\n\n".join(self._sections(guild, prompt_round)).encode("utf-8")
+        note = f"\n\n{len(prompt_round.responses)} responses are attached."
+        header = next(split_text(f"**Prompt:** {prompt_round.prompt_text}", self.limit - len(note)))
+        # The file is built for every attempt: a retried send would find the previous one already read
+        return await self.outbound.submit(channel.id, lambda: channel.send(
+            header + note,
+            file=discord.File(io.BytesIO(data), filename=f"responses-{prompt_round.prompt_id}.txt")
+        ), NORMAL)
+
+    def _sections(self, guild, prompt_round):
+        return render_sections(
+            prompt_round.prompt_text,
+            prompt_round.responses,
+            lambda user_id: self.names.get(guild, user_id)
+        )
+
+    @staticmethod
+    def _thread_name(prompt_round):
+        return f"Responses: {prompt_round.prompt_text}"[:100]
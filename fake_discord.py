@@ -0,0 +1,183 @@
+import asyncio
+import itertools
+import random
+import discord
+
+# In-process stand-ins for the discord.py objects the bot's handlers use, for running
+# the handlers without a Discord connection (see benchmark.py). Every API call goes
+# through FakeAPI, which counts it and waits out a simulated round trip.
+
+_snowflakes = itertools.count(1 << 42)
+
+
+def next_id():
+    return next(_snowflakes)
+
+
+class FakeAPI:
+    """
+    Counts the simulated API calls and waits latency seconds (plus up to jitter
+    seconds more) for each one.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = {}  # Call name -> count
+
+    async def call(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        else:
+            await asyncio.sleep(0)
+
+
+class FakeRole:
+    def __init__(self, guild, name="@everyone"):
+        self.id = guild.id
+        self.name = name
+        self.guild = guild
+
+
+class FakeMember:
+    def __init__(self, guild, name, bot=False):
+        self.id = next_id()
+        self.name = name
+        self.guild = guild
+        self.bot = bot
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+
+class FakeMessage:
+    def __init__(self, channel, author, content, reference=None):
+        self.id = next_id()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content or ""
+        self.reference = reference
+
+    async def edit(self, content=None, **kwargs):
+        await self.channel.guild.api.call("edit_message")
+        if content is not None:
+            self.content = content
+        return self
+
+    async def create_thread(self, name, **kwargs):
+        await self.channel.guild.api.call("create_thread")
+        return FakeThread(self.channel.guild, name)
+
+
+class FakeReference:
+    def __init__(self, message_id):
+        self.message_id = message_id
+
+
+class FakeThread:
+    def __init__(self, guild, name):
+        self.id = next_id()
+        self.guild = guild
+        self.name = name
+        self.messages = []
+
+    async def send(self, content=None, **kwargs):
+        await self.guild.api.call("send_message")
+        message = FakeMessage(self, self.guild.me, content)
+        self.messages.append(message)
+        return message
+
+
+class FakeTextChannel(discord.TextChannel):
+    """
+    A text channel that keeps its messages in memory. It subclasses
+    discord.TextChannel so isinstance checks in the bot still hold.
+    """
+
+    def __init__(self, guild, name, overwrites=None):
+        self.id = next_id()
+        self.name = name
+        self.guild = guild
+        self.messages = []
+        self._fake_overwrites = overwrites or {}
+
+    def __repr__(self):
+        return f"<FakeTextChannel name={self.name!r}>"
+
+    @property
+    def overwrites(self):
+        return self._fake_overwrites
+
+    async def send(self, content=None, **kwargs):
+        await self.guild.api.call("send_message")
+        message = FakeMessage(self, self.guild.me, content)
+        self.messages.append(message)
+        return message
+
+    async def history(self, limit=100, **kwargs):
+        await self.guild.api.call("channel_history")
+        for message in reversed(self.messages[-limit:] if limit else self.messages):
+            yield message
+
+
+class FakeGuild:
+    """
+    A guild with member_count members and no channels.
+    """
+
+    def __init__(self, member_count, api=None, name="Benchmark"):
+        self.id = next_id()
+        self.name = name
+        self.api = api or FakeAPI()
+        self.default_role = FakeRole(self)
+        self.me = FakeMember(self, "relationship-bot", bot=True)
+        self._members = {self.me.id: self.me}
+        self._channels = {}
+        for i in range(member_count):
+            self.add_member(f"member{i}")
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    @property
+    def text_channels(self):
+        return list(self._channels.values())
+
+    def add_member(self, name):
+        member = FakeMember(self, name)
+        self._members[member.id] = member
+        return member
+
+    def remove_member(self, member):
+        self._members.pop(member.id, None)
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+    async def create_text_channel(self, name, overwrites=None, **kwargs):
+        await self.api.call("create_channel")
+        channel = FakeTextChannel(self, name, overwrites)
+        self._channels[channel.id] = channel
+        return channel
+
+
+class FakeContext:
+    """
+    The parts of commands.Context the bot's commands use.
+    """
+
+    def __init__(self, guild, channel, author):
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
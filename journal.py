@@ -0,0 +1,131 @@
+import json
+import os
+from metrics import metrics
+
+
+class Journal:
+    """
+    Append-only operation log with periodically compacted snapshots.
+
+    State lives in memory; every change is appended to the journal as a single
+    JSON line, so the cost of a write is proportional to the change rather than
+    to the size of the state. Once enough entries have accumulated the full
+    state is written to a temporary file and atomically renamed over the
+    snapshot, after which the journal is truncated.
+
+    Entries must be idempotent when replayed in order (plain assignments and
+    removals, or an apply callable that skips what the state already holds), so
+    a crash between the snapshot rename and the journal truncation only replays
+    changes the snapshot already contains.
+    """
+
+    def __init__(self, snapshot_file, journal_file=None, compact_every=500, encode=None, decode=None):
+        """
+        :param snapshot_file: Path of the snapshot.
+        :param journal_file: Path of the append-only log (defaults to snapshot_file + ".journal").
+        :param compact_every: Number of journal entries after which the state is compacted.
+        :param encode: Function serializing the state to bytes for the snapshot (defaults to JSON).
+        :param decode: Function rebuilding the state from the snapshot's bytes (defaults to JSON).
+        """
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file or snapshot_file + ".journal"
+        self.compact_every = compact_every
+        # Compact JSON by default, so restarts parse as little as possible
+        self.encode = encode or (lambda state: json.dumps(state, separators=(",", ":")).encode("utf-8"))
+        self.decode = decode or json.loads
+        self.pending = 0  # Entries written since the last snapshot
+        self._handle = None
+
+    def load(self, apply, state=None):
+        """
+        Loads the snapshot and replays any journal entries on top of it.
+
+        :param apply: Callable (state, entry) applying a single journal entry to the state.
+        :param state: State to replay the journal on instead of the snapshot's, e.g. one
+                      migrated from an earlier snapshot format.
+        :return: The rebuilt state dictionary.
+        """
+        if state is None:
+            state = {}
+            if os.path.exists(self.snapshot_file):
+                with open(self.snapshot_file, "rb") as f:
+                    try:
+                        state = self.decode(f.read())
+                    except ValueError:  # Includes JSON and Unicode decoding errors
+                        raise ValueError(f"Failed to load snapshot {self.snapshot_file}.")
+
+        self.pending = 0
+        if os.path.exists(self.journal_file):
+            valid_end = 0  # Offset just past the last intact entry
+            torn = False
+            terminated = True  # Whether the last intact entry ends with a newline
+            with open(self.journal_file, "rb") as f:
+                for line in f:
+                    if line.strip():
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            torn = True  # A torn final write; everything before it is intact
+                            break
+                        apply(state, entry)
+                        self.pending += 1
+                    valid_end += len(line)
+                    terminated = line.endswith(b"\n")
+            if torn or not terminated:
+                # Cut off the torn write and end the file on a newline, so new entries
+                # start on a line of their own instead of being appended to a broken one
+                with open(self.journal_file, "r+b") as f:
+                    f.truncate(valid_end)
+                    if not terminated:
+                        f.seek(valid_end)
+                        f.write(b"\n")
+        return state
+
+    def append(self, entry):
+        """
+        Appends a single entry to the journal.
+
+        :param entry: A JSON-serializable dictionary describing the change.
+        :return: True if the journal has grown enough to be compacted.
+        """
+        if self._handle is None:
+            self._handle = open(self.journal_file, "a")
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        self._handle.write(line)
+        self._handle.flush()
+        metrics.inc("storage_writes_total", kind="journal")
+        metrics.inc("storage_written_bytes_total", len(line), kind="journal")
+        self.pending += 1
+        return self.pending >= self.compact_every
+
+    def compact(self, state):
+        """
+        Writes the full state to the snapshot via atomic rename and truncates the journal.
+
+        :param state: The current state dictionary.
+        """
+        tmp_file = self.snapshot_file + ".tmp"
+        data = self.encode(state)
+        with open(tmp_file, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.snapshot_file)
+        metrics.inc("storage_writes_total", kind="snapshot")
+        metrics.inc("storage_written_bytes_total", len(data), kind="snapshot")
+
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+        open(self.journal_file, "w").close()
+        self.pending = 0
+
+    def close(self, state=None):
+        """
+        Closes the journal, compacting first if a state is given and there are pending entries.
+        """
+        if state is not None and self.pending:
+            self.compact(state)
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
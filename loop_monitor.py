@@ -0,0 +1,49 @@
+import asyncio
+
+
+class LoopLagMonitor:
+    """
+    Reports when the event loop is blocked.
+
+    A background task sleeps for a short interval and measures how late it wakes
+    up; anything that keeps the loop busy (a synchronous file write in a handler,
+    for example) shows up as lag. Lag above the threshold is reported.
+    """
+
+    def __init__(self, threshold=0.25, interval=0.5, report=None):
+        """
+        :param threshold: Lag in seconds above which a report is made.
+        :param interval: Seconds between checks.
+        :param report: Callable (lag) called when the threshold is exceeded; prints by default.
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.report = report or self.print_lag
+        self.max_lag = 0.0
+        self.task = None
+
+    @staticmethod
+    def print_lag(lag):
+        print(f"[DEBUG] Event loop was blocked for {lag:.3f}s")
+
+    def start(self):
+        """
+        Starts monitoring on the running loop. Calling it again while running does nothing.
+        """
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - expected
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                self.report(lag)
@@ -1,15 +1,33 @@
 # Import necessary modules
 import discord
-from discord.ext import commands
+import csv
 import os
+import re
+import time
+import typing
+from discord.ext import commands
 from config import BOT_TOKEN
+import config
 import prompt_manager
-import json
 from NotificationPreferenceView import NotificationPreferenceView
 from PromptFileSelectView import PromptFileSelectView
+from delivery import PromptDelivery
+from channel_registry import PrivateChannelRegistry
+from provisioning import GuildProvisioner
+from sharding import create_bot
+from member_names import MemberNameCache
+from digest import DigestPublisher, render_digest, MESSAGE_LIMIT
+from async_manager import AsyncPromptManager
+from loop_monitor import LoopLagMonitor
+from metrics import metrics, instrument_http, format_stats, format_bytes, format_duration, MetricsExporter
+from scheduler import RoundScheduler, parse_interval, format_interval
+from reminders import ReminderEngine
+from outbound import OutboundDispatcher, NORMAL, BULK
+from prompt_import import IMPORT_FORMATS, read_prompts, format_import_summary
+from analytics import format_round_stats
 
 # Debug levels: 0 = Silent, 1 = Errors only, 2 = Info, 3 = Verbose
-DEBUG_LEVEL = 3
+DEBUG_LEVEL = getattr(config, "DEBUG_LEVEL", 3)
 
 # Function to log debug messages
 async def log_debug(guild, message, level=1):
@@ -23,37 +41,107 @@ intents.guilds = True
 intents.members = True
 intents.message_content = True  # Enable message content intent to listen for commands in any channel
 
-bot = commands.Bot(command_prefix="!", intents=intents)
-manager = prompt_manager.PromptManager()  # Initialize the prompt manager
+# Storage backend for bot state: "json" (default) or "sqlite"
+STORAGE_BACKEND = getattr(config, "STORAGE_BACKEND", "json")
+# Prompt selection: "uniform" over all prompts (default), "file" to pick a file first, or {file name: weight}
+PROMPT_SAMPLING = getattr(config, "PROMPT_SAMPLING", "uniform")
+# Prompts at least this similar (0-1, share of the shorter prompt's word pairs found in the other) are flagged as near-duplicates
+SIMILARITY_THRESHOLD = getattr(config, "SIMILARITY_THRESHOLD", 0.4)
+# Sharding: set SHARD_COUNT to shard the connection, and SHARD_IDS to run only some shards in this process
+# (not supported yet: the bot refuses to start with SHARD_IDS, see PromptManager)
+SHARD_COUNT = getattr(config, "SHARD_COUNT", None)
+SHARD_IDS = getattr(config, "SHARD_IDS", None)
+# Report handlers that block the event loop for longer than this many seconds
+LOOP_LAG_THRESHOLD = getattr(config, "LOOP_LAG_THRESHOLD", 0.25)
+# Metrics in the Prometheus text format: served on http://127.0.0.1:METRICS_PORT and/or written to METRICS_FILE
+METRICS_PORT = getattr(config, "METRICS_PORT", None)
+METRICS_FILE = getattr(config, "METRICS_FILE", None)
+METRICS_INTERVAL = getattr(config, "METRICS_INTERVAL", 60)  # Seconds between writes of METRICS_FILE
+# Scheduled rounds are started at least SCHEDULE_STAGGER seconds apart, each up to SCHEDULE_JITTER seconds late
+SCHEDULE_STAGGER = getattr(config, "SCHEDULE_STAGGER", 2)
+SCHEDULE_JITTER = getattr(config, "SCHEDULE_JITTER", 300)
+# Members who have not responded are reminded REMINDER_DELAY seconds after the prompt was sent, up to
+# REMINDER_COUNT times (REMINDER_DELAY apart); reminders due within REMINDER_BATCH_WINDOW seconds are sent together
+REMINDER_DELAY = getattr(config, "REMINDER_DELAY", 2 * 24 * 3600)
+REMINDER_COUNT = getattr(config, "REMINDER_COUNT", 1)
+REMINDER_BATCH_WINDOW = getattr(config, "REMINDER_BATCH_WINDOW", 60)
+# Outgoing messages are paced to OUTBOUND_RATE per second overall and OUTBOUND_CHANNEL_RATE per second
+# per channel (bursts of 5), below Discord's limits; None turns a limit off
+OUTBOUND_RATE = getattr(config, "OUTBOUND_RATE", 40)
+OUTBOUND_CHANNEL_RATE = getattr(config, "OUTBOUND_CHANNEL_RATE", 1)
+# Lean member caching for guilds with very many members: members are neither chunked at startup nor
+# cached by discord.py; the bot only keeps the IDs of members with a private channel, and looks names up when needed
+LEAN_MEMBER_CACHE = getattr(config, "LEAN_MEMBER_CACHE", False)
+# Largest prompt file accepted for import in add-prompts, in bytes
+IMPORT_MAX_BYTES = getattr(config, "IMPORT_MAX_BYTES", 5 * 1024 * 1024)
+
+startup_start = time.perf_counter()  # Cold start is measured from here until the first on_ready
+cold_start = None
+deliveries_resumed = False  # Interrupted deliveries are resumed on the first on_ready only
+member_cache_options = (
+    {"member_cache_flags": discord.MemberCacheFlags.none(), "chunk_guilds_at_startup": False}
+    if LEAN_MEMBER_CACHE else {}
+)
+bot, owns_guild = create_bot("!", intents, SHARD_COUNT, SHARD_IDS, **member_cache_options)
+instrument_http(metrics, bot.http)  # Count and time every Discord API call
+# Initialize the prompt manager; it only loads the state of the guilds this process handles.
+# Handlers use it through an async facade that keeps storage I/O off the event loop.
+manager = AsyncPromptManager(
+    prompt_manager.PromptManager(STORAGE_BACKEND, sampling=PROMPT_SAMPLING, owns_guild=owns_guild,
+                                 similarity_threshold=SIMILARITY_THRESHOLD)
+)
+registry = PrivateChannelRegistry(manager, LEAN_MEMBER_CACHE)  # Member <-> private channel lookups
+outbound = OutboundDispatcher(OUTBOUND_RATE, channel_rate=OUTBOUND_CHANNEL_RATE)  # Every message the bot sends goes through it
+metrics.set("startup_seconds", time.perf_counter() - startup_start, phase="load_state")
+member_names = MemberNameCache()  # Responder names for the response digests
+lag_monitor = LoopLagMonitor(LOOP_LAG_THRESHOLD)
+exporter = MetricsExporter(metrics, METRICS_PORT, METRICS_FILE, METRICS_INTERVAL)
 
 PROMPT_FILES_DIR = "prompts"
-NOTIFY_FILE = "notifications.json"
 
 # Ensure the prompts directory exists
 if not os.path.exists(PROMPT_FILES_DIR):
     os.makedirs(PROMPT_FILES_DIR)
 
-# Load notify.json data with validation
-def load_notify_data():
-    if os.path.exists(NOTIFY_FILE):
-        try:
-            with open(NOTIFY_FILE, "r") as f:
-                data = json.load(f)
-                return data
-        except (json.JSONDecodeError, KeyError):
-            pass
-
-notify_data = load_notify_data()
-
-def save_notify_data():
-    with open(NOTIFY_FILE, "w") as f:
-        json.dump(notify_data, f)
+@bot.event
+async def setup_hook():
+    # Runs once before connecting: make the buttons of messages sent before a restart
+    # respond again, and load what handlers would otherwise read on first use
+    start = time.perf_counter()
+    bot.add_view(notification_view)
+    PromptFileSelectView.register(bot, manager)
+    guild_count = await manager.warm_up()
+    metrics.set("startup_seconds", time.perf_counter() - start, phase="warm_up")
+    await log_debug(None, f"Warmed up the state of {guild_count} guilds in {time.perf_counter() - start:.2f}s.", level=2)
 
 @bot.event
 async def on_ready():
+    global cold_start, deliveries_resumed
     print(f"Logged in as {bot.user}")
+    lag_monitor.start()
+    await exporter.start()
+    await scheduler.start()  # Loads the stored schedules on the first connection
     for guild in bot.guilds:
         print(f"Initializing guild: {guild.name}")
+        registry.build(guild)  # Only scans the channel list for guilds not in the registry yet
+
+    # Resume prompt deliveries that were interrupted by a restart. on_ready is dispatched again after
+    # reconnects, while deliveries started since are still being sent, so this only runs once.
+    if not deliveries_resumed:
+        deliveries_resumed = True
+        for prompt_id, prompt_round in list(manager.inprogress_prompts.items()):
+            guild = bot.get_guild(prompt_round.guild_id) if prompt_round.guild_id else None
+            if guild and await manager.get_undelivered(prompt_id):
+                resumed = await delivery.resume(guild, prompt_id)
+                reminders.track(prompt_id)
+                await log_debug(guild, f"Resumed delivery of prompt {prompt_id} to {resumed} members.", level=2)
+    if REMINDER_COUNT:
+        reminders.start()  # Schedules the reminders of every open round on the first connection
+
+    if cold_start is None:  # on_ready is dispatched again after reconnects
+        cold_start = time.perf_counter() - startup_start
+        metrics.set("startup_seconds", cold_start, phase="ready")
+        await log_debug(None, f"Cold start took {cold_start:.2f}s.", level=2)
 
 @bot.command()
 async def info(ctx):
@@ -63,97 +151,152 @@ async def info(ctx):
         "!info - Show this info message\n"
         "!init - Configure the server with private channels for each user\n"
         "!prompt - Send a prompt to all users and create a thread in the responses channel\n"
+        "!schedule [weekly|daily|<n>d|<n>h|off] - Show or set how often prompts are sent automatically\n"
         "!notify - Toggle notifications for prompt responses\n"
+        "!history [page] [prompt file|YYYY-MM-DD] - List the prompts that have been used\n"
+        "!duplicates - List near-duplicate prompts in the prompt library (administrators only)\n"
+        "!stats - Show response rates, response times and response lengths of past rounds (administrators only)\n"
+        "!stats bot - Show the bot's performance statistics (administrators only)\n"
     )
-    await ctx.send(info_message)
+    await outbound.send(ctx.channel, info_message)
 
 @bot.command()
+@metrics.timed("handler_latency_seconds", handler="init")
 async def init(ctx):
     guild = ctx.guild
     if not guild:
-        await ctx.send("This command can only be used in a server.")
+        await outbound.send(ctx.channel, "This command can only be used in a server.")
         return
 
-    # Ensure necessary channels exist
-    channel_names = ["general", "responses", "add-prompts", "bot-messages"]
-    for channel_name in channel_names:
-        if not discord.utils.get(guild.text_channels, name=channel_name):
-            await guild.create_text_channel(channel_name)
-
-    # Create private channels for each member
-    private_channels = getPrivateChannels(guild)  # Get existing private channels to avoid duplicates
-    for member in guild.members:
-        if not member.bot:
-            for existing_channel, members in private_channels.items():
-                # Check if the member already has a private channel
-                if member in members:
-                    break
-            else:  # This else corresponds to the for loop, it executes if the loop is not broken
-                # Create a new private channel for the member if it doesn't exist
-                private_channel_name = f"{member.name.replace('.', '')}-private"
-                overwrites = {
-                    guild.default_role: discord.PermissionOverwrite(read_messages=False),
-                    member: discord.PermissionOverwrite(read_messages=True),
-                    bot.user: discord.PermissionOverwrite(read_messages=True),
-                }
-                await guild.create_text_channel(private_channel_name, overwrites=overwrites)
-                for channel in getPrivateChannels(guild).keys():
-                    if private_channel_name in channel.name:
-                        # send the prompt to query the member if they would like notifications in their private channel
-                        view = NotificationPreferenceView(member.id, handle_notification_preference)
-                        await channel.send(
-                            "Welcome to your private channel! Would you like to receive notifications for prompt responses?",
-                            view=view
-                        )
-    print("Server initialization completed.")
+    # Create the missing shared and private channels concurrently, reporting progress as we go
+    status = await outbound.send(ctx.channel, "Initializing server...")
+    last_update = [0.0]
+
+    async def report_progress(done, total):
+        # Edit the status message at most every couple of seconds to stay clear of rate limits
+        now = time.monotonic()
+        if done == total or now - last_update[0] >= 2:
+            last_update[0] = now
+            await outbound.edit(status, content=f"Initializing server... {done}/{total} channels created.")
+
+    created, failed = await provisioner.provision(guild, report_progress)
+    summary = f"Server initialization completed: {created} channels created"
+    if failed:
+        summary += f", {failed} failed (run !init again to retry)"
+    await outbound.edit(status, content=summary + ".")
+    await log_debug(guild, "Server initialization completed.", level=2)
+
+async def send_welcome_message(channel, member):
+    # send the prompt to query the member if they would like notifications in their private channel
+    await outbound.send(
+        channel,
+        "Welcome to your private channel! Would you like to receive notifications for prompt responses?",
+        priority=NORMAL,
+        view=notification_view
+    )
 
 async def send_new_prompt(ctx):
-    prompt_text,prompt_id = manager.get_random_prompt()
-    if not prompt_text:
-        await ctx.send("No prompts available.")
-        return
     guild = ctx.guild
     if not guild:
-        await ctx.send("This command can only be used in a server.")
+        await outbound.send(ctx.channel, "This command can only be used in a server.")
         return
-    private_channels = getPrivateChannels(guild)
-    message_ids = {}
-    for channel, members in private_channels.items():
-        for member in members:
-            if member.bot: continue
-            if notify_data[str(member.id)] == True:
-                mention_text = f"Hello {member.mention},\n"
-            else:
-                mention_text = ""
+    if not await start_round(guild):
+        await outbound.send(ctx.channel, "No prompts available.")
 
-            message = await channel.send(
-                f"{mention_text}"
-                f"This week's prompt is:\n\n"
-                f"**{prompt_text}**\n\n"
-                f"Please reply directly to this message with your response."
-            )
-            message_ids[message.id] = {member.name}
-            manager.add_message_id(prompt_id,message.id,member.id)
-    pass
+async def start_round(guild):
+    # Start a round in the guild; returns False if there are no prompts left
+    prompt_text,prompt_id = await manager.get_random_prompt(guild.id)
+    if not prompt_text:
+        return False
+    metrics.inc("rounds_started_total")
+    registry.build(guild)
+    targets = registry.get_targets(guild)
+    await manager.get_notifications(guild.id)  # Load the guild's preferences before rendering the messages
+
+    # Deliver concurrently; the delivery records progress so it can be resumed after a restart
+    start = time.perf_counter()
+    delivered = await delivery.deliver(prompt_id, prompt_text, targets)
+    metrics.observe("round_delivery_seconds", time.perf_counter() - start)
+    metrics.inc("prompts_delivered_total", delivered)
+    reminders.track(prompt_id)
+    return True
+
+async def run_scheduled_round(guild_id):
+    # Called by the scheduler when a guild's next round is due
+    guild = bot.get_guild(guild_id)
+    if not guild:
+        return  # The bot is no longer in the guild, or another process handles it
+    metrics.inc("scheduled_rounds_total")
+    if not await start_round(guild):
+        bot_channel = discord.utils.get(guild.text_channels, name="bot-messages")
+        if bot_channel:
+            await outbound.send(bot_channel, "A scheduled prompt could not be sent because no prompts are available.",
+                                priority=NORMAL)
+        await log_debug(guild, "Scheduled round skipped: no prompts available.", level=1)
+
+async def send_reminder(prompt_id, user_id, message_id):
+    # Called by the reminder engine; replies to the member's prompt message in their private channel
+    prompt_round = manager.inprogress_prompts.get(prompt_id)
+    guild = bot.get_guild(prompt_round.guild_id) if prompt_round and prompt_round.guild_id else None
+    if not guild:
+        return False  # Another process handles the guild
+    member = registry.get_member(guild, user_id)
+    channel_id = (prompt_round.recipients or {}).get(user_id)
+    channel = guild.get_channel(channel_id) if channel_id else registry.get_channel(guild, user_id)
+    if not member or not channel:
+        return False
+
+    # Members who turned notifications off get a silent reminder without a mention
+    await manager.get_notifications(guild.id)
+    notify = manager.get_notification(guild.id, member.id)
+    greeting = f"Hello {member.mention}, " if notify else ""
+    prompt_message = channel.get_partial_message(message_id)
+    await outbound.send(
+        channel,
+        f"{greeting}just a reminder that this prompt is still waiting for your response. "
+        f"Reply directly to the prompt message to respond.",
+        priority=BULK,
+        reference=prompt_message.to_reference(fail_if_not_exists=False),
+        silent=not notify
+    )
+    metrics.inc("reminders_sent_total")
+    return True
 
-async def send_responses(ctx, prompt_data):
-    # Create a thread in the responses channel
-    responses_channel = discord.utils.get(ctx.guild.text_channels, name="responses")
-    if responses_channel:
-        send_message = f"**Prompt:** {prompt_data['prompt_text']}"
-        for user_id, response in prompt_data['responses'].items():  # Use .items() to iterate over key-value pairs
-            member = ctx.guild.get_member(int(user_id))  # Resolve user_id to a member object
-            username = member.name if member else f"User {user_id}"  # Fallback to user_id if member not found
-            print("Responses pile:", username, response)
-            send_message += f"\n\n**{username}**: {response}"  # Use the resolved username
+def render_prompt_message(member, prompt_text):
+    if manager.get_notification(member.guild.id, member.id):
+        mention_text = f"Hello {member.mention},\n"
+    else:
+        mention_text = ""
+
+    return (
+        f"{mention_text}"
+        f"This week's prompt is:\n\n"
+        f"**{prompt_text}**\n\n"
+        f"Please reply directly to this message with your response."
+    )
 
-        message = await responses_channel.send(send_message)
-        comment_link = message.id  # Capture the message ID
+@bot.command(name="prompt")
+@metrics.timed("handler_latency_seconds", handler="prompt")
+async def prompt_command(ctx):
+    await send_new_prompt(ctx)
 
-        manager.move_prompt_to_used(prompt_data['prompt_id'], comment_link)
-    print(f"Prompt ID {prompt_data['prompt_id']} has been completed and all responses have been processed.")
+@metrics.timed("handler_latency_seconds", handler="send_responses")
+async def send_responses(guild, prompt_round):
+    # Post the responses to the responses channel, split over several messages if needed
+    responses_channel = discord.utils.get(guild.text_channels, name="responses")
+    if responses_channel:
+        await member_names.resolve(guild, prompt_round.responses)  # Names missing from the caches, in one lookup
+        message = await digest.publish(responses_channel, guild, prompt_round)
+        comment_link = message.id  # Capture the ID of the first message
+
+        await manager.move_prompt_to_used(prompt_round.prompt_id, comment_link)
+    metrics.inc("rounds_completed_total")
+    if prompt_round.started:
+        metrics.observe("round_duration_seconds", time.time() - prompt_round.started)
+    await log_debug(guild, f"Prompt ID {prompt_round.prompt_id} has been completed and all responses have been processed.", level=2)
 
 @bot.event
+@metrics.timed("handler_latency_seconds", handler="on_message")
 async def on_message(ctx):
     if ctx.author.bot:
         return
@@ -161,106 +304,263 @@ async def on_message(ctx):
     if not guild:
         return
 
-    # Check if the message is a reply to a prompt
-    elif ctx.reference and ctx.reference.message_id:
-        prompt_id, prompt_data = manager.get_prompt_by_message_id(str(ctx.reference.message_id))
-        if prompt_id is None:
-            raise ValueError("Prompt ID not found for the given message ID.")
-        if prompt_id and str(ctx.author.id) not in prompt_data["responses"]:
-            # Record the response
-            manager.add_response(prompt_id, str(ctx.author.id), ctx.content)
-            await ctx.channel.send("Thank you for your response!")
-
-            # Check if all users have responded
-            completed = manager.all_responses_collected(prompt_id, guild.members)
+    # Check if the message is a reply to a prompt; replies to other messages are skipped via the index
+    elif ctx.reference and ctx.reference.message_id and manager.is_prompt_message(ctx.reference.message_id):
+        prompt_id, prompt_round = manager.get_prompt_by_message_id(ctx.reference.message_id)
+        if prompt_id and ctx.author.id not in prompt_round.responses:
+            # Record the response; completion is reported once, when the last expected member responds
+            completed = await manager.add_response(prompt_id, ctx.author.id, ctx.content)
+            member_names.set(ctx.author)  # Keeps the responder's name current for the digest
+            metrics.inc("round_responses_total")
+            delivered_at = manager.get_delivery_time(ctx.reference.message_id)
+            if delivered_at is not None:
+                metrics.observe("round_response_seconds", time.time() - delivered_at)
+            # Acks still queued in the channel are merged into one
+            await outbound.send(ctx.channel, "Thank you for your response!", coalesce=("ack", ctx.channel.id))
+
             if completed:
-                await send_responses(ctx, prompt_data)
+                await send_responses(guild, prompt_round)
 
     # Handle messages in the "add-prompts" channel
     elif ctx.channel.name == "add-prompts" and not ctx.author.bot:
         prompt_text = ctx.content.strip()
 
+        # Import attached prompt files, into the prompt file named in the message if there is one
+        if ctx.attachments:
+            await import_prompt_files(ctx, prompt_text if prompt_text.endswith(".json") else None)
         # Check if the input is a new file name
-        if prompt_text.endswith(".json"):
-            if manager.create_prompt_file(prompt_text):
+        elif prompt_text.endswith(".json"):
+            prompt_text = os.path.basename(prompt_text)
+            if await manager.create_prompt_file(prompt_text):
                 # Save the second-to-last message (prompt text) to the new file
-                messages = await ctx.channel.history(limit=2).to_list()
+                messages = [message async for message in ctx.channel.history(limit=2)]
                 previous_message = messages[1]  # Get the second-to-last message
-                manager.add_prompt_to_file(prompt_text, previous_message.content.strip())
-                await ctx.channel.send(f"New prompt file '{prompt_text}' created and prompt added.")
+                if await manager.write_prompt(prompt_text, previous_message.content.strip()):
+                    await outbound.send(ctx.channel, f"New prompt file '{prompt_text}' created and prompt added.")
+                else:
+                    await outbound.send(ctx.channel, f"New prompt file '{prompt_text}' created; the prompt is already in the library.")
             else:
-                await ctx.channel.send(f"File '{prompt_text}' already exists. Prompt not added.")
+                await outbound.send(ctx.channel, f"File '{prompt_text}' already exists. Prompt not added.")
         else:
-            # Provide buttons for existing files
-            view = PromptFileSelectView(prompt_text)
-            await ctx.channel.send(
+            # Provide buttons for existing files, replying to the prompt so the buttons can read it back
+            view = await PromptFileSelectView.create(manager)
+            await outbound.reply(
+                ctx,
                 f"Select a file to add the prompt '{prompt_text}' or create a new file by typing its name.",
                 view=view
             )
 
     await bot.process_commands(ctx)
 
+@metrics.timed("handler_latency_seconds", handler="import_prompts")
+async def import_prompt_files(message, target=None):
+    # Each attachment's prompts are parsed and written on the storage worker, one write per file
+    reports = []
+    for attachment in message.attachments:
+        if os.path.splitext(attachment.filename)[1].lower() not in IMPORT_FORMATS:
+            reports.append(f"`{attachment.filename}`: unsupported file type; use one of {', '.join(IMPORT_FORMATS)}.")
+            continue
+        if attachment.size > IMPORT_MAX_BYTES:
+            reports.append(f"`{attachment.filename}`: larger than {format_bytes(IMPORT_MAX_BYTES)}.")
+            continue
+        file_name = os.path.basename(target) if target else os.path.splitext(attachment.filename)[0] + ".json"
+        try:
+            data = await attachment.read()
+            summary = await manager.import_prompts(file_name, read_prompts(attachment.filename, data))
+        except (ValueError, csv.Error) as e:
+            reports.append(f"`{attachment.filename}`: could not be read ({e}).")
+            continue
+        reports.append(format_import_summary(attachment.filename, file_name, summary))
+        await log_debug(message.guild, f"Imported {summary['added']} prompts from {attachment.filename} into {file_name}.", level=2)
+    # One report per attachment; many attachments don't fit in one message
+    for chunk in render_digest(reports, MESSAGE_LIMIT):
+        await outbound.send(message.channel, chunk)
+
 @bot.event
+@metrics.timed("handler_latency_seconds", handler="on_member_join")
 async def on_member_join(member):
     guild = member.guild
     if not guild:
         return
 
-    private_channel_name = f"{member.name.replace('.', '')}-private"
-    overwrites = {
-        guild.default_role: discord.PermissionOverwrite(read_messages=False),
-        member: discord.PermissionOverwrite(read_messages=True),
-        bot.user: discord.PermissionOverwrite(read_messages=True),
-    }
-    private_channel = await guild.create_text_channel(private_channel_name, overwrites=overwrites)
+    member_names.set(member)
+    private_channel = await provisioner.create_private_channel(guild, member)
 
     # Notify the general channel if it exists
     general_channel = discord.utils.get(guild.text_channels, name="general")
     if general_channel:
-        await general_channel.send(f"Welcome {member.mention}! A private channel has been created for you.")
-
-    view = NotificationPreferenceView(member.id)
-    await private_channel.send(
-        "Welcome to your private channel! Would you like to receive notifications for prompt responses?",
-        view=view
-    )
+        await outbound.send(general_channel, f"Welcome {member.mention}! A private channel has been created for you.",
+                            priority=NORMAL)
 
     await log_debug(guild, f"Private channel created for new member {member.name}.", level=2)
 
-def toggle_notify_preference(user_id):
+    # Send any prompts already in progress so the new member can take part in the round
+    await manager.get_notifications(guild.id)  # Load the guild's preferences before rendering the messages
+    for prompt_id in await manager.get_open_prompts(guild.id):
+        await delivery.deliver_late(prompt_id, private_channel, member)
+        reminders.track(prompt_id)
+
+@bot.event
+@metrics.timed("handler_latency_seconds", handler="on_member_remove")
+async def on_raw_member_remove(payload):
+    # The raw event also fires for members that are not in the member cache (lean mode)
+    guild = bot.get_guild(payload.guild_id)
+    if not guild:
+        return
+    member_id = payload.user.id
+    registry.unregister_member(guild.id, member_id)
+    member_names.forget(guild.id, member_id)
+
+    # Stop waiting on the member; finish any round that was only waiting on them
+    for prompt_id in await manager.get_open_prompts(guild.id):
+        if await manager.remove_recipient(prompt_id, member_id):
+            await send_responses(guild, manager.get_prompt(prompt_id))
+
+@bot.event
+async def on_member_update(before, after):
+    if before.name != after.name:
+        member_names.set(after)
+
+@bot.event
+async def on_guild_channel_create(channel):
+    registry.update_channel(channel)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    registry.update_channel(after)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    registry.unregister_channel(channel.id)
+
+async def toggle_notify_preference(guild_id, user_id):
+    # Notification preferences are kept per guild and cached by the prompt manager
+    notify_data = await manager.get_notifications(guild_id)
     if user_id not in notify_data:
-        notify_data[user_id] = True
+        enabled = True
     else:
-        notify_data[user_id] = not notify_data[user_id]
-    save_notify_data()
-    return notify_data[user_id]
+        enabled = not notify_data[user_id]
+    await manager.set_notification(guild_id, user_id, enabled)
+    return enabled
 
 @bot.command()
+@metrics.timed("handler_latency_seconds", handler="notify")
 async def notify(ctx):
     # Toggle notification preferences for the user
-    await ctx.send(f"Notifications have been {'enabled' if toggle_notify_preference(str(ctx.author.id)) else 'disabled'} for you.")
-    save_notify_data()
-
-def getPrivateChannels(guild):
-    # Helper function to get all private channels in a guild
-    private_channels = {}
-    for channel in guild.text_channels:
-        if "private" in channel.name:
-            members = []
-            for member in channel.members:  # Iterate over members in the private channel
-                if member.bot:
-                    continue
-                members.append(member)  # Add non-bot members to the list
-            #create the channel and list of members as a key-value pair in the dictionary
-            private_channels[channel] = members
-                
-    return private_channels  # Return both private channels and members for further use
-
-async def handle_notification_preference(member_id, preference):
-    # Update the notification preference in the notify_data dictionary
-    notify_data[str(member_id)] = preference
-    save_notify_data()
-    print(f"Notification preference for member {member_id} set to {preference}")
-
-# Replace 'YOUR_BOT_TOKEN' with the imported BOT_TOKEN
-bot.run(BOT_TOKEN)
+    guild_id = ctx.guild.id if ctx.guild else None
+    await outbound.send(ctx.channel, f"Notifications have been {'enabled' if await toggle_notify_preference(guild_id, str(ctx.author.id)) else 'disabled'} for you.")
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def schedule(ctx, cadence=None):
+    # Show, set or turn off the guild's automatic prompt schedule
+    guild = ctx.guild
+    if not guild:
+        await outbound.send(ctx.channel, "This command can only be used in a server.")
+        return
+    if cadence is None:
+        current = scheduler.get_schedule(guild.id)
+        if current:
+            await outbound.send(ctx.channel, f"Prompts are sent {format_interval(current['interval'])}; the next one is due <t:{int(current['next_run'])}:R>.")
+        else:
+            await outbound.send(ctx.channel, "No prompt schedule is set. Use `!schedule weekly` to send prompts automatically.")
+        return
+    if cadence.lower() == "off":
+        cancelled = await scheduler.cancel(guild.id)
+        await outbound.send(ctx.channel, "Automatic prompts have been turned off." if cancelled else "No prompt schedule is set.")
+        return
+    interval = parse_interval(cadence)
+    if interval is None:
+        await outbound.send(ctx.channel, "Unknown schedule. Use weekly, daily, biweekly or an interval such as `3d` or `12h`.")
+        return
+    new_schedule = await scheduler.set_schedule(guild.id, interval)
+    await outbound.send(ctx.channel, f"Prompts will be sent {format_interval(interval)}, starting <t:{int(new_schedule['next_run'])}:R>.")
+
+@bot.command()
+@metrics.timed("handler_latency_seconds", handler="history")
+async def history(ctx, page: typing.Optional[int] = 1, *, query=None):
+    # Page through the guild's used prompts, optionally only those from one prompt file or date
+    guild = ctx.guild
+    if not guild:
+        await outbound.send(ctx.channel, "This command can only be used in a server.")
+        return
+    selected_file = date = None
+    if query:
+        query = query.strip()
+        if re.fullmatch(r"\d{4}-\d{2}-\d{2}", query):
+            date = query
+        else:
+            selected_file = query if query.endswith(".json") else query + ".json"
+    records, page, page_count = await manager.get_used_prompts_page(guild.id, page - 1, 10, selected_file, date)
+    if not records:
+        await outbound.send(ctx.channel, "No used prompts found.")
+        return
+
+    responses_channel = discord.utils.get(guild.text_channels, name="responses")
+    lines = [f"**Used prompts** (page {page + 1}/{page_count})"]
+    for prompt_id, prompt_data in records:
+        prompt_text = prompt_data["prompt_text"]
+        if len(prompt_text) > 100:
+            prompt_text = prompt_text[:97] + "..."
+        line = f"- {prompt_text} ({os.path.splitext(prompt_data['selected_file'])[0]}, {(prompt_data.get('timestamp') or '')[:10]})"
+        if responses_channel and prompt_data.get("comment_link"):
+            line += f" <https://discord.com/channels/{guild.id}/{responses_channel.id}/{prompt_data['comment_link']}>"
+        lines.append(line)
+    if page + 1 < page_count:
+        lines.append(f"Use `!history {page + 2}{' ' + query if query else ''}` for older prompts.")
+    await outbound.send(ctx.channel, "\n".join(lines))
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+@metrics.timed("handler_latency_seconds", handler="duplicates")
+async def duplicates(ctx, limit: int = 10):
+    # Scan the whole prompt library for near-duplicate pairs
+    pairs = await manager.find_duplicate_prompts()
+    if not pairs:
+        await outbound.send(ctx.channel, "No near-duplicate prompts found.")
+        return
+    lines = [f"**Near-duplicate prompts** ({len(pairs)} pairs, showing {min(limit, len(pairs))})"]
+    for similarity, (first_file, first_text), (second_file, second_text) in pairs[:limit]:
+        lines.append(f"- {similarity:.0%}: \"{first_text[:150]}\" ({first_file})\n  \"{second_text[:150]}\" ({second_file})")
+    for chunk in render_digest(lines, MESSAGE_LIMIT):
+        await outbound.send(ctx.channel, chunk)
+
+@bot.group(invoke_without_command=True)
+@commands.has_permissions(administrator=True)
+@metrics.timed("handler_latency_seconds", handler="stats")
+async def stats(ctx):
+    # Report on the server's completed rounds: response rates, time to respond and response lengths
+    report = await manager.get_round_stats(ctx.guild.id)
+    await member_names.resolve(ctx.guild, [user_id for user_id, _, _ in report["members"]])
+    lines = format_round_stats(report, lambda user_id: member_names.get(ctx.guild, user_id), format_duration)
+    for chunk in render_digest(lines, MESSAGE_LIMIT):
+        await outbound.send(ctx.channel, chunk)
+
+@stats.command(name="bot")
+async def stats_bot(ctx):
+    # Show where the bot spends its time: handler latencies, API calls, storage I/O and round timings
+    await outbound.send(ctx.channel, format_stats(metrics))
+
+@metrics.timed("handler_latency_seconds", handler="notification_preference")
+async def handle_notification_preference(guild_id, member_id, preference):
+    # Update the notification preference for the guild the button was pressed in
+    await manager.set_notification(guild_id, member_id, preference)
+    await log_debug(None, f"Notification preference for member {member_id} set to {preference}", level=3)
+
+# Notification buttons shared by every welcome message
+notification_view = NotificationPreferenceView(handle_notification_preference)
+# Prompt fan-out pipeline shared by !prompt and the startup resume
+delivery = PromptDelivery(manager, render_prompt_message, outbound, registry.get_member)
+# Channel provisioning shared by !init and on_member_join
+provisioner = GuildProvisioner(registry, send_welcome_message, fetch_members=LEAN_MEMBER_CACHE)
+# Response digests posted when a round completes
+digest = DigestPublisher(member_names, outbound)
+# Automatic rounds on each guild's cadence
+scheduler = RoundScheduler(manager, run_scheduled_round, SCHEDULE_STAGGER, SCHEDULE_JITTER)
+# Reminders for members who have not responded to an open round
+reminders = ReminderEngine(manager, send_reminder, REMINDER_DELAY, REMINDER_COUNT, REMINDER_BATCH_WINDOW)
+
+if __name__ == "__main__":
+    # Replace 'YOUR_BOT_TOKEN' with the imported BOT_TOKEN
+    bot.run(BOT_TOKEN)
+    manager.close()  # Finish queued writes and compact the in-progress journal on shutdown
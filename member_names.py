@@ -0,0 +1,50 @@
+import asyncio
+
+
+class MemberNameCache:
+    """
+    Caches member names by guild and user ID so digests and reports don't have
+    to resolve every member through the guild. Entries are filled on first use
+    and kept current from member join, update and remove events.
+    """
+
+    def __init__(self):
+        self.names = {}  # guild_id -> {user_id: name}
+
+    def set(self, member):
+        self.names.setdefault(member.guild.id, {})[member.id] = member.name
+
+    def forget(self, guild_id, user_id):
+        self.names.get(guild_id, {}).pop(int(user_id), None)
+
+    def get(self, guild, user_id):
+        """
+        :return: The member's name, or "User <id>" if they are no longer in the guild.
+        """
+        user_id = int(user_id)
+        name = self.names.get(guild.id, {}).get(user_id)
+        if name is None:
+            member = guild.get_member(user_id)
+            if member is None:
+                return f"User {user_id}"  # Fallback to user_id if member not found
+            self.set(member)
+            name = member.name
+        return name
+
+    async def resolve(self, guild, user_ids):
+        """
+        Looks up the names of members that are neither cached here nor in discord.py's
+        member cache (as in lean mode), asking Discord for up to 100 at a time.
+        """
+        guild_names = self.names.get(guild.id, {})
+        missing = [
+            int(user_id) for user_id in user_ids
+            if int(user_id) not in guild_names and guild.get_member(int(user_id)) is None
+        ]
+        for start in range(0, len(missing), 100):
+            try:
+                members = await guild.query_members(user_ids=missing[start:start + 100], limit=100, cache=False)
+            except asyncio.TimeoutError:
+                continue  # Those members are shown by ID
+            for member in members:
+                self.set(member)
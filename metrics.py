@@ -0,0 +1,329 @@
+import asyncio
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+
+# Latency buckets in seconds, from a fast dictionary lookup to a slow API call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    """
+    Counts observations in cumulative buckets, like a Prometheus histogram.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Estimates a quantile (0-1) by interpolating within the bucket it falls in,
+        bounded by the smallest and largest observations.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        estimate = self.max
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                if i < len(self.buckets):
+                    lower = self.buckets[i - 1] if i > 0 else 0.0
+                    estimate = lower + (self.buckets[i] - lower) * (rank - seen) / bucket_count
+                break
+            seen += bucket_count
+        return min(max(estimate, self.min), self.max)
+
+
+class Metrics:
+    """
+    Registry of the bot's counters, gauges and histograms.
+
+    Metrics are identified by a name and a set of labels, and can be rendered in
+    the Prometheus text format. Updates are thread-safe, since storage runs on
+    its own worker thread.
+    """
+
+    PREFIX = "relationship_bot_"
+
+    def __init__(self):
+        self.counters = {}  # (name, labels) -> value
+        self.gauges = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def timed(self, name, **labels):
+        """
+        Decorator recording how long each call of a coroutine function takes.
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start, **labels)
+            return wrapper
+        return decorator
+
+    def get_counter(self, name, **labels):
+        """
+        :return: The counter's value; without labels, the total over all label values.
+        """
+        with self.lock:
+            if labels:
+                return self.counters.get(self._key(name, labels), 0)
+            return sum(value for (counter_name, _), value in self.counters.items() if counter_name == name)
+
+    def get_histograms(self, name):
+        """
+        :return: A dictionary of label dictionary (as a tuple of pairs) to Histogram for a metric.
+        """
+        with self.lock:
+            return {labels: histogram for (histogram_name, labels), histogram in self.histograms.items()
+                    if histogram_name == name}
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        """
+        :return: All metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            self.gauges[("uptime_seconds", ())] = time.time() - self.started
+            for kind, values in (("counter", self.counters), ("gauge", self.gauges)):
+                for name in sorted({name for name, _ in values}):
+                    lines.append(f"# TYPE {self.PREFIX}{name} {kind}")
+                    for (metric_name, labels), value in sorted(values.items()):
+                        if metric_name == name:
+                            lines.append(f"{self.PREFIX}{name}{self._format_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {self.PREFIX}{name} histogram")
+                for (metric_name, labels), histogram in sorted(self.histograms.items()):
+                    if metric_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, bucket_count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                        cumulative += bucket_count
+                        lines.append(f"{self.PREFIX}{name}_bucket{self._format_labels(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{self.PREFIX}{name}_sum{self._format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{self.PREFIX}{name}_count{self._format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, file_path):
+        """
+        Writes the metrics to a file (e.g. for node_exporter's textfile collector) via atomic rename.
+        """
+        tmp_file = file_path + ".tmp"
+        with open(tmp_file, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_file, file_path)
+
+
+class RateLimitHandler(logging.Handler):
+    """
+    Counts the rate limit waits discord.py logs when a request gets a 429.
+    """
+
+    def __init__(self, metrics):
+        super().__init__(logging.WARNING)
+        self.metrics = metrics
+
+    def emit(self, record):
+        message = str(record.msg)
+        if message.startswith("We are being rate limited.") and len(record.args) >= 3:
+            self.metrics.inc("discord_rate_limit_waits_total")
+            self.metrics.observe("discord_rate_limit_wait_seconds", float(record.args[2]))
+        elif message.startswith("Global rate limit has been hit."):
+            self.metrics.inc("discord_global_rate_limits_total")
+
+
+def instrument_http(metrics, http):
+    """
+    Counts and times every Discord API request made through a discord.py HTTPClient,
+    by method and route template. The latency includes time spent waiting on rate limits.
+    """
+    request = http.request
+
+    @functools.wraps(request)
+    async def counted_request(route, **kwargs):
+        labels = {"method": route.method, "route": route.path}
+        metrics.inc("discord_api_calls_total", **labels)
+        start = time.perf_counter()
+        try:
+            return await request(route, **kwargs)
+        except Exception:
+            metrics.inc("discord_api_errors_total", **labels)
+            raise
+        finally:
+            metrics.observe("discord_api_latency_seconds", time.perf_counter() - start, **labels)
+
+    http.request = counted_request
+    logging.getLogger("discord.http").addHandler(RateLimitHandler(metrics))
+
+
+class MetricsExporter:
+    """
+    Publishes the metrics on a local HTTP endpoint and/or by periodically writing
+    them to a file.
+    """
+
+    def __init__(self, metrics, port=None, file_path=None, interval=60, host="127.0.0.1"):
+        """
+        :param metrics: The Metrics to publish.
+        :param port: Port of the HTTP endpoint, or None for no endpoint.
+        :param file_path: File to write the metrics to, or None for no file.
+        :param interval: Seconds between file writes.
+        :param host: Interface the endpoint listens on.
+        """
+        self.metrics = metrics
+        self.port = port
+        self.file_path = file_path
+        self.interval = interval
+        self.host = host
+        self.server = None
+        self.task = None
+
+    async def start(self):
+        """
+        Starts the endpoint and the file writer. Calling it again does nothing.
+        """
+        if self.port and self.server is None:
+            self.server = await asyncio.start_server(self._serve, self.host, self.port)
+        if self.file_path and self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._write_periodically())
+
+    async def _serve(self, reader, writer):
+        try:
+            # Any request gets the metrics; read and discard the request headers
+            while (await reader.readline()).strip():
+                pass
+            body = self.metrics.render().encode("utf-8")
+            writer.write(
+                b"HTTP/1.0 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode("ascii")
+                + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _write_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.metrics.write_file(self.file_path)
+            except OSError as e:
+                print(f"Failed to write metrics to {self.file_path}: {e}")
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "-"
+    if seconds < 1:
+        return f"{seconds * 1000:.1f}ms"
+    if seconds < 120:
+        return f"{seconds:.1f}s"
+    minutes, _ = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    return f"{days}d {hours}h" if days else f"{hours}h {minutes}m"
+
+
+def format_bytes(count):
+    for unit in ("B", "KB", "MB"):
+        if count < 1024:
+            return f"{count:.0f}{unit}" if unit == "B" else f"{count:.1f}{unit}"
+        count /= 1024
+    return f"{count:.1f}GB"
+
+
+def format_stats(metrics):
+    """
+    :return: A short plain text report of the bot's metrics for the !stats command.
+    """
+    lines = [f"**Bot statistics** (up {format_duration(time.time() - metrics.started)})", "", "**Handlers**"]
+    handlers = metrics.get_histograms("handler_latency_seconds")
+    for labels, histogram in sorted(handlers.items(), key=lambda item: -item[1].sum):
+        lines.append(
+            f"{dict(labels)['handler']}: {histogram.count} calls, p50 {format_duration(histogram.quantile(0.5))}, "
+            f"p95 {format_duration(histogram.quantile(0.95))}, total {format_duration(histogram.sum)}"
+        )
+    if not handlers:
+        lines.append("No handler calls yet.")
+
+    lines += [
+        "",
+        "**Discord API**",
+        f"{metrics.get_counter('discord_api_calls_total')} calls, {metrics.get_counter('discord_api_errors_total')} errors, "
+        f"{metrics.get_counter('discord_rate_limit_waits_total')} rate limit waits "
+        f"({metrics.get_counter('discord_global_rate_limits_total')} global)",
+        "",
+        "**Storage**",
+        f"{metrics.get_counter('storage_reads_total')} reads ({format_bytes(metrics.get_counter('storage_read_bytes_total'))}), "
+        f"{metrics.get_counter('storage_writes_total')} writes ({format_bytes(metrics.get_counter('storage_written_bytes_total'))})",
+        "",
+        "**Rounds**",
+        f"{metrics.get_counter('rounds_started_total')} started, {metrics.get_counter('rounds_completed_total')} completed, "
+        f"{metrics.get_counter('prompts_delivered_total')} prompts delivered, "
+        f"{metrics.get_counter('round_responses_total')} responses",
+    ]
+    for name, title in (
+        ("round_delivery_seconds", "Delivery"),
+        ("round_response_seconds", "Time to respond"),
+        ("round_duration_seconds", "Round duration"),
+    ):
+        histograms = list(metrics.get_histograms(name).values())
+        if histograms:
+            lines.append(f"{title}: p50 {format_duration(histograms[0].quantile(0.5))}, "
+                         f"p95 {format_duration(histograms[0].quantile(0.95))}")
+    return "\n".join(lines)
+
+
+metrics = Metrics()  # The bot's metrics registry
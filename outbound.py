@@ -0,0 +1,282 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+import discord
+from metrics import metrics
+
+# Priority classes; lower values are sent first
+INTERACTIVE = 0  # Replies to members and commands (the default)
+NORMAL = 1  # Welcome messages, response digests and notices
+BULK = 2  # Prompt deliveries and reminders
+PRIORITY_NAMES = {INTERACTIVE: "interactive", NORMAL: "normal", BULK: "bulk"}
+
+
+class TokenBucket:
+    """
+    Allows rate actions per second on average, in bursts of up to capacity.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """
+        :return: Seconds until a token is available, 0 if one is available now.
+        """
+        self._refill()
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+    def full(self):
+        self._refill()
+        return self.tokens >= self.capacity
+
+    def pause(self, seconds):
+        """
+        Empties the bucket so the next token is only available after seconds, e.g. after a rate limit.
+        """
+        self._refill()
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class OutboundJob:
+    __slots__ = ("priority", "seq", "channel_id", "action", "future", "coalesce", "attempts", "queued")
+
+    def __init__(self, priority, seq, channel_id, action, future, coalesce):
+        self.priority = priority
+        self.seq = seq
+        self.channel_id = channel_id
+        self.action = action  # Coroutine function performing the API call
+        self.future = future
+        self.coalesce = coalesce
+        self.attempts = 0
+        self.queued = time.monotonic()
+
+
+class ChannelQueue:
+    __slots__ = ("jobs", "bucket", "waiting")
+
+    def __init__(self, bucket):
+        self.jobs = []  # Heap of (priority, seq, job)
+        self.bucket = bucket
+        self.waiting = False  # Whether a timer will mark the channel ready when its bucket refills
+
+
+class OutboundDispatcher:
+    """
+    Single queue for everything the bot sends to Discord channels.
+
+    Sends are queued per channel by priority class, so replies to members go out
+    before the messages of a bulk prompt delivery queued earlier. A global token
+    bucket keeps the bot under Discord's overall request rate, and a token bucket
+    per channel under the per-channel message rate, so bursts are paced here
+    instead of running into 429 responses. A channel waiting on its bucket never
+    holds up other channels.
+
+    A send with a coalesce key replaces a queued send with the same key, so only
+    the latest version of e.g. a progress message goes out; both callers get the
+    resulting message. Rate limits, server errors and connection errors are
+    retried with exponential backoff.
+    """
+
+    def __init__(self, rate=40.0, burst=40, channel_rate=1.0, channel_burst=5, concurrency=10,
+                 max_retries=3, backoff=1.0):
+        """
+        :param rate: Messages per second across all channels, or None for no global limit.
+        :param burst: Messages that may be sent at once across all channels.
+        :param channel_rate: Messages per second per channel, or None for no per-channel limit.
+        :param channel_burst: Messages that may be sent at once in one channel.
+        :param concurrency: Maximum number of API calls in flight at once.
+        :param max_retries: Attempts after the first before a send fails.
+        :param backoff: Delay in seconds before the first retry; doubled on every further retry.
+        """
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.channels = {}  # channel_id -> ChannelQueue; idle channels are pruned once their bucket is full again
+        self.pruned = time.monotonic()
+        self.ready = []  # Heap of (priority, seq, channel_id) of channels that may send; stale entries are skipped
+        self.coalesced = {}  # Coalesce key -> queued job
+        self.sequence = itertools.count()
+        self.wake = None
+        self.slots = None
+        self.task = None
+
+    def start(self):
+        """
+        Starts the dispatching task. Calling it again does nothing; sends start it on first use.
+        """
+        if self.task is not None:
+            return
+        self.wake = asyncio.Event()
+        self.slots = asyncio.Semaphore(self.concurrency)
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def send(self, channel, content=None, priority=INTERACTIVE, coalesce=None, **kwargs):
+        """
+        Queues a message and waits until it has been sent.
+
+        :param channel: The channel, thread or other messageable to send to.
+        :param priority: INTERACTIVE, NORMAL or BULK.
+        :param coalesce: Key under which a queued message is replaced by this one.
+        :param kwargs: Further arguments of channel.send. Files are read by the first attempt,
+                       so sends with attachments go through submit with an action that creates them.
+        :return: The sent message.
+        """
+        return await self.submit(channel.id, lambda: channel.send(content, **kwargs), priority, coalesce)
+
+    async def reply(self, message, content=None, priority=INTERACTIVE, **kwargs):
+        """
+        Queues a reply to a message without mentioning its author.
+        """
+        kwargs.setdefault("mention_author", False)
+        return await self.submit(message.channel.id, lambda: message.reply(content, **kwargs), priority)
+
+    async def edit(self, message, priority=INTERACTIVE, **kwargs):
+        """
+        Queues an edit of a message. Queued edits of the same message are coalesced,
+        so only the latest one is made.
+        """
+        return await self.submit(message.channel.id, lambda: message.edit(**kwargs), priority, ("edit", message.id))
+
+    async def submit(self, channel_id, action, priority=NORMAL, coalesce=None):
+        """
+        Queues an API call against a channel and waits for its result.
+
+        :param channel_id: The ID of the channel whose rate limit the call counts against.
+        :param action: Coroutine function making the call.
+        :return: The call's result.
+        """
+        self.start()
+        job = self.coalesced.get(coalesce) if coalesce is not None else None
+        if job is not None:
+            job.action = action  # The latest version replaces the queued one
+            metrics.inc("outbound_coalesced_total")
+        else:
+            job = OutboundJob(priority, next(self.sequence), channel_id, action,
+                              asyncio.get_running_loop().create_future(), coalesce)
+            if coalesce is not None:
+                self.coalesced[coalesce] = job
+            self._enqueue(job)
+        # Shielded so a caller that is cancelled doesn't cancel a send other callers share
+        return await asyncio.shield(job.future)
+
+    def _enqueue(self, job):
+        queue = self.channels.get(job.channel_id)
+        if queue is None:
+            bucket = TokenBucket(self.channel_rate, self.channel_burst) if self.channel_rate else None
+            queue = self.channels[job.channel_id] = ChannelQueue(bucket)
+        heapq.heappush(queue.jobs, (job.priority, job.seq, job))
+        self._schedule(job.channel_id, queue)
+
+    def _schedule(self, channel_id, queue):
+        # Marks a channel with queued jobs ready now, or once its bucket has a token
+        if not queue.jobs or queue.waiting:
+            return
+        delay = queue.bucket.delay() if queue.bucket else 0
+        if delay:
+            queue.waiting = True
+            asyncio.get_running_loop().call_later(delay, self._refilled, channel_id, queue)
+            return
+        priority, seq, _ = queue.jobs[0]
+        heapq.heappush(self.ready, (priority, seq, channel_id))
+        self.wake.set()
+
+    def _refilled(self, channel_id, queue):
+        queue.waiting = False
+        self._schedule(channel_id, queue)
+
+    async def _run(self):
+        while True:
+            if not self.ready:
+                self._prune()
+                self.wake.clear()
+                await self.wake.wait()
+                continue
+            delay = self.bucket.delay() if self.bucket else 0
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+            await self.slots.acquire()
+
+            _, _, channel_id = heapq.heappop(self.ready)
+            queue = self.channels[channel_id]
+            if not queue.jobs or (queue.bucket and queue.bucket.delay()):
+                # Already served by an earlier entry, or rate limited since it was marked ready
+                self.slots.release()
+                self._schedule(channel_id, queue)
+                continue
+
+            _, _, job = heapq.heappop(queue.jobs)
+            if job.coalesce is not None and self.coalesced.get(job.coalesce) is job:
+                del self.coalesced[job.coalesce]
+            if self.bucket:
+                self.bucket.take()
+            if queue.bucket:
+                queue.bucket.take()
+            metrics.observe("outbound_queue_seconds", time.monotonic() - job.queued, priority=PRIORITY_NAMES[job.priority])
+            asyncio.get_running_loop().create_task(self._perform(job, queue))
+            self._schedule(channel_id, queue)
+
+    def _prune(self, interval=60):
+        # Forgets idle channels whose bucket is full, at most once per interval seconds
+        if time.monotonic() - self.pruned < interval:
+            return
+        self.pruned = time.monotonic()
+        self.channels = {
+            channel_id: queue for channel_id, queue in self.channels.items()
+            if queue.jobs or queue.waiting or (queue.bucket and not queue.bucket.full())
+        }
+
+    async def _perform(self, job, queue):
+        try:
+            result = await job.action()
+        except Exception as e:
+            delay = self._retry_delay(e, job)
+            if delay is None:
+                if not job.future.done():
+                    job.future.set_exception(e)
+                return
+            job.attempts += 1
+            metrics.inc("outbound_retries_total")
+            if isinstance(e, discord.RateLimited) and queue.bucket:
+                queue.bucket.pause(delay)  # Hold the channel's other sends too
+            asyncio.get_running_loop().call_later(delay, self._enqueue, job)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self.slots.release()
+
+    def _retry_delay(self, error, job):
+        # Seconds to wait before retrying, or None if the error is final
+        if job.attempts >= self.max_retries:
+            return None
+        if isinstance(error, discord.RateLimited):
+            return error.retry_after
+        if isinstance(error, discord.HTTPException) and (error.status == 429 or error.status >= 500):
+            pass
+        elif not isinstance(error, (OSError, asyncio.TimeoutError)):
+            return None
+        return self.backoff * 2 ** job.attempts * random.uniform(0.5, 1.5)
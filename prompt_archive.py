@@ -0,0 +1,199 @@
+import json
+import os
+from metrics import metrics
+
+
+class PromptArchive:
+    """
+    Append-only archive of used prompts.
+
+    Records are appended as JSON lines to numbered segment files holding at most
+    segment_size records each, so archiving a prompt writes a single line however
+    long the history gets. A small index file lists each record's prompt ID,
+    source file, date, segment and byte offset. The index is kept in memory, so
+    lookups and pages seek straight to the records they need and only open the
+    segments those records are in.
+    """
+
+    INDEX_FILE = "index.jsonl"
+
+    def __init__(self, folder, segment_size=500):
+        """
+        :param folder: Folder holding the segments and the index.
+        :param segment_size: Records per segment before a new segment is started.
+        """
+        self.folder = folder
+        self.segment_size = segment_size
+        self.index_file = os.path.join(folder, self.INDEX_FILE)
+        self.entries = []  # Index entries in archive order; superseded entries are None
+        self.by_id = {}  # prompt_id -> position in entries
+        self.by_file = {}  # selected_file -> positions in entries
+        self.by_date = {}  # "YYYY-MM-DD" -> positions in entries
+        self.segment = 0  # Number of the segment being appended to
+        self.segment_count = 0  # Records in the current segment
+        self.torn_tail = False  # Whether the current segment ends with a partial line
+
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self._load_index()
+
+    def _segment_file(self, segment):
+        return os.path.join(self.folder, f"segment-{segment:06d}.jsonl")
+
+    def _load_index(self):
+        if os.path.exists(self.index_file):
+            offset = 0
+            with open(self.index_file, "rb") as f:
+                for line in f:
+                    try:
+                        self._add_entry(json.loads(line))
+                    except json.JSONDecodeError:
+                        # A torn final write: drop it, the record is recovered from its segment below
+                        os.truncate(self.index_file, offset)
+                        break
+                    offset += len(line)
+        self._recover_last_segment()
+
+    def _recover_last_segment(self):
+        # Index any records of the last segment written just before a crash, before their index line
+        segments = sorted(name for name in os.listdir(self.folder) if name.startswith("segment-"))
+        if not segments:
+            return
+        self.segment = int(segments[-1][len("segment-"):-len(".jsonl")])
+        indexed = {entry["offset"] for entry in self.entries if entry and entry["segment"] == self.segment}
+        self.segment_count = 0
+        with open(self._segment_file(self.segment), "rb") as f:
+            offset = 0
+            line = b""
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    record = None  # A torn record; appends start on a new line
+                if record is not None:
+                    self.segment_count += 1
+                    if offset not in indexed:
+                        self._append_index(self._make_entry(record["prompt_id"], record["data"], self.segment, offset))
+                offset += len(line)
+        self.torn_tail = bool(line) and not line.endswith(b"\n")
+
+    @staticmethod
+    def _make_entry(prompt_id, prompt_data, segment, offset):
+        return {
+            "prompt_id": prompt_id,
+            "file": prompt_data.get("selected_file"),
+            "date": (prompt_data.get("timestamp") or "")[:10],
+            "segment": segment,
+            "offset": offset,
+        }
+
+    def _add_entry(self, entry):
+        previous = self.by_id.get(entry["prompt_id"])
+        if previous is not None:
+            self.entries[previous] = None  # Archived again; the newest record wins
+        position = len(self.entries)
+        self.entries.append(entry)
+        self.by_id[entry["prompt_id"]] = position
+        self.by_file.setdefault(entry["file"], []).append(position)
+        self.by_date.setdefault(entry["date"], []).append(position)
+
+    def _append_index(self, entry):
+        with open(self.index_file, "a") as f:
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self._add_entry(entry)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __contains__(self, prompt_id):
+        return prompt_id in self.by_id
+
+    def append(self, prompt_id, prompt_data):
+        """
+        Archives a used prompt.
+
+        :param prompt_id: The ID of the prompt.
+        :param prompt_data: The prompt data including responses and completion metadata.
+        """
+        if self.segment == 0 or self.segment_count >= self.segment_size:
+            self.segment += 1
+            self.segment_count = 0
+            self.torn_tail = False
+        line = (json.dumps({"prompt_id": prompt_id, "data": prompt_data}, separators=(",", ":")) + "\n").encode("utf-8")
+        with open(self._segment_file(self.segment), "ab") as f:
+            if self.torn_tail:
+                f.write(b"\n")
+                self.torn_tail = False
+            offset = f.tell()
+            f.write(line)
+        self.segment_count += 1
+        self._append_index(self._make_entry(prompt_id, prompt_data, self.segment, offset))
+        metrics.inc("storage_writes_total", kind="archive")
+        metrics.inc("storage_written_bytes_total", len(line), kind="archive")
+
+    def _read(self, entries):
+        """
+        Reads the records of the given index entries, opening each segment once.
+
+        :return: A list of (prompt_id, prompt_data) pairs in the order of the entries.
+        """
+        records = {}
+        by_segment = {}
+        for entry in entries:
+            by_segment.setdefault(entry["segment"], []).append(entry)
+        for segment, segment_entries in by_segment.items():
+            with open(self._segment_file(segment), "rb") as f:
+                for entry in sorted(segment_entries, key=lambda e: e["offset"]):
+                    f.seek(entry["offset"])
+                    line = f.readline()
+                    metrics.inc("storage_read_bytes_total", len(line), kind="archive")
+                    records[(segment, entry["offset"])] = json.loads(line)["data"]
+            metrics.inc("storage_reads_total", kind="archive")
+        return [(entry["prompt_id"], records[(entry["segment"], entry["offset"])]) for entry in entries]
+
+    def get(self, prompt_id):
+        """
+        :return: The archived prompt data, or None if the prompt is not in the archive.
+        """
+        position = self.by_id.get(prompt_id)
+        if position is None:
+            return None
+        return self._read([self.entries[position]])[0][1]
+
+    def find(self, selected_file=None, date=None):
+        """
+        :param selected_file: Only include prompts from this prompt file.
+        :param date: Only include prompts used on this date ("YYYY-MM-DD").
+        :return: The matching index entries, newest first.
+        """
+        if selected_file is not None and date is not None:
+            dates = set(self.by_date.get(date, ()))
+            positions = [p for p in self.by_file.get(selected_file, ()) if p in dates]
+        elif selected_file is not None:
+            positions = self.by_file.get(selected_file, [])
+        elif date is not None:
+            positions = self.by_date.get(date, [])
+        else:
+            positions = range(len(self.entries))
+        return [self.entries[p] for p in reversed(positions) if self.entries[p] is not None]
+
+    def get_page(self, page=0, per_page=10, selected_file=None, date=None):
+        """
+        Returns one page of archived prompts, newest first. Only the segments holding
+        the page's records are read.
+
+        :param page: The zero-based page number; out of range pages are clamped.
+        :return: A (records, page, page_count) tuple, where records is a list of (prompt_id, prompt_data).
+        """
+        entries = self.find(selected_file, date)
+        page_count = max(1, -(-len(entries) // per_page))
+        page = min(max(page, 0), page_count - 1)
+        return self._read(entries[page * per_page:(page + 1) * per_page]), page, page_count
+
+    def iter_records(self):
+        """
+        Yields every archived (prompt_id, prompt_data) pair, oldest first, reading one segment at a time.
+        """
+        entries = [entry for entry in self.entries if entry is not None]
+        for start in range(0, len(entries), self.segment_size):
+            yield from self._read(entries[start:start + self.segment_size])
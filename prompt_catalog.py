@@ -0,0 +1,79 @@
+class PromptCatalog:
+    """
+    Cached listing of the prompt files with their prompt counts, sizes and
+    modification times.
+
+    Counts come straight from the prompt pool; sizes and modification times are
+    read from storage once per file and cached until the file is written again.
+    The sorted listing itself is only rebuilt when a file is added.
+    """
+
+    def __init__(self, storage, pool):
+        """
+        :param storage: The storage backend holding the prompt files.
+        :param pool: The PromptPool tracking the prompts in each file.
+        """
+        self.storage = storage
+        self.pool = pool
+        self.file_info = {}  # File name -> {"size", "mtime"}
+        self.file_names = None  # Sorted file names, rebuilt when files are added
+
+    def invalidate(self, file_name=None):
+        """
+        Drops the cached details of a file after it has been written, or of every
+        file if no name is given.
+        """
+        if file_name is None:
+            self.file_info = {}
+            self.file_names = None
+            return
+        self.file_info.pop(file_name, None)
+        if self.file_names is not None and len(self.file_names) != len(self.pool.files):
+            self.file_names = None  # A file was added
+
+    def get_file_names(self):
+        if self.file_names is None:
+            self.file_names = sorted(self.pool.files, key=str.lower)
+        return self.file_names
+
+    def get_entry(self, file_name):
+        """
+        :return: A dictionary with the file's name, prompt count, size and modification time.
+        """
+        info = self.file_info.get(file_name)
+        if info is None:
+            info = self.storage.get_prompt_file_info(file_name)
+            self.file_info[file_name] = info
+        return {
+            "file_name": file_name,
+            "count": self.pool.count(file_name),
+            "size": info["size"],
+            "mtime": info["mtime"],
+        }
+
+    def search(self, query=None):
+        """
+        :param query: Text the file name must contain (case-insensitive), or None for all files.
+        :return: The matching file names, sorted.
+        """
+        file_names = self.get_file_names()
+        if not query:
+            return file_names
+        query = query.lower()
+        return [file_name for file_name in file_names if query in file_name.lower()]
+
+    def get_page(self, page, query=None, per_page=25):
+        """
+        Returns one page of catalog entries; only the files on the page are looked up.
+
+        :param page: The zero-based page number; out of range pages are clamped.
+        :param query: Optional file name filter.
+        :param per_page: Entries per page (Discord select menus hold at most 25 options).
+        :return: A (entries, page, page_count) tuple.
+        """
+        file_names = self.search(query)
+        page_count = max(1, -(-len(file_names) // per_page))
+        page = min(max(page, 0), page_count - 1)
+        start = page * per_page
+        entries = [self.get_entry(file_name) for file_name in file_names[start:start + per_page]]
+        return entries, page, page_count
@@ -0,0 +1,81 @@
+import csv
+import io
+import json
+import os
+
+IMPORT_FORMATS = (".json", ".jsonl", ".csv", ".txt")  # Attachment types accepted in add-prompts
+TEXT_KEYS = ("prompt", "text", "prompt_text")  # Object fields and CSV columns holding the prompt text
+
+
+def _entry_text(entry):
+    # An entry is either the prompt itself or an object with the prompt in one of TEXT_KEYS
+    if isinstance(entry, str):
+        return entry
+    if isinstance(entry, dict):
+        for key in TEXT_KEYS:
+            if isinstance(entry.get(key), str):
+                return entry[key]
+    return None
+
+
+def read_prompts(file_name, data):
+    """
+    Reads the prompts of an uploaded file, one entry at a time.
+
+    JSON files hold a list of prompts (strings or objects with a "prompt" or "text"
+    field), JSONL files one such entry per line, CSV files one prompt per row (the
+    "prompt" or "text" column if there is a header, otherwise the first column) and
+    text files one prompt per line.
+
+    :param file_name: The uploaded file's name, which decides the format.
+    :param data: The file's contents as bytes.
+    :return: A generator of prompt texts; entries without a prompt yield None.
+    """
+    extension = os.path.splitext(file_name)[1].lower()
+    text = data.decode("utf-8-sig")
+
+    if extension == ".json":
+        entries = json.loads(text)
+        if not isinstance(entries, list):
+            raise ValueError("A JSON prompt file must contain a list of prompts.")
+        for entry in entries:
+            yield _entry_text(entry)
+    elif extension == ".jsonl":
+        for line in io.StringIO(text):
+            if line.strip():
+                yield _entry_text(json.loads(line))
+    elif extension == ".csv":
+        rows = csv.reader(io.StringIO(text))
+        first = next(rows, None)
+        if first is None:
+            return
+        header = [column.strip().lower() for column in first]
+        column = next((header.index(key) for key in TEXT_KEYS if key in header), None)
+        if column is None:
+            column = 0
+            yield first[0] if first else None
+        for row in rows:
+            yield row[column] if len(row) > column else None
+    elif extension == ".txt":
+        for line in io.StringIO(text):
+            if line.strip():
+                yield line
+    else:
+        raise ValueError(f"Unsupported file type '{extension}'; use one of {', '.join(IMPORT_FORMATS)}.")
+
+
+def format_import_summary(source, file_name, summary):
+    """
+    :param source: The name of the uploaded file.
+    :param file_name: The prompt file the prompts were imported into.
+    :param summary: The summary returned by PromptManager.import_prompts.
+    :return: A one line report of the import.
+    """
+    report = f"`{source}` → {file_name}: {summary['added']} added"
+    if summary["duplicates"]:
+        report += f", {summary['duplicates']} already in the library"
+    if summary["repeated"]:
+        report += f", {summary['repeated']} repeated in the file"
+    if summary["invalid"]:
+        report += f", {summary['invalid']} skipped (empty or too long)"
+    return report + "."
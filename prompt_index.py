@@ -0,0 +1,100 @@
+import hashlib
+
+
+def normalize_prompt(prompt_text):
+    """
+    Normalizes a prompt for storage: surrounding whitespace is removed and runs of
+    spaces and tabs are collapsed, while line breaks are kept.
+    """
+    return "\n".join(" ".join(line.split()) for line in prompt_text.strip().splitlines())
+
+
+def prompt_hash(prompt_text):
+    """
+    :return: The content hash used to detect duplicates; prompts that only differ in
+             case or whitespace have the same hash.
+    """
+    return hashlib.sha1(" ".join(prompt_text.split()).casefold().encode("utf-8")).hexdigest()
+
+
+class PromptHashIndex:
+    """
+    Content-hash index of every prompt in the library, for duplicate checks that
+    don't load or scan the prompt files.
+
+    The index is saved in storage along with each file's size and modification
+    time. On load, only files that changed since (or were added) are hashed
+    again, from the prompts the pool already holds in memory.
+    """
+
+    def __init__(self, storage, pool):
+        """
+        :param storage: The storage backend holding the prompt files and the saved index.
+        :param pool: The PromptPool holding the prompts of each file.
+        """
+        self.storage = storage
+        self.pool = pool
+        self.hashes = None  # Content hash -> file name; loaded on first use
+        self.files = {}  # File name -> [size, mtime] of the file when it was indexed
+
+    def load(self):
+        """
+        Loads the saved index and brings it up to date with the prompt files.
+        Calling it again does nothing.
+        """
+        if self.hashes is not None:
+            return
+        saved = self.storage.load_prompt_index()
+        self.hashes = saved.get("hashes", {})
+        self.files = saved.get("files", {})
+
+        stale = [file_name for file_name in self.files if file_name not in self.pool.files]
+        for file_name in self.pool.files:
+            if self.files.get(file_name) != self._signature(file_name):
+                stale.append(file_name)
+        if stale:
+            self._reindex(stale)
+            self.save()
+
+    def _signature(self, file_name):
+        info = self.storage.get_prompt_file_info(file_name)
+        return [info["size"], info["mtime"]]
+
+    def _reindex(self, file_names):
+        file_names = set(file_names)
+        self.hashes = {digest: file_name for digest, file_name in self.hashes.items() if file_name not in file_names}
+        for file_name in file_names:
+            self.files.pop(file_name, None)
+            bucket = self.pool.files.get(file_name)
+            if bucket is None:
+                continue  # The file was deleted
+            for prompt_text in bucket.items:
+                self.hashes.setdefault(prompt_hash(prompt_text), file_name)
+            self.files[file_name] = self._signature(file_name)
+
+    def save(self):
+        self.storage.save_prompt_index({"hashes": self.hashes, "files": self.files})
+
+    def find(self, prompt_text):
+        """
+        :return: The name of the file already holding the prompt (ignoring case and whitespace), or None.
+        """
+        self.load()
+        return self.hashes.get(prompt_hash(prompt_text))
+
+    def add(self, file_name, prompt_texts):
+        """
+        Indexes prompts written to a file and records the file's new signature.
+        """
+        self.load()
+        for prompt_text in prompt_texts:
+            self.hashes[prompt_hash(prompt_text)] = file_name
+        self.files[file_name] = self._signature(file_name)
+
+    def discard(self, prompt_text):
+        """
+        Forgets a prompt that left the library, e.g. because it was used. The file's
+        signature is left as it was, so the file is checked again on the next load.
+        """
+        if self.hashes is not None:
+            self.hashes.pop(prompt_hash(prompt_text), None)
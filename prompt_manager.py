@@ -1,84 +1,252 @@
-import json
 import os
-import random
 import time
 from datetime import datetime
 import pytz
+from storage import JsonStorage, SQLiteStorage, apply_entry, migrate_json_to_sqlite
+from prompt_pool import PromptPool
+from prompt_catalog import PromptCatalog
+from prompt_index import PromptHashIndex, normalize_prompt, prompt_hash
+from prompt_similarity import SimilarityIndex
+from analytics import RoundAnalytics
+from rounds import new_prompt_id
 
 class PromptManager:
     # Constants for folder and file paths
     PROMPTS_FOLDER = "prompts"  # Folder where prompt files are stored
     USED_PROMPTS_FILE = os.path.join(os.path.dirname(__file__), "used_prompts.json")  # File to track used prompts
-    INPROGRESS_PROMPTS_FILE = os.path.join(os.path.dirname(__file__), "inprogress_prompts.json")  # File to track in-progress prompts
+    INPROGRESS_PROMPTS_FILE = os.path.join(os.path.dirname(__file__), "inprogress_prompts.bin")  # Snapshot of the in-progress rounds
+    INPROGRESS_JOURNAL_FILE = os.path.join(os.path.dirname(__file__), "inprogress_prompts.journal")  # Append-only log of in-progress changes
+    NOTIFY_FILE = os.path.join(os.path.dirname(__file__), "notifications.json")  # File storing notification preferences
+    PRIVATE_CHANNELS_FILE = os.path.join(os.path.dirname(__file__), "private_channels.json")  # File storing each member's private channel
+    GUILDS_FOLDER = os.path.join(os.path.dirname(__file__), "guilds")  # Folder holding each guild's state files
+    DATABASE_FILE = os.path.join(os.path.dirname(__file__), "relationship_bot.db")  # Database used by the SQLite backend
+    PROMPT_INDEX_FILE = os.path.join(os.path.dirname(__file__), "prompt_index.json")  # Content-hash index of the prompt library
+    JOURNAL_COMPACT_EVERY = 200  # Journal entries written before the in-progress snapshot is rewritten
+    MAX_PROMPT_LENGTH = 1500  # Longer prompts would not fit in a prompt message
+
+    def __init__(self, backend="json", storage=None, sampling="uniform", owns_guild=None, similarity_threshold=0.4):
+        """
+        Initializes the PromptManager with its storage backend and loads the
+        in-progress prompts of the guilds it owns into memory.
+
+        :param backend: "json" to keep state in the JSON files, or "sqlite" to keep it in
+                        DATABASE_FILE (existing JSON state is migrated on first use).
+        :param storage: An already constructed storage backend, overriding backend.
+        :param sampling: How prompts are picked; see PromptPool.
+        :param owns_guild: Callable (guild_id) telling whether this process handles a guild,
+                           when guilds are split across several bot processes. State that
+                           predates guild partitioning belongs to the owner of guild 0.
+                           Not supported yet: see the check below.
+        :param similarity_threshold: Containment (0-1) from which prompts are reported
+                                     as near-duplicates.
+        """
+        if owns_guild is not None:
+            # Every process keeps its own in-memory pool and hash index of the shared prompt library,
+            # so processes would hand out the same prompts, miss each other's imports and overwrite
+            # each other's hash index, whichever backend they share
+            raise ValueError("Guilds can't be split across several bot processes yet; "
+                             "run every shard in one process (SHARD_COUNT without SHARD_IDS).")
+        if storage is None:
+            json_storage = JsonStorage(
+                self.PROMPTS_FOLDER,
+                self.USED_PROMPTS_FILE,
+                self.INPROGRESS_PROMPTS_FILE,
+                self.INPROGRESS_JOURNAL_FILE,
+                self.NOTIFY_FILE,
+                self.PRIVATE_CHANNELS_FILE,
+                self.JOURNAL_COMPACT_EVERY,
+                self.GUILDS_FOLDER,
+                prompt_index_file=self.PROMPT_INDEX_FILE
+            )
+            if backend == "sqlite":
+                storage = SQLiteStorage(self.DATABASE_FILE)
+                migrate_json_to_sqlite(json_storage, storage)
+            elif backend == "json":
+                storage = json_storage
+            else:
+                raise ValueError(f"Unknown storage backend '{backend}'.")
+        self.storage = storage  # Prompt library and state not tied to a guild
+        self.owns_guild = owns_guild or (lambda guild_id: True)
+
+        # Index of the available prompts
+        self.pool = PromptPool(self.storage, sampling)
+        self.catalog = PromptCatalog(self.storage, self.pool)
+        # Content hashes of the library's prompts for duplicate checks; loaded on first use
+        self.prompt_index = PromptHashIndex(self.storage, self.pool)
+        # MinHash index for near-duplicate checks; built on first use
+        self.similarity_threshold = similarity_threshold
+        self.similarity = None
+
+        # Per-guild state: each guild's storage and in-progress prompts are kept apart, keyed by
+        # guild ID (None for state recorded before guilds were partitioned)
+        self.partitions = {}  # Guild ID -> storage
+        self.partition_prompts = {}  # Guild ID -> {prompt_id: Round}
+        self.prompt_partitions = {}  # Prompt ID -> guild ID of the partition holding it
+        self.notifications = {}  # Guild ID -> cached notification preferences
+        self.analytics = {}  # Guild ID -> columnar view of the guild's completed rounds; built on first use
+
+        # All in-progress rounds of the owned guilds, by prompt ID
+        self.inprogress_prompts = {}
+        # Reverse index from prompt message ID to (prompt_id, user_id, position of the message in the
+        # round's arrays) for reply routing; IDs are ints
+        self.message_index = {}
+        # Members each prompt is still waiting on, so completion checks never scan the guild
+        self.pending = {}
+
+        if self.owns_guild(0):
+            self._load_partition(None)
+        for guild_id in self.storage.list_guilds():
+            if self.owns_guild(guild_id):
+                self._load_partition(guild_id)
+
+    def _load_partition(self, guild_id):
+        """
+        Loads a guild's in-progress prompts into memory and indexes them.
+
+        :param guild_id: The ID of the guild, or None for state not tied to a guild.
+        :return: The guild's storage.
+        """
+        storage = self.storage if guild_id is None else self.storage.for_guild(guild_id)
+        partition_prompts = storage.load_inprogress()
+        self.partitions[guild_id] = storage
+        self.partition_prompts[guild_id] = partition_prompts
+
+        for prompt_id, prompt_round in partition_prompts.items():
+            self.inprogress_prompts[prompt_id] = prompt_round
+            self.prompt_partitions[prompt_id] = guild_id
+            for position, (message_id, user_id) in enumerate(zip(prompt_round.message_ids, prompt_round.message_users)):
+                self.message_index[message_id] = (prompt_id, user_id, position)
+            self.pending[prompt_id] = prompt_round.expected_responders() - prompt_round.responses.keys()
+
+            # Prompts already in progress are not offered again, even if their removal
+            # had not been written before a restart
+            self.pool.remove(prompt_round.selected_file, prompt_round.prompt_text)
+        return storage
+
+    def warm_up(self):
+        """
+        Loads the state that is otherwise read on first use, so the first handlers after
+        a restart don't wait on storage: each owned guild's notification preferences and
+        used prompt index, and the details of every prompt file in the catalog. The
+        near-duplicate index is left to be built on first use: it takes seconds on a
+        large library and is only needed when prompts are added or !duplicates is run.
 
-    def __init__(self):
+        :return: The number of guilds warmed up.
         """
-        Initializes the PromptManager by ensuring necessary folders and files exist.
+        for guild_id, storage in list(self.partitions.items()):
+            storage.warm_up()
+            self.get_notifications(guild_id)
+        for file_name in self.catalog.get_file_names():
+            self.catalog.get_entry(file_name)
+        self.prompt_index.load()
+        return len(self.partitions)
+
+    def get_storage(self, guild_id):
+        """
+        Returns the storage holding a guild's state, loading the guild on first use.
+
+        :param guild_id: The ID of the guild, or None for state not tied to a guild.
         """
-        # Ensure the prompts folder exists
-        if not os.path.exists(self.PROMPTS_FOLDER):
-            os.makedirs(self.PROMPTS_FOLDER)
+        guild_id = None if guild_id is None else int(guild_id)
+        if guild_id not in self.partitions:
+            return self._load_partition(guild_id)
+        return self.partitions[guild_id]
 
-        # Ensure the used prompts file exists
-        if not os.path.exists(self.USED_PROMPTS_FILE):
-            with open(self.USED_PROMPTS_FILE, "w") as f:
-                json.dump({}, f)
+    def _record(self, entry):
+        """
+        Applies a change to the in-progress prompts and hands it to the storage backend.
 
-        # Ensure the in-progress prompts file exists
-        if not os.path.exists(self.INPROGRESS_PROMPTS_FILE):
-            with open(self.INPROGRESS_PROMPTS_FILE, "w") as f:
-                json.dump({}, f)
+        :param entry: The journal entry describing the change.
+        """
+        if entry["op"] == "remove":
+            # Drop the prompt's messages from the reverse index before the prompt disappears
+            prompt_round = self.inprogress_prompts.get(entry["prompt_id"])
+            if prompt_round:
+                for message_id in prompt_round.message_ids:
+                    self.message_index.pop(message_id, None)
+            self.pending.pop(entry["prompt_id"], None)
+        elif entry["op"] in ("message", "messages"):
+            # The messages are appended to the round's arrays, after the ones it already has
+            position = len(self.inprogress_prompts[entry["prompt_id"]].message_ids)
+            messages = entry["messages"] if entry["op"] == "messages" else [(entry["message_id"], entry["user_id"])]
+            for offset, (message_id, user_id) in enumerate(messages):
+                self.message_index[message_id] = (entry["prompt_id"], user_id, position + offset)
+
+        # Apply and persist the change in the partition holding the prompt
+        if entry["op"] == "start":
+            prompt_id = entry["prompt"]["prompt_id"]
+            guild_id = entry["prompt"]["guild_id"]
+            self.get_storage(guild_id)
+            self.prompt_partitions[prompt_id] = None if guild_id is None else int(guild_id)
+        else:
+            prompt_id = entry["prompt_id"]
+        guild_id = self.prompt_partitions[prompt_id]
+        apply_entry(self.partition_prompts[guild_id], entry)
+        self.partitions[guild_id].record(entry)
+
+        if entry["op"] == "start":
+            self.inprogress_prompts[prompt_id] = self.partition_prompts[guild_id][prompt_id]
+        elif entry["op"] == "remove":
+            self.inprogress_prompts.pop(prompt_id, None)
+            self.prompt_partitions.pop(prompt_id, None)
+
+        # Keep track of who the prompt is waiting on; only a new round or a whole new plan needs a full pass
+        if entry["op"] in ("start", "plan"):
+            prompt_round = self.inprogress_prompts[prompt_id]
+            self.pending[prompt_id] = prompt_round.expected_responders() - prompt_round.responses.keys()
+        elif entry["op"] == "recipient":
+            if entry["channel_id"] is None:
+                self.pending[prompt_id].discard(entry["user_id"])
+            elif entry["user_id"] not in self.inprogress_prompts[prompt_id].responses:
+                self.pending[prompt_id].add(entry["user_id"])
+        elif entry["op"] in ("message", "messages"):
+            prompt_round = self.inprogress_prompts[prompt_id]
+            if prompt_round.recipients is None:
+                # Rounds without a plan expect a response from everyone the prompt was delivered to
+                messages = entry["messages"] if entry["op"] == "messages" else [(entry["message_id"], entry["user_id"])]
+                self.pending[prompt_id].update(
+                    user_id for _, user_id in messages if user_id not in prompt_round.responses)
+        elif entry["op"] == "response":
+            self.pending[entry["prompt_id"]].discard(entry["user_id"])
+
+    def close(self):
+        """
+        Flushes pending prompt removals and closes the storage backends.
+        """
+        self.pool.flush()
+        for guild_id, storage in self.partitions.items():
+            if guild_id is not None:
+                storage.close()
+        self.storage.close()
 
-    def get_random_prompt(self):
+    def get_random_prompt(self, guild_id=None):
         """
         Selects a random prompt from the available prompt files and moves it to in-progress.
 
-        :return: A dictionary containing the filename and the selected prompt text.
-        """
-        # Get all JSON files in the prompts folder
-        files = [
-            f for f in os.listdir(self.PROMPTS_FOLDER)
-            if f.endswith(".json")
-        ]
-        if not files:
-            raise FileNotFoundError("No prompt files found in the prompts folder.")
-
-        # Randomly select a file
-        selected_file = random.choice(files)
-        file_path = os.path.join(self.PROMPTS_FOLDER, selected_file)
-
-        # Load prompts from the selected file
-        with open(file_path, "r") as f:
-            try:
-                prompts = json.load(f)
-                prompt_text = random.choice(prompts)
-                prompts.remove(prompt_text)
-
-            except json.JSONDecodeError:
-                raise ValueError(f"No prompts found in {selected_file}.")
-            
-        with open(file_path, "w") as f:
-            json.dump(prompts, f, indent=4)
-        # Load in-progress prompts
-
-        with open(self.INPROGRESS_PROMPTS_FILE, "r") as f:
-            try:
-                inprogress_prompts = json.load(f)
-            except json.JSONDecodeError:
-                raise ValueError("Failed to load in-progress prompts.")
-            
-        prompt_id = str(random.randint(100000, 999999))  # Generate a unique prompt ID
-        if prompt_id not in inprogress_prompts:
-            inprogress_prompts[prompt_id] = {}
-        inprogress_prompts[prompt_id] = {
-            "prompt_id": prompt_id,
-            "selected_file": selected_file,
-            "prompt_text": prompt_text,
-            "message_ids": {},
-            "responses": {}
-        }
-        with open(self.INPROGRESS_PROMPTS_FILE, "w") as f:
-            json.dump(inprogress_prompts, f, indent=4)
+        :param guild_id: The ID of the guild the prompt is sent to.
+        :return: The selected prompt text and the new prompt ID, or (None, None) if no prompts are left.
+        """
+        # Take a prompt from the pool; its removal from the file is written lazily
+        selected = self.pool.take()
+        if selected is None:
+            return None,None
+        selected_file, prompt_text = selected
+        self.catalog.invalidate(selected_file)
+        self.prompt_index.discard(prompt_text)
+        if self.similarity is not None:
+            self.similarity.discard(selected_file, prompt_text)
+
+        prompt_id = new_prompt_id()
+        self._record({
+            "op": "start",
+            "prompt": {
+                "prompt_id": prompt_id,
+                "guild_id": guild_id,
+                "selected_file": selected_file,
+                "prompt_text": prompt_text,
+                "started": time.time()
+            }
+        })
 
         return prompt_text,prompt_id
     
@@ -89,19 +257,135 @@ class PromptManager:
         :message_id: The ID of the message.
         :username: The username of the user.
         """
-        with open(self.INPROGRESS_PROMPTS_FILE, "r") as f:
-            inprogress_prompts = json.load(f)
-
-        if prompt_id in inprogress_prompts:
-            inprogress_prompts[prompt_id]["message_ids"][message_id] = {
-                "user_id": user_id,
+        if prompt_id in self.inprogress_prompts:
+            self._record({
+                "op": "message",
+                "prompt_id": prompt_id,
+                "message_id": int(message_id),
+                "user_id": int(user_id),
                 "timestamp": time.time()
-            }
-
-            with open(self.INPROGRESS_PROMPTS_FILE, "w") as f:
-                json.dump(inprogress_prompts, f, indent=4)
+            })
         else:
             raise ValueError("Prompt ID not found.")
+
+    def add_message_ids(self, prompt_id, deliveries):
+        """
+        Adds several delivered prompt messages to the in-progress prompt in one write.
+
+        :param prompt_id: The ID of the prompt.
+        :param deliveries: A list of (message_id, user_id) pairs.
+        """
+        if prompt_id not in self.inprogress_prompts:
+            raise ValueError("Prompt ID not found.")
+        if not deliveries:
+            return
+        self._record({
+            "op": "messages",
+            "prompt_id": prompt_id,
+            "messages": [(int(message_id), int(user_id)) for message_id, user_id in deliveries],
+            "timestamp": time.time()
+        })
+
+    def plan_delivery(self, prompt_id, recipients):
+        """
+        Records who a prompt is going to be delivered to before any message is sent,
+        so an interrupted delivery can be resumed.
+
+        :param prompt_id: The ID of the prompt.
+        :param recipients: A dictionary of user ID to the ID of their private channel.
+        """
+        if prompt_id not in self.inprogress_prompts:
+            raise ValueError("Prompt ID not found.")
+        self._record({
+            "op": "plan",
+            "prompt_id": prompt_id,
+            "recipients": [(int(user_id), channel_id) for user_id, channel_id in recipients.items()]
+        })
+
+    def add_recipient(self, prompt_id, user_id, channel_id):
+        """
+        Adds a member to the expected responders of a prompt, e.g. when they join mid-round.
+
+        :param prompt_id: The ID of the prompt.
+        :param user_id: The ID of the member.
+        :param channel_id: The ID of the member's private channel.
+        """
+        self._ensure_planned(self.get_prompt(prompt_id))
+        self._record({"op": "recipient", "prompt_id": prompt_id, "user_id": int(user_id), "channel_id": channel_id})
+
+    def _ensure_planned(self, prompt_round):
+        """
+        Gives a round started before deliveries were planned a plan of the members the
+        prompt was delivered to, so recipients can be added and removed one at a time
+        without dropping those members.
+        """
+        if prompt_round.recipients is not None:
+            return
+        guild_channels = self.get_storage(prompt_round.guild_id).load_private_channels().get(str(prompt_round.guild_id), {})
+        self._record({
+            "op": "plan",
+            "prompt_id": prompt_round.prompt_id,
+            # 0 if the member's channel isn't known; reminders then look it up in the channel registry
+            "recipients": [(user_id, guild_channels.get(str(user_id), 0)) for user_id in dict.fromkeys(prompt_round.message_users)]
+        })
+
+    def remove_recipient(self, prompt_id, user_id):
+        """
+        Removes a member from the expected responders of a prompt, e.g. when they leave mid-round.
+
+        :param prompt_id: The ID of the prompt.
+        :param user_id: The ID of the member.
+        :return: True if the prompt was waiting only on this member and is now complete.
+        """
+        prompt_round = self.get_prompt(prompt_id)
+        was_pending = bool(self.pending.get(prompt_id))
+        self._ensure_planned(prompt_round)
+        if int(user_id) not in prompt_round.recipients:
+            return False
+        self._record({"op": "recipient", "prompt_id": prompt_id, "user_id": int(user_id), "channel_id": None})
+        return was_pending and not self.pending[prompt_id] and bool(prompt_round.responses)
+
+    def record_reminders(self, prompt_id, reminders):
+        """
+        Records reminders sent to members who have not responded to a prompt.
+
+        :param prompt_id: The ID of the prompt.
+        :param reminders: A dictionary of user ID to the number of reminders they have now received.
+        """
+        if prompt_id not in self.inprogress_prompts:
+            raise ValueError("Prompt ID not found.")
+        self._record({
+            "op": "reminded",
+            "prompt_id": prompt_id,
+            "reminders": [(int(user_id), count) for user_id, count in reminders.items()]
+        })
+
+    def get_open_prompts(self, guild_id):
+        """
+        :param guild_id: The ID of the guild.
+        :return: The IDs of the in-progress prompts sent to the guild.
+        """
+        open_prompts = list(self.partition_prompts.get(int(guild_id), ()))
+        # Prompts recorded before guilds were partitioned may also belong to the guild
+        for prompt_id, prompt_round in self.partition_prompts.get(None, {}).items():
+            if prompt_round.guild_id == int(guild_id):
+                open_prompts.append(prompt_id)
+        return open_prompts
+
+    def get_undelivered(self, prompt_id):
+        """
+        Returns the planned recipients of a prompt that have no delivered message yet.
+
+        :param prompt_id: The ID of the prompt.
+        :return: A dictionary of user ID to private channel ID.
+        """
+        prompt_round = self.get_prompt(prompt_id)
+        delivered = set(prompt_round.message_users)
+        return {
+            user_id: channel_id
+            for user_id, channel_id in (prompt_round.recipients or {}).items()
+            if user_id not in delivered
+        }
         
     def move_prompt_to_used(self, prompt_id, comment_link):
         """
@@ -112,71 +396,92 @@ class PromptManager:
         :param thread_id: The ID of the thread where the prompt was used.
         :param thread_link: A link to the thread where the prompt was used.
         """
-        # Load in-progress prompts
-        with open(self.INPROGRESS_PROMPTS_FILE, "r") as f:
-            inprogress_prompts = json.load(f)
-
         # Remove the specific prompt from in-progress
-        if prompt_id in inprogress_prompts:
-            prompt_data = inprogress_prompts.pop(prompt_id)
+        if prompt_id in self.inprogress_prompts:
+            prompt_data = self.inprogress_prompts[prompt_id].to_dict()
             prompt_data["comment_link"] = comment_link
             prompt_data["timestamp"] = datetime.now(pytz.timezone("UTC")).strftime("%Y-%m-%d %H:%M:%S")
+            guild_id = self.prompt_partitions[prompt_id]
+            storage = self.partitions[guild_id]
 
-            # Save the updated in-progress prompts
-            with open(self.INPROGRESS_PROMPTS_FILE, "w") as f:
-                json.dump(inprogress_prompts, f, indent=4)
+            # Write the pool's pending removals first: only prompts of in-progress rounds are
+            # removed again on load, so a completed round's prompt must already be gone from its file
+            self.pool.flush()
 
-            # Load used prompts
-            with open(self.USED_PROMPTS_FILE, "r") as f:
-                used_prompts = json.load(f)
+            # Record the removal from in-progress
+            self._record({"op": "remove", "prompt_id": prompt_id})
 
-            # Add the prompt to the used prompts with extra data
-            if prompt_id not in used_prompts:
-                used_prompts[prompt_id] = []
-                
-            used_prompts[prompt_id] = prompt_data
-
-            # Save the updated used prompts
-            with open(self.USED_PROMPTS_FILE, "w") as f:
-                json.dump(used_prompts, f, indent=4)
+            # Add the prompt to the guild's used prompts with extra data
+            storage.archive_prompt(prompt_id, prompt_data)
+            if guild_id in self.analytics:
+                self.analytics[guild_id].add_rounds([(prompt_id, prompt_data)])
         else:
             raise ValueError("Prompt not found in in-progress prompts.")
 
-    def review_used_prompts(self):
+    def get_used_prompts_page(self, guild_id, page=0, per_page=10, selected_file=None, date=None):
+        """
+        Returns one page of a guild's used prompts, newest first. Only the records on
+        the page are read from storage.
+
+        :param guild_id: The guild whose used prompts to page through, or None for those recorded
+                         before guilds were partitioned.
+        :param page: The zero-based page number; out of range pages are clamped.
+        :param selected_file: Only include prompts from this prompt file.
+        :param date: Only include prompts used on this date ("YYYY-MM-DD").
+        :return: A (records, page, page_count) tuple, where records is a list of (prompt_id, prompt_data).
+        """
+        return self.get_storage(guild_id).get_used_prompts_page(page, per_page, selected_file, date)
+
+    def get_round_stats(self, guild_id, limit=10):
+        """
+        Computes statistics over a guild's completed rounds. The guild's used prompts
+        are read into a columnar view once; later rounds are appended as they complete.
+
+        :param guild_id: The ID of the guild, or None for state not tied to a guild.
+        :param limit: Number of members listed in the report.
+        :return: The report returned by RoundAnalytics.report.
         """
-        Returns a formatted string of all used prompts for review.
+        guild_id = None if guild_id is None else int(guild_id)
+        analytics = self.analytics.get(guild_id)
+        if analytics is None:
+            analytics = self.analytics[guild_id] = RoundAnalytics()
+            analytics.add_rounds(self.get_storage(guild_id).load_used_prompts().items())
+        return analytics.report(limit)
+
+    def review_used_prompts(self, guild_id=None, page=0, per_page=10):
+        """
+        Returns a formatted page of used prompts for review.
 
+        :param guild_id: The guild whose used prompts to review, or None for those recorded
+                         before guilds were partitioned.
+        :param page: The zero-based page to review.
         :return: A string containing the review of used prompts.
         """
-        # Load used prompts
-        with open(self.USED_PROMPTS_FILE, "r") as f:
-            used_prompts = json.load(f)
+        used_prompts, page, page_count = self.get_used_prompts_page(guild_id, page, per_page)
 
         if not used_prompts:
             return "No used prompts available."
 
         # Format the used prompts beautifully
-        review_message = "Used Prompts:\n"
-        for prompt_id, prompts in used_prompts.items():
-            for prompt_data in prompts:
-                review_message += (
-                    f"- **Prompt:** {prompt_data['prompt']}\n"
-                    f"  **Origin File:** {prompt_data['selected_file']}\n"
-                    f"  **Comment Link:** {prompt_data['comment_link']}\n"
-                )
+        review_message = f"Used Prompts (page {page + 1}/{page_count}):\n"
+        for prompt_id, prompt_data in used_prompts:
+            review_message += (
+                f"- **Prompt:** {prompt_data['prompt_text']}\n"
+                f"  **Origin File:** {prompt_data['selected_file']}\n"
+                f"  **Comment Link:** {prompt_data.get('comment_link')}\n"
+                f"  **Used:** {prompt_data.get('timestamp')}\n"
+            )
         return review_message
+
     def get_prompt(self, prompt_id):
         """
         Retrieves a specific prompt by its ID.
 
         :param prompt_id: The ID of the prompt to retrieve.
-        :return: The prompt text and metadata.
+        :return: The prompt's Round.
         """
-        with open(self.INPROGRESS_PROMPTS_FILE, "r") as f:
-            inprogress_prompts = json.load(f)
-
-        if prompt_id in inprogress_prompts:
-            return inprogress_prompts[prompt_id]
+        if prompt_id in self.inprogress_prompts:
+            return self.inprogress_prompts[prompt_id]
         else:
             raise ValueError(f"Prompt ID '{prompt_id}' not found.")
     def get_prompt_by_message_id(self, message_id):
@@ -184,16 +489,33 @@ class PromptManager:
         Retrieves a prompt by its message ID.
 
         :param message_id: The message ID to search for.
-        :return: The prompt text and metadata.
+        :return: The prompt ID and its Round, or (None, None) if the message is not a prompt.
+        """
+        indexed = self.message_index.get(int(message_id))
+        if indexed is None:
+            return None,None
+        prompt_id = indexed[0]
+        return prompt_id,self.inprogress_prompts[prompt_id]
+
+    def get_delivery_time(self, message_id):
+        """
+        :param message_id: The ID of a delivered prompt message.
+        :return: When the message was delivered, or None if it is not a prompt message.
+        """
+        indexed = self.message_index.get(int(message_id))
+        if indexed is None:
+            return None
+        prompt_id, _, position = indexed
+        return self.inprogress_prompts[prompt_id].message_times[position]
+
+    def is_prompt_message(self, message_id):
         """
-        with open(self.INPROGRESS_PROMPTS_FILE, "r") as f:
-            inprogress_prompts = json.load(f)
+        Checks whether a message ID belongs to an in-progress prompt without touching disk.
 
-        for prompt_id, prompt_data in inprogress_prompts.items():
-            if str(message_id) in prompt_data["message_ids"]:
-                print("message_id:",message_id, " prompt_id:",prompt_id)
-                return prompt_id,prompt_data
-        return None,None
+        :param message_id: The message ID to check.
+        :return: True if the message is a delivered prompt awaiting responses.
+        """
+        return int(message_id) in self.message_index
         
     def write_prompt(self, filename, prompt_text):
         """
@@ -201,25 +523,49 @@ class PromptManager:
 
         :param filename: The name of the file (without path) to write the prompt to.
         :param prompt_text: The prompt string to be added.
+        :return: True if the prompt was added, False if the library already has it.
         """
-        file_path = os.path.join(self.PROMPTS_FOLDER, filename)
-
-        # Ensure the file exists
-        if not os.path.exists(file_path):
-            with open(file_path, "w") as f:
-                json.dump([], f)
-
-        # Load existing prompts
-        with open(file_path, "r") as f:
-            prompts = json.load(f)
-
-        # Add the new prompt
-        if prompt_text not in prompts:
-            prompts.append(prompt_text)
+        return self.import_prompts(filename, [prompt_text])["added"] == 1
 
-        # Save the updated prompts
-        with open(file_path, "w") as f:
-            json.dump(prompts, f, indent=4)
+    def import_prompts(self, filename, prompt_texts):
+        """
+        Adds prompts to a prompt file with a single write, creating the file if needed.
+        Prompts are normalized (see normalize_prompt) and skipped if they are empty,
+        too long, or already in any prompt file, ignoring case and whitespace.
+
+        :param filename: The name of the file (without path) to add the prompts to.
+        :param prompt_texts: Iterable of prompt texts; None entries count as invalid.
+        :return: A dictionary counting the prompts "added", the "duplicates" of prompts
+                 already in the library, those "repeated" within prompt_texts, and the
+                 "invalid" ones.
+        """
+        summary = {"added": 0, "duplicates": 0, "repeated": 0, "invalid": 0}
+        added = []
+        seen = set()
+        for prompt_text in prompt_texts:
+            prompt_text = normalize_prompt(prompt_text) if isinstance(prompt_text, str) else ""
+            if not prompt_text or len(prompt_text) > self.MAX_PROMPT_LENGTH:
+                summary["invalid"] += 1
+                continue
+            digest = prompt_hash(prompt_text)
+            if digest in seen:
+                summary["repeated"] += 1
+            elif self.prompt_index.find(prompt_text) is not None:
+                summary["duplicates"] += 1
+            else:
+                seen.add(digest)
+                added.append(prompt_text)
+
+        if added:
+            self.storage.add_prompts(filename, added)
+            self.pool.add_file(filename, added)
+            self.catalog.invalidate(filename)
+            self.prompt_index.add(filename, added)
+            self.prompt_index.save()
+            if self.similarity is not None:
+                self.similarity.add(filename, added)
+        summary["added"] = len(added)
+        return summary
 
     def add_response(self, prompt_id, user_id, response):
         """
@@ -228,67 +574,140 @@ class PromptManager:
         :param prompt_id: The ID of the prompt.
         :param username: The username of the user responding to the prompt.
         :param response: The response text provided by the user.
+        :return: True if this response completed the prompt. This is returned only once per prompt.
         """
-        with open(self.INPROGRESS_PROMPTS_FILE, "r") as f:
-            inprogress_prompts = json.load(f)
-
-        if prompt_id in inprogress_prompts:
-            inprogress_prompts[prompt_id]["responses"][user_id] =  response
-            
-            with open(self.INPROGRESS_PROMPTS_FILE, "w") as f:
-                json.dump(inprogress_prompts, f, indent=4)
+        if prompt_id in self.inprogress_prompts:
+            user_id = int(user_id)
+            was_pending = bool(self.pending.get(prompt_id))
+            self._record({
+                "op": "response",
+                "prompt_id": prompt_id,
+                "user_id": user_id,
+                "response": response,
+                "timestamp": time.time()
+            })
+            return was_pending and not self.pending[prompt_id]
         else:
             raise ValueError("Prompt ID not found.")
 
-    def all_responses_collected(self, prompt_id, guild_members):
+    def all_responses_collected(self, prompt_id, guild_members=None):
 
-        """Compares sorted lists of usernames from message_ids and responses for a given prompt_id.
+        """Checks whether every expected responder has responded to a given prompt_id.
 
-        :param prompt_id: The ID of the prompt to compare.
-        :return: True if the sorted lists of usernames are the same, False otherwise.
+        :param prompt_id: The ID of the prompt to check.
+        :param guild_members: Unused; completion is tracked as responses are added.
+        :return: True if no expected responder is still pending, False otherwise.
         """
-        with open(self.INPROGRESS_PROMPTS_FILE, "r") as f:
-            inprogress_prompts = json.load(f)
-
-        if prompt_id not in inprogress_prompts:
+        if prompt_id not in self.inprogress_prompts:
             raise ValueError(f"Prompt ID '{prompt_id}' not found.")
 
-        prompt_data = inprogress_prompts[prompt_id]
-        for member in guild_members:
-            if member.bot:
-                continue
-            if str(member.id) not in prompt_data["responses"]:
-                return False
-        return True
+        return not self.pending[prompt_id]
 
-    def get_notifications(self):
+    def get_pending_responders(self, prompt_id):
         """
-        Retrieves notification preferences for users.
+        :param prompt_id: The ID of the prompt.
+        :return: The user IDs that have not responded yet.
+        """
+        return set(self.pending.get(prompt_id, ()))
+
+    def get_notifications(self, guild_id=None):
         """
-        notifications_file = os.path.join(os.path.dirname(__file__), "notifications.json")
-        with open(notifications_file, "r") as f:
-            return json.load(f)
+        Retrieves notification preferences for users of a guild. Preferences recorded
+        before guilds were partitioned apply to every guild unless overridden.
+
+        :param guild_id: The ID of the guild.
+        :return: A dictionary of user ID (as a string) to preference, cached per guild.
+        """
+        guild_id = None if guild_id is None else int(guild_id)
+        if guild_id not in self.notifications:
+            notifications = dict(self.storage.load_notifications())
+            if guild_id is not None:
+                notifications.update(self.get_storage(guild_id).load_notifications())
+            self.notifications[guild_id] = notifications
+        return self.notifications[guild_id]
+
+    def get_notification(self, guild_id, user_id):
+        """
+        :return: True if the user wants to be mentioned when prompts are sent in the guild.
+        """
+        return self.get_notifications(guild_id).get(str(user_id)) == True
+
+    def set_notification(self, guild_id, user_id, enabled):
+        """
+        Stores a user's notification preference for a guild.
+
+        :param guild_id: The ID of the guild.
+        :param user_id: The ID of the user.
+        :param enabled: Whether the user wants to be mentioned when prompts are sent.
+        """
+        self.get_notifications(guild_id)[str(user_id)] = enabled
+        self.get_storage(guild_id).set_notification(str(user_id), enabled)
+
+    def set_private_channel(self, guild_id, member_id, channel_id):
+        """
+        Stores a member's private channel, or forgets it if channel_id is None.
+        """
+        self.get_storage(guild_id).set_private_channel(guild_id, member_id, channel_id)
+
+    def get_schedules(self):
+        """
+        :return: The round schedules of the guilds this process handles, keyed by guild ID.
+        """
+        schedules = {}
+        for guild_id in self.storage.list_guilds():
+            if self.owns_guild(guild_id):
+                schedule = self.get_storage(guild_id).load_schedule()
+                if schedule:
+                    schedules[guild_id] = schedule
+        return schedules
+
+    def set_schedule(self, guild_id, schedule):
+        """
+        Stores a guild's round schedule, or removes it if schedule is None.
+        """
+        self.get_storage(guild_id).set_schedule(schedule)
+
+    def get_similarity_index(self):
+        """
+        Returns the near-duplicate index of the library, building it on first use.
+        """
+        if self.similarity is None:
+            similarity = SimilarityIndex(threshold=self.similarity_threshold)
+            similarity.add_entries(list(self.pool.entries.items))
+            self.similarity = similarity
+        return self.similarity
+
+    def find_similar_prompts(self, prompt_text, limit=3):
+        """
+        Finds library prompts that are near-duplicates of a prompt.
+
+        :return: Up to limit (similarity, file name, prompt text) tuples, most similar first.
+        """
+        return self.get_similarity_index().find_similar(normalize_prompt(prompt_text), limit)
+
+    def find_duplicate_prompts(self):
+        """
+        Scans the whole library for pairs of near-duplicate prompts.
+
+        :return: A list of (similarity, (file name, prompt text), (file name, prompt text)), most similar first.
+        """
+        return self.get_similarity_index().scan()
 
     def create_prompt_file(self, file_name):
         """
         Creates a new prompt file.
         """
-        file_path = os.path.join(self.PROMPTS_FOLDER, file_name)
-        if os.path.exists(file_path):
-            return False
-
-        with open(file_path, "w") as f:
-            json.dump([], f)
-        return True
+        created = self.storage.create_prompt_file(file_name)
+        if created:
+            self.pool.add_file(file_name)
+            self.catalog.invalidate(file_name)
+        return created
 
     def list_prompt_files(self):
         """
         Lists all available prompt files.
         """
-        return [
-            f for f in os.listdir(self.PROMPTS_FOLDER)
-            if f.endswith(".json")
-        ]
+        return list(self.pool.files)
 
     def get_prompt_count(self, file_name):
         """
@@ -297,9 +716,5 @@ class PromptManager:
         :param file_name: The name of the file to count prompts in.
         :return: The count of prompts in the file.
         """
-        file_path = os.path.join(self.PROMPTS_FOLDER, file_name)
-        with open(file_path, "r") as f:
-            prompts = json.load(f)
-
-        return len(prompts)
+        return self.pool.count(file_name)
 
@@ -0,0 +1,166 @@
+import random
+
+
+class _PromptBucket:
+    """
+    The prompts of a single file, stored so that sampling and removal are both O(1).
+    """
+
+    def __init__(self, prompts=()):
+        self.items = []  # Prompt texts, in no particular order, for random indexing
+        self.positions = {}  # Prompt text -> index in items; keeps the file's order for saving
+        for prompt_text in prompts:
+            self.add(prompt_text)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, prompt_text):
+        return prompt_text in self.positions
+
+    def add(self, prompt_text):
+        if prompt_text in self.positions:
+            return False
+        self.positions[prompt_text] = len(self.items)
+        self.items.append(prompt_text)
+        return True
+
+    def remove(self, prompt_text):
+        # Swap the last item into the removed slot so the list never shifts
+        index = self.positions.pop(prompt_text, None)
+        if index is None:
+            return False
+        last = self.items.pop()
+        if index < len(self.items):
+            self.items[index] = last
+            self.positions[last] = index
+        return True
+
+    def choice(self):
+        return random.choice(self.items)
+
+
+class PromptPool:
+    """
+    In-memory index of every available prompt, grouped by prompt file.
+
+    Prompts can be sampled uniformly across the whole library, by picking a file
+    first, or with per-file weights. Files without prompts are never picked.
+    Removals are applied in memory immediately and written to storage in batches.
+    """
+
+    def __init__(self, storage, sampling="uniform", flush_every=10):
+        """
+        :param storage: The storage backend holding the prompt files.
+        :param sampling: "uniform" to give every prompt the same chance, "file" to pick a
+                         file uniformly and then a prompt from it, or a dictionary of
+                         file name to weight for weighted file selection.
+        :param flush_every: Number of removals kept in memory before they are written to storage.
+        """
+        self.storage = storage
+        self.sampling = sampling
+        self.flush_every = flush_every
+        self.files = {}  # File name -> _PromptBucket
+        self.entries = _PromptBucket()  # (file name, prompt text) pairs across all files
+        self.non_empty = _PromptBucket()  # Names of files that still have prompts
+        self.pending_removals = {}  # File name -> prompts removed but not yet written
+        self.pending_count = 0
+
+        for file_name in storage.list_prompt_files():
+            self.add_file(file_name, storage.load_prompts(file_name))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add_file(self, file_name, prompts=()):
+        """
+        Adds a prompt file (and its prompts) to the pool.
+        """
+        self.files.setdefault(file_name, _PromptBucket())
+        for prompt_text in prompts:
+            self.add(file_name, prompt_text)
+
+    def add(self, file_name, prompt_text):
+        """
+        Adds a prompt to the pool.
+
+        :return: True if the prompt was added, False if the file already had it.
+        """
+        bucket = self.files.setdefault(file_name, _PromptBucket())
+        if not bucket.add(prompt_text):
+            return False
+        self.entries.add((file_name, prompt_text))
+        self.non_empty.add(file_name)
+        return True
+
+    def discard(self, file_name, prompt_text):
+        """
+        Removes a prompt from the pool without scheduling a storage write.
+
+        :return: True if the prompt was in the pool.
+        """
+        bucket = self.files.get(file_name)
+        if bucket is None or not bucket.remove(prompt_text):
+            return False
+        self.entries.remove((file_name, prompt_text))
+        if not bucket:
+            self.non_empty.remove(file_name)
+        return True
+
+    def count(self, file_name):
+        bucket = self.files.get(file_name)
+        return len(bucket) if bucket else 0
+
+    def sample(self):
+        """
+        Picks a random prompt according to the sampling mode.
+
+        :return: A (file name, prompt text) pair, or None if no prompts are left.
+        """
+        if not self.entries:
+            return None
+        if self.sampling == "uniform":
+            return self.entries.choice()
+        if self.sampling == "file":
+            file_name = self.non_empty.choice()
+        else:
+            files = self.non_empty.items
+            weights = [self.sampling.get(file_name, 1) for file_name in files]
+            file_name = random.choices(files, weights=weights)[0]
+        return file_name, self.files[file_name].choice()
+
+    def take(self):
+        """
+        Picks a random prompt and removes it from the pool. The removal is written to
+        storage once flush_every removals have accumulated, or on flush() (called when
+        a round completes).
+
+        :return: A (file name, prompt text) pair, or None if no prompts are left.
+        """
+        selected = self.sample()
+        if selected is not None:
+            self.remove(*selected)
+        return selected
+
+    def remove(self, file_name, prompt_text):
+        """
+        Removes a prompt from the pool and schedules its removal from storage.
+
+        :return: True if the prompt was in the pool.
+        """
+        if not self.discard(file_name, prompt_text):
+            return False
+        self.pending_removals.setdefault(file_name, []).append(prompt_text)
+        self.pending_count += 1
+        if self.pending_count >= self.flush_every:
+            self.flush()
+        return True
+
+    def flush(self):
+        """
+        Writes pending removals to storage, one write per file.
+        """
+        for file_name, prompts in self.pending_removals.items():
+            self.storage.remove_prompts(file_name, prompts)
+        self.pending_removals = {}
+        self.pending_count = 0
@@ -0,0 +1,298 @@
+import re
+import numpy as np
+
+WORD_PATTERN = re.compile(r"[\w']+")  # Prompts are compared as sets of adjacent word pairs of their casefolded words
+
+
+def _fmix32(values):
+    # MurmurHash3's finalizer, so nearby codes get unrelated hashes
+    values = values ^ (values >> np.uint32(16))
+    values = values * np.uint32(0x85EBCA6B)
+    values = values ^ (values >> np.uint32(13))
+    values = values * np.uint32(0xC2B2AE35)
+    return values ^ (values >> np.uint32(16))
+
+
+def shingle_hashes(prompt_texts, vocabulary):
+    """
+    Computes the shingle hashes of many prompts at once.
+
+    Each word is replaced by its code in vocabulary (new words are added), the
+    codes of all prompts are joined into a single array, and every pair of
+    adjacent codes is hashed into one 32-bit value. Pairs crossing from one prompt
+    into the next are dropped, and a prompt of a single word is its own shingle.
+
+    :param vocabulary: Dictionary of word to code, shared by every call on the same index.
+    :return: A (hashes, starts, counts) tuple: the distinct uint32 shingle hashes of all
+             prompts back to back (sorted within each prompt), and the offset and number
+             of each prompt's hashes.
+    """
+    codes = []
+    lengths = np.zeros(len(prompt_texts), dtype=np.int64)
+    for i, prompt_text in enumerate(prompt_texts):
+        words = WORD_PATTERN.findall(prompt_text.casefold())
+        codes.extend(vocabulary.setdefault(word, len(vocabulary)) for word in words)
+        lengths[i] = len(words)
+    codes = np.array(codes, dtype=np.uint32)
+    ends = np.cumsum(lengths)
+    owners = np.repeat(np.arange(len(prompt_texts)), lengths)
+
+    # A shingle starts at every word but the last of each prompt, or at the only word of one-word prompts
+    positions = np.arange(len(codes))
+    starts = positions[(positions + 1 < ends[owners]) | (lengths[owners] == 1)]
+    following = np.minimum(starts + 1, len(codes) - 1)
+    second = np.where(starts + 1 < ends[owners[starts]], codes[following], np.uint32(0xFFFFFFFF))
+    hashes = _fmix32(_fmix32(codes[starts]) ^ second)
+
+    # Keep each prompt's distinct hashes, sorted, so shingle sets can be intersected
+    keys = np.unique((owners[starts].astype(np.uint64) << np.uint64(32)) | hashes.astype(np.uint64))
+    hashes = (keys & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+    counts = np.bincount((keys >> np.uint64(32)).astype(np.int64), minlength=len(prompt_texts))
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1])) if len(counts) else counts
+    return hashes, offsets, counts
+
+
+class SimilarityIndex:
+    """
+    MinHash index of the prompt library for finding near-duplicate prompts.
+
+    Prompts are compared by containment: the share of the shorter prompt's word
+    pairs that also appear in the other, so a prompt that restates or extends
+    another one scores high even when the longer one adds a lot of text.
+
+    Each prompt gets a signature of num_perm minimum hashes over its shingles; the
+    share of equal values between two signatures estimates the Jaccard similarity
+    of the prompts' shingle sets. Signatures are cut into bands, and prompts that
+    agree on a whole band become candidates (locality-sensitive hashing), so both
+    lookups and the full library scan only compare likely matches. With bands of
+    two rows, pairs with a Jaccard similarity of 0.15 (a containment around 0.4
+    between prompts of different lengths) almost always become candidates.
+    Candidates are then scored exactly against the prompts' shingle sets.
+
+    Word pairs found in a large share of the library when it is first indexed
+    (openers such as "what's a") are left out of the signatures, so prompts that
+    only share a common phrase don't all become candidates of each other; they
+    still count when candidates are scored. Signatures, band keys and shingles
+    live in NumPy arrays, and hashing and scoring are vectorized.
+    """
+
+    def __init__(self, num_perm=256, bands=128, threshold=0.4, seed=1, common_share=0.002, common_min=100):
+        """
+        :param num_perm: Number of hash values in a signature.
+        :param bands: Number of LSH bands; num_perm must be divisible by it.
+        :param threshold: Containment (0-1) from which prompts are reported.
+        :param seed: Seed of the hash masks, so signatures are the same in every run.
+        :param common_share: Share of the library above which a word pair is left out of signatures.
+        :param common_min: Number of prompts a word pair must at least be in to be left out.
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands.")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.masks = np.random.default_rng(seed).integers(0, 2 ** 32, num_perm, dtype=np.uint32)
+        self.vocabulary = {}  # Word -> code
+        self.common_share = common_share
+        self.common_min = common_min
+        self.common = None  # Sorted hashes left out of signatures; fixed when the index is first filled
+
+        self.entries = []  # Row -> (file name, prompt text)
+        self.rows_by_entry = {}  # (file name, prompt text) -> row
+        self.shingles = []  # Row -> sorted distinct shingle hashes
+        self.signatures = np.zeros((0, num_perm), dtype=np.uint32)
+        self.band_keys = np.zeros((0, bands), dtype=np.uint64)
+        self.sizes = np.zeros(0, dtype=np.int64)  # Number of distinct shingles of each row
+        self.alive = np.zeros(0, dtype=bool)  # Rows of prompts still in the library
+        self.size = 0  # Rows in use; the arrays grow by doubling
+
+    def __len__(self):
+        return len(self.rows_by_entry)
+
+    def signatures_for(self, prompt_texts, chunk_size=10000):
+        """
+        :return: A (signatures, shingles) tuple: a (len(prompt_texts), num_perm) array of
+                 MinHash signatures, and each prompt's shingle hashes. Prompts without
+                 words get a signature that matches nothing.
+        """
+        signatures = np.full((len(prompt_texts), self.num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+        shingles = []
+        for chunk_start in range(0, len(prompt_texts), chunk_size):
+            hashes, starts, counts = shingle_hashes(prompt_texts[chunk_start:chunk_start + chunk_size], self.vocabulary)
+            shingles.extend(hashes[start:start + count] for start, count in zip(starts, counts))
+            if self.common is not None and len(self.common):
+                # Leave common word pairs out, unless a prompt has nothing else
+                owners = np.repeat(np.arange(len(counts)), counts)
+                keep = ~np.isin(hashes, self.common, assume_unique=False)
+                kept = np.bincount(owners[keep], minlength=len(counts))
+                keep |= (kept == 0)[owners]
+                hashes, owners = hashes[keep], owners[keep]
+                counts = np.bincount(owners, minlength=len(counts))
+                starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            has_shingles = np.flatnonzero(counts)
+            if not len(has_shingles):
+                continue
+            rows = chunk_start + has_shingles
+            for i, mask in enumerate(self.masks):
+                # One hash function per mask: the minimum of each prompt's hashes xor the mask
+                signatures[rows, i] = np.minimum.reduceat(hashes ^ mask, starts[has_shingles])
+        return signatures, shingles
+
+    def _band_keys(self, signatures):
+        # Folds each band's values into one 64-bit key (FNV-1a style; overflow wraps around)
+        keys = np.full((len(signatures), self.bands), 0xCBF29CE484222325, dtype=np.uint64)
+        banded = signatures.reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        for row in range(self.rows):
+            keys = (keys ^ banded[:, :, row]) * np.uint64(0x100000001B3)
+        return keys
+
+    def _append(self, entries, signatures, shingles):
+        needed = self.size + len(entries)
+        if needed > len(self.alive):
+            capacity = max(needed, 2 * len(self.alive), 1024)
+            self.signatures = np.resize(self.signatures, (capacity, self.num_perm))
+            self.band_keys = np.resize(self.band_keys, (capacity, self.bands))
+            self.sizes = np.resize(self.sizes, capacity)
+            self.alive = np.concatenate((self.alive[:self.size], np.zeros(capacity - self.size, dtype=bool)))
+        rows = slice(self.size, needed)
+        self.signatures[rows] = signatures
+        self.band_keys[rows] = self._band_keys(signatures)
+        self.sizes[rows] = [len(hashes) for hashes in shingles]
+        self.alive[rows] = self.sizes[rows] > 0  # Prompts without words match nothing
+        for row, entry in enumerate(entries, self.size):
+            previous = self.rows_by_entry.get(entry)
+            if previous is not None:
+                self.alive[previous] = False
+            self.rows_by_entry[entry] = row
+        self.entries.extend(entries)
+        self.shingles.extend(shingles)
+        self.size = needed
+
+    def add(self, file_name, prompt_texts):
+        """
+        Indexes prompts added to a file.
+        """
+        self.add_entries([(file_name, prompt_text) for prompt_text in prompt_texts])
+
+    def add_entries(self, entries):
+        """
+        Indexes many prompts at once, e.g. the whole library.
+
+        :param entries: A list of (file name, prompt text) pairs.
+        """
+        if not entries:
+            return
+        prompt_texts = [prompt_text for _, prompt_text in entries]
+        if self.common is None:
+            # The first (usually whole-library) batch decides which word pairs are too common to
+            # tell prompts apart; it is kept fixed so all signatures are computed the same way
+            hashes, _, _ = shingle_hashes(prompt_texts, self.vocabulary)
+            values, frequencies = np.unique(hashes, return_counts=True)
+            self.common = values[frequencies > max(self.common_min, self.common_share * len(entries))]
+        self._append(entries, *self.signatures_for(prompt_texts))
+
+    def discard(self, file_name, prompt_text):
+        """
+        Forgets a prompt that left the library.
+        """
+        row = self.rows_by_entry.pop((file_name, prompt_text), None)
+        if row is not None:
+            self.alive[row] = False
+
+    @staticmethod
+    def containment(first, second):
+        """
+        :param first: Sorted distinct shingle hashes of one prompt.
+        :param second: Sorted distinct shingle hashes of another prompt.
+        :return: The share of the smaller set's shingles found in the other (0-1).
+        """
+        if not len(first) or not len(second):
+            return 0.0
+        shared = len(np.intersect1d(first, second, assume_unique=True))
+        return shared / min(len(first), len(second))
+
+    def find_similar(self, prompt_text, limit=5):
+        """
+        Finds the library prompts most similar to a prompt.
+
+        :return: Up to limit (similarity, file name, prompt text) tuples at or above the
+                 threshold, most similar first. Similarities are containments (0-1).
+        """
+        if not self.size:
+            return []
+        signature, (shingles,) = self.signatures_for([prompt_text])
+        if not len(shingles):
+            return []
+        keys = self._band_keys(signature)[0]
+        candidates = np.flatnonzero(
+            (self.band_keys[:self.size] == keys).any(axis=1) & self.alive[:self.size])
+        results = []
+        for row in candidates:
+            similarity = self.containment(shingles, self.shingles[row])
+            if similarity >= self.threshold:
+                results.append((similarity, *self.entries[row]))
+        results.sort(key=lambda result: -result[0])
+        return results[:limit]
+
+    def _containments(self, pairs, chunk_size=65536):
+        # Exact containment of each pair of rows. The shingles of both rows of a chunk of
+        # pairs are tagged with the pair's index and sorted together; since each row's
+        # shingles are distinct, a value occurring twice is a shingle the rows share.
+        flat = np.concatenate(self.shingles[:self.size]).astype(np.uint64)
+        offsets = np.concatenate(([0], np.cumsum(self.sizes[:self.size])[:-1]))
+        containments = np.empty(len(pairs))
+        for start in range(0, len(pairs), chunk_size):
+            chunk = pairs[start:start + chunk_size]
+            rows = chunk.ravel()
+            counts = self.sizes[rows]
+            owners = np.repeat(np.arange(len(rows)) // 2, counts)
+            # Position of every gathered shingle in flat: its row's offset plus its place in the row
+            positions = np.repeat(offsets[rows] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            keys = np.sort((owners.astype(np.uint64) << np.uint64(32)) | flat[positions])
+            shared = keys[1:][keys[1:] == keys[:-1]] >> np.uint64(32)
+            shared = np.bincount(shared.astype(np.int64), minlength=len(chunk))
+            containments[start:start + chunk_size] = shared / np.minimum(counts[0::2], counts[1::2])
+        return containments
+
+    def scan(self, max_bucket=50):
+        """
+        Finds every pair of near-duplicate prompts in the library.
+
+        For each band, the rows are sorted by band key so that rows with equal keys
+        are adjacent, and each row is paired with the rows after it in its bucket.
+        The candidate pairs of all bands are then deduplicated and scored exactly.
+        In buckets larger than max_bucket (many prompts sharing a phrase that wasn't
+        common when the index was filled), rows are only paired with the next
+        max_bucket - 1 rows, so a degenerate bucket can't produce millions of pairs.
+
+        :return: A list of (similarity, (file name, prompt text), (file name, prompt text)),
+                 most similar first.
+        """
+        rows = np.flatnonzero(self.alive[:self.size])
+        if len(rows) < 2:
+            return []
+        candidates = []
+        for band in range(self.bands):
+            keys = self.band_keys[rows, band]
+            order = np.argsort(keys, kind="stable")
+            sorted_keys = keys[order]
+            for distance in range(1, max_bucket):
+                same = np.flatnonzero(sorted_keys[distance:] == sorted_keys[:-distance])
+                if not len(same):
+                    break  # No bucket has more than distance rows
+                first, second = rows[order[same]], rows[order[same + distance]]
+                # One int64 per pair (lower row first), so pairs found in several bands are deduplicated cheaply
+                candidates.append(np.minimum(first, second) * self.size + np.maximum(first, second))
+        if not candidates:
+            return []
+
+        candidates = np.unique(np.concatenate(candidates))
+        pairs = np.column_stack((candidates // self.size, candidates % self.size))
+        containments = self._containments(pairs)
+        results = [
+            (similarity, self.entries[first], self.entries[second])
+            for similarity, (first, second) in zip(containments.tolist(), pairs.tolist())
+            if similarity >= self.threshold
+        ]
+        results.sort(key=lambda result: -result[0])
+        return results
@@ -0,0 +1,109 @@
+import asyncio
+import discord
+
+
+class GuildProvisioner:
+    """
+    Creates the shared channels and one private channel per member for a guild.
+
+    The desired channels are compared with the existing ones once, and only the
+    missing ones are created, concurrently and under a bounded semaphore so the
+    requests stay within Discord's rate limits (discord.py waits out any 429s).
+    Running it again only creates what is still missing, so an interrupted run
+    can simply be repeated.
+    """
+
+    SHARED_CHANNELS = ["general", "responses", "add-prompts", "bot-messages"]
+
+    def __init__(self, registry, welcome, concurrency=5, fetch_members=False):
+        """
+        :param registry: The PrivateChannelRegistry to record created channels in.
+        :param welcome: Coroutine function (channel, member) posting the welcome message in a new private channel.
+        :param concurrency: Maximum number of channel creations in flight at once.
+        :param fetch_members: Page through the guild's member list from the API instead of
+                              reading the member cache, which is off in lean mode.
+        """
+        self.registry = registry
+        self.welcome = welcome
+        self.concurrency = concurrency
+        self.fetch_members = fetch_members
+
+    @staticmethod
+    def private_channel_name(member):
+        return f"{member.name.replace('.', '')}-private"
+
+    async def _members(self, guild):
+        if self.fetch_members:
+            async for member in guild.fetch_members(limit=None):
+                yield member
+        else:
+            for member in guild.members:
+                yield member
+
+    async def plan(self, guild):
+        """
+        Works out which channels are missing.
+
+        Private channels that exist but are not in the registry yet (e.g. created
+        just before a restart) are adopted rather than created again.
+
+        :return: A (missing shared channel names, members without a private channel) pair.
+        """
+        self.registry.build(guild)
+        existing = set()
+        for channel in guild.text_channels:
+            existing.add(channel.name)
+            if self.registry.is_private_channel(channel) and channel.id not in self.registry.owners:
+                self.registry.update_channel(channel)
+
+        missing_shared = [name for name in self.SHARED_CHANNELS if name not in existing]
+        missing_members = [
+            member async for member in self._members(guild)
+            if not member.bot and not self.registry.get_channel(guild, member.id)
+        ]
+        return missing_shared, missing_members
+
+    async def create_private_channel(self, guild, member):
+        """
+        Creates a member's private channel, registers it and posts the welcome message.
+
+        :return: The new channel.
+        """
+        overwrites = {
+            guild.default_role: discord.PermissionOverwrite(read_messages=False),
+            member: discord.PermissionOverwrite(read_messages=True),
+            guild.me: discord.PermissionOverwrite(read_messages=True),
+        }
+        channel = await guild.create_text_channel(self.private_channel_name(member), overwrites=overwrites)
+        self.registry.register(guild.id, member.id, channel.id)
+        await self.welcome(channel, member)
+        return channel
+
+    async def provision(self, guild, progress=None):
+        """
+        Creates every missing shared and private channel.
+
+        :param guild: The guild to provision.
+        :param progress: Optional coroutine function (done, total) called after each channel is created.
+        :return: A (created, failed) pair of counts.
+        """
+        missing_shared, missing_members = await self.plan(guild)
+        total = len(missing_shared) + len(missing_members)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        counts = {"created": 0, "failed": 0}
+
+        async def run(create):
+            async with semaphore:
+                try:
+                    await create
+                    counts["created"] += 1
+                except discord.HTTPException as e:
+                    counts["failed"] += 1
+                    print(f"Failed to create a channel in {guild.name}: {e}")
+            if progress:
+                await progress(counts["created"] + counts["failed"], total)
+
+        # Shared channels first, so "general" and "responses" exist before members are welcomed
+        await asyncio.gather(*(run(guild.create_text_channel(name)) for name in missing_shared))
+        await asyncio.gather(*(run(self.create_private_channel(guild, member)) for member in missing_members))
+        return counts["created"], counts["failed"]
@@ -0,0 +1,130 @@
+import asyncio
+import heapq
+import time
+
+
+class ReminderEngine:
+    """
+    Reminds members who have not responded to a prompt.
+
+    Every outstanding (prompt, member) reminder is one entry in a heap ordered by
+    due time, computed from when the prompt was delivered to the member. A single
+    task sleeps until the earliest entry is due (or a new one is added), so open
+    rounds are never polled. Entries are not removed when a member responds or a
+    round completes; they are checked against the manager's in-memory pending
+    responders when they come due and dropped if they no longer apply.
+
+    Reminders that fall due within batch_window of each other are sent together,
+    and each prompt's reminders are recorded with a single write.
+    """
+
+    def __init__(self, manager, remind, delay=172800, count=1, batch_window=60, concurrency=10):
+        """
+        :param manager: The AsyncPromptManager holding the in-progress prompts.
+        :param remind: Coroutine function (prompt_id, user_id, message_id) sending one reminder;
+                       returns True if it was sent.
+        :param delay: Seconds after delivery (and between reminders) before a member is reminded.
+        :param count: Maximum number of reminders per member and prompt.
+        :param batch_window: Reminders due within this many seconds of the first are sent together.
+        :param concurrency: Maximum number of reminders being sent at once.
+        """
+        self.manager = manager
+        self.remind = remind
+        self.delay = delay
+        self.count = count
+        self.batch_window = batch_window
+        self.concurrency = concurrency
+        self.heap = []  # (due, prompt_id, user_id, reminders sent when scheduled, message_id)
+        self.wake = asyncio.Event()
+        self.task = None
+
+    def start(self):
+        """
+        Schedules the reminders of every in-progress prompt and starts the reminder task.
+        Calling it again does nothing.
+        """
+        if self.task is not None:
+            return
+        for prompt_id in list(self.manager.inprogress_prompts):
+            self.track(prompt_id)
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    def track(self, prompt_id):
+        """
+        Schedules reminders for the members a prompt has been delivered to and who have
+        not responded yet. Call it after a delivery; members already scheduled are
+        skipped when their duplicate entries come due.
+        """
+        prompt_round = self.manager.inprogress_prompts.get(prompt_id)
+        if prompt_round is None:
+            return
+        pending = self.manager.pending.get(prompt_id, ())
+        for message_id, user_id, timestamp in prompt_round.iter_messages():
+            sent = prompt_round.reminders.get(user_id, 0)
+            if user_id in pending and sent < self.count:
+                due = timestamp + self.delay * (sent + 1)
+                heapq.heappush(self.heap, (due, prompt_id, user_id, sent, message_id))
+        self.wake.set()
+
+    def _is_current(self, entry):
+        _, prompt_id, user_id, sent, _ = entry
+        prompt_round = self.manager.inprogress_prompts.get(prompt_id)
+        return (
+            prompt_round is not None
+            and user_id in self.manager.pending.get(prompt_id, ())
+            and prompt_round.reminders.get(user_id, 0) == sent
+        )
+
+    async def _run(self):
+        while True:
+            while self.heap and not self._is_current(self.heap[0]):
+                heapq.heappop(self.heap)
+            self.wake.clear()
+            if not self.heap:
+                await self.wake.wait()
+                continue
+            delay = self.heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Take every current entry due within the batch window, one per member and prompt
+            batch = {}  # prompt_id -> {user_id: entry}
+            cutoff = time.time() + self.batch_window
+            while self.heap and self.heap[0][0] <= cutoff:
+                entry = heapq.heappop(self.heap)
+                if self._is_current(entry):
+                    batch.setdefault(entry[1], {}).setdefault(entry[2], entry)
+            for prompt_id, entries in batch.items():
+                await self._send_batch(prompt_id, list(entries.values()))
+
+    async def _send_batch(self, prompt_id, entries):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send(entry):
+            _, _, user_id, _, message_id = entry
+            async with semaphore:
+                try:
+                    return await self.remind(prompt_id, user_id, message_id)
+                except Exception as e:
+                    print(f"Failed to remind member {user_id} of prompt {prompt_id}: {e!r}")
+                    return False
+
+        results = await asyncio.gather(*(send(entry) for entry in entries))
+        reminded = {entry[2]: entry[3] + 1 for entry, sent in zip(entries, results) if sent}
+        if not reminded or prompt_id not in self.manager.inprogress_prompts:
+            return
+        await self.manager.record_reminders(prompt_id, reminded)
+
+        # Schedule the next reminder of members that may get another one
+        for due, _, user_id, sent, message_id in entries:
+            if user_id in reminded and reminded[user_id] < self.count:
+                heapq.heappush(self.heap, (due + self.delay, prompt_id, user_id, sent + 1, message_id))
@@ -0,0 +1,295 @@
+import itertools
+import json
+import math
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+
+# Prompt IDs are snowflakes: milliseconds since EPOCH, process bits and a per-process sequence
+EPOCH = 1704067200000  # 2024-01-01T00:00:00Z in milliseconds
+_process_bits = os.getpid() & 0x3FF
+_sequence = itertools.count()
+_id_lock = threading.Lock()
+_last_id = 0
+
+
+def new_prompt_id():
+    """
+    Generates a prompt ID that doesn't collide with any other generated by this or
+    another process (IDs only repeat if more than 4096 are generated in the same
+    millisecond by processes whose PIDs agree in their low 10 bits).
+
+    :return: The ID as a decimal string, so it is used like the IDs of earlier rounds.
+    """
+    global _last_id
+    with _id_lock:
+        prompt_id = ((int(time.time() * 1000) - EPOCH) << 22) | (_process_bits << 12) | (next(_sequence) & 0xFFF)
+        # Never repeat or go backwards, even if the clock does
+        prompt_id = max(prompt_id, _last_id + 1)
+        _last_id = prompt_id
+    return str(prompt_id)
+
+
+def int_keyed(value):
+    """
+    :param value: A dictionary keyed by stringified IDs, as in records of earlier
+                  versions, or a list of [ID, value] pairs, as in journal entries.
+    :return: A dictionary keyed by int IDs.
+    """
+    items = value.items() if isinstance(value, dict) else value
+    return {int(key): item for key, item in items}
+
+
+class Round:
+    """
+    An in-progress round.
+
+    The delivered messages are kept in three parallel arrays (message ID, user ID
+    and delivery time) rather than a dictionary of small dictionaries, and all
+    Discord IDs are ints, so a round of a thousand deliveries takes a few dozen
+    kilobytes and is serialized with a handful of buffer copies (see to_bytes).
+    to_dict returns the layout rounds have always had, for the used prompt
+    archive and for rounds stored as rows.
+    """
+
+    __slots__ = ("prompt_id", "guild_id", "selected_file", "prompt_text", "started", "recipients",
+                 "message_ids", "message_users", "message_times", "responses", "response_times",
+                 "reminders", "extra")
+
+    # Keys of the dictionary layout that are kept in slots rather than in extra
+    FIELDS = ("prompt_id", "guild_id", "selected_file", "prompt_text", "started", "recipients",
+              "message_ids", "responses", "response_times", "reminders")
+
+    def __init__(self, prompt_id, prompt_text, selected_file=None, guild_id=None, started=None):
+        self.prompt_id = prompt_id
+        self.guild_id = guild_id  # int, or None for rounds recorded before guilds were partitioned
+        self.selected_file = selected_file
+        self.prompt_text = prompt_text
+        self.started = started
+        self.recipients = None  # user ID -> private channel ID once the delivery is planned
+        self.message_ids = array("Q")
+        self.message_users = array("Q")
+        self.message_times = array("d")
+        self.responses = {}  # user ID -> response text
+        self.response_times = {}  # user ID -> time of the response
+        self.reminders = {}  # user ID -> reminders sent
+        self.extra = None  # Any other keys of the dictionary layout, kept as they were
+
+    def add_message(self, message_id, user_id, timestamp):
+        self.message_ids.append(message_id)
+        self.message_users.append(user_id)
+        self.message_times.append(timestamp)
+
+    def add_messages(self, messages, timestamp):
+        """
+        :param messages: An iterable of (message ID, user ID) pairs sent at timestamp.
+        """
+        for message_id, user_id in messages:
+            self.add_message(message_id, user_id, timestamp)
+
+    def iter_messages(self):
+        """
+        :return: An iterator of (message ID, user ID, timestamp) of the delivered messages.
+        """
+        return zip(self.message_ids, self.message_users, self.message_times)
+
+    def expected_responders(self):
+        """
+        :return: The set of user IDs expected to respond: the planned recipients, or the
+                 members the prompt was delivered to for rounds started before deliveries were planned.
+        """
+        if self.recipients is not None:
+            return set(self.recipients)
+        return set(self.message_users)
+
+    # Dictionary layout
+
+    def to_dict(self):
+        """
+        :return: The round as a dictionary of JSON types keyed by stringified IDs.
+        """
+        prompt_data = {
+            "prompt_id": self.prompt_id,
+            "guild_id": self.guild_id,
+            "selected_file": self.selected_file,
+            "prompt_text": self.prompt_text,
+            "started": self.started,
+            "message_ids": {
+                str(message_id): {"user_id": user_id, "timestamp": timestamp}
+                for message_id, user_id, timestamp in self.iter_messages()
+            },
+            "responses": {str(user_id): response for user_id, response in self.responses.items()},
+        }
+        if self.recipients is not None:
+            prompt_data["recipients"] = {str(user_id): channel_id for user_id, channel_id in self.recipients.items()}
+        if self.response_times:
+            prompt_data["response_times"] = {str(user_id): timestamp for user_id, timestamp in self.response_times.items()}
+        if self.reminders:
+            prompt_data["reminders"] = {str(user_id): count for user_id, count in self.reminders.items()}
+        if self.extra:
+            prompt_data.update(self.extra)
+        return prompt_data
+
+    @classmethod
+    def from_dict(cls, prompt_data):
+        """
+        Builds a round from the dictionary layout, including rounds recorded by earlier
+        versions with string IDs.
+        """
+        guild_id = prompt_data.get("guild_id")
+        prompt_round = cls(
+            prompt_data["prompt_id"],
+            prompt_data["prompt_text"],
+            prompt_data.get("selected_file"),
+            int(guild_id) if guild_id is not None else None,
+            prompt_data.get("started"),
+        )
+        if prompt_data.get("recipients") is not None:
+            prompt_round.recipients = int_keyed(prompt_data["recipients"])
+        for message_id, message_data in prompt_data.get("message_ids", {}).items():
+            prompt_round.add_message(int(message_id), int(message_data["user_id"]), message_data["timestamp"])
+        prompt_round.responses = int_keyed(prompt_data.get("responses", {}))
+        prompt_round.response_times = int_keyed(prompt_data.get("response_times", {}))
+        prompt_round.reminders = int_keyed(prompt_data.get("reminders", {}))
+        prompt_round.extra = {key: value for key, value in prompt_data.items() if key not in cls.FIELDS} or None
+        return prompt_round
+
+    # Binary layout
+
+    def to_bytes(self):
+        """
+        Serializes the round: a fixed header, the length-prefixed UTF-8 strings, and
+        the raw ID and time arrays, little-endian.
+        """
+        recipients = self.recipients or {}
+        responders = array("Q", self.responses)
+        response_texts = [response.encode("utf-8") for response in self.responses.values()]
+        strings = [
+            self.prompt_id.encode("utf-8"),
+            (self.selected_file or "").encode("utf-8"),
+            self.prompt_text.encode("utf-8"),
+            json.dumps(self.extra, separators=(",", ":")).encode("utf-8") if self.extra else b"",
+        ]
+        parts = [_HEADER.pack(
+            _VERSION,
+            self.guild_id if self.guild_id is not None else -1,
+            self.started if self.started is not None else math.nan,
+            self.recipients is not None,
+            len(self.message_ids), len(recipients), len(responders), len(self.reminders),
+        )]
+        parts.append(array("I", [len(string) for string in strings] + [len(text) for text in response_texts]))
+        parts.extend(strings)
+        parts.extend(response_texts)
+        parts.append(self.message_ids)
+        parts.append(self.message_users)
+        parts.append(self.message_times)
+        parts.append(array("Q", recipients))
+        parts.append(array("Q", recipients.values()))
+        parts.append(responders)
+        parts.append(array("d", (self.response_times.get(user_id, math.nan) for user_id in self.responses)))
+        parts.append(array("Q", self.reminders))
+        parts.append(array("I", self.reminders.values()))
+        return b"".join(_little_endian(part) for part in parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Rebuilds a round serialized by to_bytes.
+        """
+        data = memoryview(data)
+        version, guild_id, started, planned, messages, recipients, responses, reminders = _HEADER.unpack_from(data)
+        if version != _VERSION:
+            raise ValueError(f"Unknown round format {version}.")
+        reader = _Reader(data, _HEADER.size)
+        lengths = reader.array("I", 4 + responses)
+        prompt_id, selected_file, prompt_text, extra = (reader.text(length) for length in lengths[:4])
+        response_texts = [reader.text(length) for length in lengths[4:]]
+
+        prompt_round = cls(prompt_id, prompt_text, selected_file or None,
+                    guild_id if guild_id >= 0 else None, started if not math.isnan(started) else None)
+        prompt_round.message_ids = reader.array("Q", messages)
+        prompt_round.message_users = reader.array("Q", messages)
+        prompt_round.message_times = reader.array("d", messages)
+        recipient_ids = reader.array("Q", recipients)
+        prompt_round.recipients = dict(zip(recipient_ids, reader.array("Q", recipients))) if planned else None
+        responders = reader.array("Q", responses)
+        prompt_round.responses = dict(zip(responders, response_texts))
+        prompt_round.response_times = {
+            user_id: timestamp for user_id, timestamp in zip(responders, reader.array("d", responses))
+            if not math.isnan(timestamp)
+        }
+        reminded = reader.array("Q", reminders)
+        prompt_round.reminders = dict(zip(reminded, reader.array("I", reminders)))
+        prompt_round.extra = json.loads(extra) if extra else None
+        return prompt_round
+
+
+# version, guild ID (-1 for none), started (NaN for none), recipients planned, and the
+# numbers of messages, recipients, responses and reminded members
+_HEADER = struct.Struct("<BqdBIIII")
+_VERSION = 1
+_SNAPSHOT_MAGIC = b"RND1"
+
+
+def _little_endian(part):
+    if isinstance(part, array) and sys.byteorder == "big":
+        part = array(part.typecode, part)
+        part.byteswap()
+    return part
+
+
+class _Reader:
+    # Reads consecutive fields of a serialized round
+    def __init__(self, data, offset):
+        self.data = data
+        self.offset = offset
+
+    def text(self, length):
+        text = str(self.data[self.offset:self.offset + length], "utf-8")
+        self.offset += length
+        return text
+
+    def array(self, typecode, count):
+        values = array(typecode)
+        end = self.offset + count * values.itemsize
+        values.frombytes(self.data[self.offset:end])
+        if sys.byteorder == "big":
+            values.byteswap()
+        self.offset = end
+        return values
+
+
+def encode_rounds(inprogress_prompts):
+    """
+    Serializes the in-progress rounds for a snapshot: a magic number, the number of
+    rounds, then each round's length and bytes.
+    """
+    parts = [_SNAPSHOT_MAGIC, struct.pack("<I", len(inprogress_prompts))]
+    for prompt_round in inprogress_prompts.values():
+        data = prompt_round.to_bytes()
+        parts.append(struct.pack("<I", len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+
+def decode_rounds(data):
+    """
+    :return: The in-progress rounds of a snapshot written by encode_rounds, keyed by prompt ID.
+    """
+    data = memoryview(data)
+    if bytes(data[:4]) != _SNAPSHOT_MAGIC:
+        raise ValueError("Not a round snapshot.")
+    inprogress_prompts = {}
+    try:
+        (count,), offset = struct.unpack_from("<I", data, 4), 8
+        for _ in range(count):
+            (length,) = struct.unpack_from("<I", data, offset)
+            prompt_round = Round.from_bytes(data[offset + 4:offset + 4 + length])
+            inprogress_prompts[prompt_round.prompt_id] = prompt_round
+            offset += 4 + length
+    except struct.error:
+        raise ValueError("Truncated round snapshot.")
+    return inprogress_prompts
@@ -0,0 +1,157 @@
+import asyncio
+import heapq
+import random
+import re
+import time
+
+# Named cadences accepted by parse_interval, in seconds
+NAMED_INTERVALS = {"daily": 86400, "weekly": 7 * 86400, "biweekly": 14 * 86400}
+UNIT_SECONDS = {"m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+def parse_interval(text):
+    """
+    Parses a cadence such as "weekly", "3d", "12h" or "90m".
+
+    :return: The interval in seconds, or None if the text is not a valid cadence.
+    """
+    text = text.strip().lower()
+    if text in NAMED_INTERVALS:
+        return NAMED_INTERVALS[text]
+    match = re.fullmatch(r"(\d+)\s*([mhdw])", text)
+    if not match or int(match.group(1)) == 0:
+        return None
+    return int(match.group(1)) * UNIT_SECONDS[match.group(2)]
+
+
+def format_interval(seconds):
+    for name, interval in NAMED_INTERVALS.items():
+        if seconds == interval:
+            return name
+    for unit in ("w", "d", "h"):
+        if seconds % UNIT_SECONDS[unit] == 0:
+            return f"every {seconds // UNIT_SECONDS[unit]}{unit}"
+    return f"every {seconds // 60}m"
+
+
+class RoundScheduler:
+    """
+    Starts prompt rounds on each guild's cadence.
+
+    Due times are kept in a heap, and a single task sleeps until the earliest one
+    (or until a schedule changes), so idle guilds cost nothing. Due rounds are
+    dispatched one at a time at least stagger seconds apart, and every run is
+    offset by a random jitter from its slot, so guilds on the same cadence don't
+    all start their rounds in the same second.
+
+    Schedules are stored in each guild's storage, so they survive restarts;
+    rounds that fell due while the bot was offline are started once at startup.
+    """
+
+    def __init__(self, manager, dispatch, stagger=2.0, jitter=300.0):
+        """
+        :param manager: The AsyncPromptManager storing the schedules.
+        :param dispatch: Coroutine function (guild_id) starting a round in a guild.
+        :param stagger: Minimum seconds between two scheduled rounds.
+        :param jitter: Maximum random delay in seconds added to each run.
+        """
+        self.manager = manager
+        self.dispatch = dispatch
+        self.stagger = stagger
+        self.jitter = jitter
+        self.schedules = {}  # guild_id -> {"interval", "slot", "next_run"}
+        self.heap = []  # (next_run, guild_id); entries whose time no longer matches the schedule are skipped
+        self.wake = asyncio.Event()
+        self.task = None
+
+    async def start(self):
+        """
+        Loads the stored schedules and starts dispatching. Calling it again does nothing.
+        """
+        if self.task is not None:
+            return
+        for guild_id, schedule in (await self.manager.get_schedules()).items():
+            self.schedules[guild_id] = schedule
+            heapq.heappush(self.heap, (schedule["next_run"], guild_id))
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    def get_schedule(self, guild_id):
+        return self.schedules.get(guild_id)
+
+    async def set_schedule(self, guild_id, interval, first_run=None):
+        """
+        Schedules rounds in a guild every interval seconds, replacing any existing schedule.
+
+        :param first_run: Time of the first round; defaults to one interval from now.
+        :return: The new schedule.
+        """
+        slot = first_run if first_run is not None else time.time() + interval
+        schedule = {"interval": interval, "slot": slot, "next_run": self._jittered(slot)}
+        await self._save(guild_id, schedule)
+        return schedule
+
+    async def cancel(self, guild_id):
+        """
+        :return: True if the guild had a schedule.
+        """
+        if self.schedules.pop(guild_id, None) is None:
+            return False
+        await self.manager.set_schedule(guild_id, None)
+        self.wake.set()
+        return True
+
+    def _jittered(self, slot):
+        return slot + (random.uniform(0, self.jitter) if self.jitter else 0)
+
+    async def _save(self, guild_id, schedule):
+        self.schedules[guild_id] = schedule
+        await self.manager.set_schedule(guild_id, schedule)
+        heapq.heappush(self.heap, (schedule["next_run"], guild_id))
+        self.wake.set()
+
+    def _is_current(self, entry):
+        next_run, guild_id = entry
+        schedule = self.schedules.get(guild_id)
+        return schedule is not None and schedule["next_run"] == next_run
+
+    async def _run(self):
+        while True:
+            while self.heap and not self._is_current(self.heap[0]):
+                heapq.heappop(self.heap)
+            self.wake.clear()
+            if not self.heap:
+                await self.wake.wait()
+                continue
+            next_run, guild_id = self.heap[0]
+            delay = next_run - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self.heap)
+            await self._dispatch(guild_id)
+            await asyncio.sleep(self.stagger)
+
+    async def _dispatch(self, guild_id):
+        schedule = dict(self.schedules[guild_id])
+        # Move to the next slot first, so a failing round is not retried in a loop. Slots missed
+        # while the bot was offline are skipped; the overdue round is only started once.
+        now = time.time()
+        slot = schedule["slot"] + schedule["interval"]
+        if slot <= now:
+            slot += ((now - slot) // schedule["interval"] + 1) * schedule["interval"]
+        schedule["slot"] = slot
+        schedule["next_run"] = self._jittered(slot)
+        await self._save(guild_id, schedule)
+
+        try:
+            await self.dispatch(guild_id)
+        except Exception as e:
+            print(f"Scheduled round failed in guild {guild_id}: {e!r}")
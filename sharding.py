@@ -0,0 +1,36 @@
+from discord.ext import commands
+
+
+def shard_id_for_guild(guild_id, shard_count):
+    """
+    Returns the shard a guild is assigned to, using Discord's sharding formula.
+    """
+    return (int(guild_id) >> 22) % shard_count
+
+
+def create_bot(command_prefix, intents, shard_count=None, shard_ids=None, **options):
+    """
+    Creates the bot, sharded if a shard count is configured.
+
+    With no shard count the bot uses a single connection. With a shard count and no
+    shard IDs one process runs every shard. With shard IDs this process runs only
+    those shards, so the guilds can be spread over several processes.
+
+    :return: A (bot, owns_guild) pair; owns_guild tells whether this process handles a guild,
+             or is None when the process handles every guild.
+    """
+    if not shard_count:
+        return commands.Bot(command_prefix=command_prefix, intents=intents, **options), None
+
+    bot = commands.AutoShardedBot(
+        command_prefix=command_prefix,
+        intents=intents,
+        shard_count=shard_count,
+        shard_ids=shard_ids,
+        **options
+    )
+    if shard_ids is None:
+        return bot, None
+
+    owned_shards = set(shard_ids)
+    return bot, lambda guild_id: shard_id_for_guild(guild_id, shard_count) in owned_shards
@@ -0,0 +1,941 @@
+import json
+import os
+import sqlite3
+from journal import Journal
+from metrics import metrics
+from prompt_archive import PromptArchive
+from rounds import Round, decode_rounds, encode_rounds, int_keyed
+
+
+def apply_entry(inprogress_prompts, entry):
+    """
+    Applies a single in-progress change to the in-progress rounds.
+
+    Changes are described by small dictionaries with an "op" key ("start",
+    "plan", "recipient", "message", "messages", "response", "reminded" or "remove"). PromptManager
+    applies them in memory and hands the same entry to the storage backend to
+    persist. IDs may be strings in entries journaled by earlier versions.
+
+    :param inprogress_prompts: The in-progress rounds (Round objects keyed by prompt ID) to update.
+    :param entry: The entry describing the change.
+    """
+    op = entry["op"]
+    if op == "start":
+        prompt_data = entry["prompt"]
+        inprogress_prompts[prompt_data["prompt_id"]] = Round.from_dict(prompt_data)
+    elif op == "plan":
+        inprogress_prompts[entry["prompt_id"]].recipients = int_keyed(entry["recipients"])
+    elif op == "recipient":
+        # One planned recipient added, or removed if channel_id is None
+        recipients = inprogress_prompts[entry["prompt_id"]].recipients
+        if entry["channel_id"] is None:
+            recipients.pop(int(entry["user_id"]), None)
+        else:
+            recipients[int(entry["user_id"])] = entry["channel_id"]
+    elif op == "message":
+        inprogress_prompts[entry["prompt_id"]].add_message(
+            int(entry["message_id"]), int(entry["user_id"]), entry["timestamp"])
+    elif op == "messages":
+        inprogress_prompts[entry["prompt_id"]].add_messages(
+            ((int(message_id), int(user_id)) for message_id, user_id in entry["messages"]), entry["timestamp"])
+    elif op == "response":
+        prompt_round = inprogress_prompts[entry["prompt_id"]]
+        user_id = int(entry["user_id"])
+        prompt_round.responses[user_id] = entry["response"]
+        if entry.get("timestamp") is not None:  # Entries journaled before responses were timed have none
+            prompt_round.response_times[user_id] = entry["timestamp"]
+    elif op == "reminded":
+        inprogress_prompts[entry["prompt_id"]].reminders.update(int_keyed(entry["reminders"]))
+    elif op == "remove":
+        inprogress_prompts.pop(entry["prompt_id"], None)
+    else:
+        raise ValueError(f"Unknown in-progress operation '{op}'.")
+
+
+def replay_entry(inprogress_prompts, entry, delivered):
+    """
+    Applies a journal entry while loading. After a crash between a compaction's
+    rename and the journal's truncation, the journal replays changes the snapshot
+    already contains: changes to rounds the snapshot has already completed are
+    skipped, and so are messages it already holds (they are appended to a round
+    rather than assigned).
+
+    :param delivered: Dictionary of prompt ID to the set of its message IDs, filled
+                      in as rounds are replayed; discarded after loading.
+    """
+    if entry["op"] not in ("start", "remove") and entry["prompt_id"] not in inprogress_prompts:
+        return
+    if entry["op"] in ("message", "messages"):
+        prompt_id = entry["prompt_id"]
+        if prompt_id not in delivered:
+            delivered[prompt_id] = set(inprogress_prompts[prompt_id].message_ids)
+        messages = entry["messages"] if entry["op"] == "messages" else [(entry["message_id"], entry["user_id"])]
+        messages = [(int(message_id), int(user_id)) for message_id, user_id in messages
+                    if int(message_id) not in delivered[prompt_id]]
+        delivered[prompt_id].update(message_id for message_id, _ in messages)
+        inprogress_prompts[prompt_id].add_messages(messages, entry["timestamp"])
+        return
+    if entry["op"] in ("start", "remove"):
+        delivered.pop(entry["prompt"]["prompt_id"] if entry["op"] == "start" else entry["prompt_id"], None)
+    apply_entry(inprogress_prompts, entry)
+
+
+def apply_private_channel(private_channels, entry):
+    """
+    Applies a journaled private channel change: the member's channel is set, or
+    removed if channel_id is None.
+    """
+    guild_channels = private_channels.setdefault(entry["guild_id"], {})
+    if entry["channel_id"] is None:
+        guild_channels.pop(entry["member_id"], None)
+    else:
+        guild_channels[entry["member_id"]] = entry["channel_id"]
+
+
+def read_json(file_path, kind):
+    """
+    Reads a JSON file, counting the read and its size in the storage metrics.
+
+    :param kind: What the file holds, used to label the metrics.
+    """
+    with open(file_path, "r") as f:
+        text = f.read()
+    metrics.inc("storage_reads_total", kind=kind)
+    metrics.inc("storage_read_bytes_total", len(text), kind=kind)
+    return json.loads(text)
+
+
+def write_json(file_path, data, kind, indent=None, atomic=False):
+    """
+    Writes a JSON file, counting the write and its size in the storage metrics.
+
+    :param kind: What the file holds, used to label the metrics.
+    :param atomic: Write to a temporary file and rename it over the target.
+    """
+    text = json.dumps(data, indent=indent)
+    target = file_path + ".tmp" if atomic else file_path
+    with open(target, "w") as f:
+        f.write(text)
+    if atomic:
+        os.replace(target, file_path)
+    metrics.inc("storage_writes_total", kind=kind)
+    metrics.inc("storage_written_bytes_total", len(text), kind=kind)
+
+
+class JsonStorage:
+    """
+    Stores state in the JSON files the bot has always used: one file per prompt
+    category in the prompts folder, a binary snapshot of the in-progress rounds
+    (inprogress_prompts.bin, plus its journal), notifications.json and private_channels.json. Used prompts are kept in an
+    append-only archive in the used_prompts folder; a used_prompts.json from
+    earlier versions is imported into it on first use.
+
+    Each guild's state is kept in the same set of files inside its own folder
+    under guilds_folder (see for_guild); the top-level files hold the prompt
+    library and any state recorded before guilds were partitioned.
+    """
+
+    def __init__(self, prompts_folder, used_prompts_file, inprogress_prompts_file,
+                 inprogress_journal_file, notify_file, private_channels_file, compact_every=200,
+                 guilds_folder=None, schedule_file=None, prompt_index_file=None):
+        """
+        :param prompts_folder: Folder where prompt files are stored.
+        :param used_prompts_file: File that tracked used prompts before the archive; the archive
+                                  is kept in a folder of the same name without the extension.
+        :param inprogress_prompts_file: Snapshot of the in-progress prompts.
+        :param inprogress_journal_file: Append-only log of in-progress changes.
+        :param notify_file: File storing notification preferences.
+        :param private_channels_file: File storing the private channel of each member.
+        :param compact_every: Journal entries written before the in-progress snapshot is rewritten.
+        :param guilds_folder: Folder holding one state folder per guild.
+        :param schedule_file: File storing the guild's round schedule (guild storages only).
+        :param prompt_index_file: File storing the prompt library's content-hash index
+                                  (defaults to prompt_index.json next to used_prompts_file).
+        """
+        self.prompts_folder = prompts_folder
+        self.guilds_folder = guilds_folder
+        self.compact_every = compact_every
+        self.used_prompts_file = used_prompts_file
+        self.inprogress_prompts_file = inprogress_prompts_file
+        self.notify_file = notify_file
+        self.private_channels_file = private_channels_file
+        self.schedule_file = schedule_file
+        self.prompt_index_file = prompt_index_file or os.path.join(os.path.dirname(used_prompts_file), "prompt_index.json")
+
+        # Ensure the prompts folder exists
+        if not os.path.exists(self.prompts_folder):
+            os.makedirs(self.prompts_folder)
+
+        # In-progress rounds are snapshotted in a binary format (see rounds.encode_rounds)
+        self.journal = Journal(inprogress_prompts_file, inprogress_journal_file, compact_every,
+                               encode_rounds, decode_rounds)
+        self.inprogress_prompts = {}
+        # Private channel changes are journaled next to private_channels.json; loaded on first use
+        self.private_channels_journal = Journal(private_channels_file, compact_every=compact_every)
+        self.private_channels = None
+        self.archive = None  # Opened on first use, see get_archive
+
+    # Guild partitions
+
+    def for_guild(self, guild_id):
+        """
+        Returns a storage for a single guild's state, kept in its own folder.
+
+        :param guild_id: The ID of the guild.
+        """
+        folder = os.path.join(self.guilds_folder, str(guild_id))
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        return JsonStorage(
+            self.prompts_folder,
+            os.path.join(folder, "used_prompts.json"),
+            os.path.join(folder, "inprogress_prompts.bin"),
+            os.path.join(folder, "inprogress_prompts.journal"),
+            os.path.join(folder, "notifications.json"),
+            os.path.join(folder, "private_channels.json"),
+            self.compact_every,
+            schedule_file=os.path.join(folder, "schedule.json")
+        )
+
+    def list_guilds(self):
+        """
+        :return: The IDs of the guilds that have a state folder.
+        """
+        if not self.guilds_folder or not os.path.exists(self.guilds_folder):
+            return []
+        return [int(name) for name in os.listdir(self.guilds_folder) if name.isdigit()]
+
+    # In-progress prompts
+
+    def load_inprogress(self):
+        """
+        Loads the in-progress rounds from the snapshot and journal.
+
+        The returned dictionary is kept by the storage and written out whenever the
+        journal is compacted, so the caller must apply its changes to it in place.
+        A JSON snapshot written by earlier versions next to the binary one is
+        converted and renamed with a .migrated suffix.
+
+        :return: The in-progress rounds (Round objects) keyed by prompt ID.
+        """
+        delivered = {}  # Message IDs of the replayed rounds, see replay_entry
+
+        def replay(state, entry):
+            replay_entry(state, entry, delivered)
+
+        legacy_file = os.path.splitext(self.inprogress_prompts_file)[0] + ".json"
+        if legacy_file != self.inprogress_prompts_file and not os.path.exists(self.inprogress_prompts_file) \
+                and os.path.exists(legacy_file):
+            legacy = read_json(legacy_file, "inprogress")
+            self.inprogress_prompts = self.journal.load(
+                replay, {prompt_id: Round.from_dict(prompt_data) for prompt_id, prompt_data in legacy.items()})
+            self.journal.compact(self.inprogress_prompts)
+            os.replace(legacy_file, legacy_file + ".migrated")
+        else:
+            self.inprogress_prompts = self.journal.load(replay)
+        return self.inprogress_prompts
+
+    def record(self, entry):
+        """
+        Persists an in-progress change that has already been applied in memory.
+
+        :param entry: The entry describing the change.
+        """
+        if self.journal.append(entry):
+            self.journal.compact(self.inprogress_prompts)
+
+    # Used prompts
+
+    def get_archive(self):
+        """
+        Opens the used prompt archive, importing the prompts of a legacy used_prompts.json
+        the first time. The legacy file is renamed to used_prompts.json.migrated afterwards.
+        """
+        if self.archive is None:
+            self.archive = PromptArchive(os.path.splitext(self.used_prompts_file)[0])
+            if os.path.exists(self.used_prompts_file):
+                try:
+                    legacy = read_json(self.used_prompts_file, "used_prompts") or {}
+                except json.JSONDecodeError:
+                    legacy = {}
+                for prompt_id, prompt_data in legacy.items():
+                    if prompt_id not in self.archive:
+                        self.archive.append(prompt_id, prompt_data)
+                os.replace(self.used_prompts_file, self.used_prompts_file + ".migrated")
+        return self.archive
+
+    def warm_up(self):
+        """
+        Loads what is otherwise read on first use: the used prompt archive's index.
+        """
+        self.get_archive()
+
+    def archive_prompt(self, prompt_id, prompt_data):
+        """
+        Adds a completed prompt to the used prompts.
+
+        :param prompt_id: The ID of the completed prompt.
+        :param prompt_data: The prompt data including responses and completion metadata.
+        """
+        self.get_archive().append(prompt_id, prompt_data)
+
+    def load_used_prompts(self):
+        """
+        :return: All used prompts keyed by prompt ID.
+        """
+        return dict(self.get_archive().iter_records())
+
+    def get_used_prompts_page(self, page=0, per_page=10, selected_file=None, date=None):
+        """
+        Returns one page of used prompts, newest first.
+
+        :param selected_file: Only include prompts from this prompt file.
+        :param date: Only include prompts used on this date ("YYYY-MM-DD").
+        :return: A (records, page, page_count) tuple, where records is a list of (prompt_id, prompt_data).
+        """
+        return self.get_archive().get_page(page, per_page, selected_file, date)
+
+    def get_used_prompt(self, prompt_id):
+        """
+        :return: The used prompt's data, or None if it is not in the used prompts.
+        """
+        return self.get_archive().get(prompt_id)
+
+    # Prompt library
+
+    def list_prompt_files(self):
+        """
+        :return: The names of all prompt files.
+        """
+        return [
+            f for f in os.listdir(self.prompts_folder)
+            if f.endswith(".json")
+        ]
+
+    def load_prompts(self, file_name):
+        """
+        :param file_name: The name of the prompt file.
+        :return: The list of prompts in the file.
+        """
+        file_path = os.path.join(self.prompts_folder, file_name)
+        try:
+            return read_json(file_path, "library")
+        except json.JSONDecodeError:
+            raise ValueError(f"No prompts found in {file_name}.")
+
+    def save_prompts(self, file_name, prompts):
+        """
+        Replaces the prompts stored in a file.
+
+        :param file_name: The name of the prompt file.
+        :param prompts: The full list of prompts.
+        """
+        file_path = os.path.join(self.prompts_folder, file_name)
+        write_json(file_path, prompts, "library", indent=4)
+
+    def add_prompts(self, file_name, prompt_texts):
+        """
+        Appends prompts to a file with a single write, creating the file if needed.
+        The caller checks for duplicates (see PromptHashIndex).
+        """
+        file_path = os.path.join(self.prompts_folder, file_name)
+        prompts = self.load_prompts(file_name) if os.path.exists(file_path) else []
+        prompts.extend(prompt_texts)
+        self.save_prompts(file_name, prompts)
+
+    def load_prompt_index(self):
+        """
+        :return: The saved content-hash index of the prompt library, or an empty dictionary.
+        """
+        if os.path.exists(self.prompt_index_file):
+            try:
+                return read_json(self.prompt_index_file, "library") or {}
+            except json.JSONDecodeError:
+                pass  # Rebuilt from the prompt files
+        return {}
+
+    def save_prompt_index(self, index):
+        write_json(self.prompt_index_file, index, "library", atomic=True)
+
+    def remove_prompt(self, file_name, prompt_text):
+        """
+        Removes a prompt from a file.
+        """
+        self.remove_prompts(file_name, [prompt_text])
+
+    def remove_prompts(self, file_name, prompt_texts):
+        """
+        Removes several prompts from a file with a single rewrite.
+        """
+        removed = set(prompt_texts)
+        prompts = self.load_prompts(file_name)
+        remaining = [prompt_text for prompt_text in prompts if prompt_text not in removed]
+        if len(remaining) != len(prompts):
+            self.save_prompts(file_name, remaining)
+
+    def create_prompt_file(self, file_name):
+        """
+        Creates a new, empty prompt file.
+
+        :return: True if the file was created, False if it already exists.
+        """
+        file_path = os.path.join(self.prompts_folder, file_name)
+        if os.path.exists(file_path):
+            return False
+        self.save_prompts(file_name, [])
+        return True
+
+    def count_prompts(self, file_name):
+        """
+        :return: The number of prompts in the file.
+        """
+        return len(self.load_prompts(file_name))
+
+    def get_prompt_file_info(self, file_name):
+        """
+        :return: A dictionary with the file's size in bytes and its modification time.
+        """
+        stat = os.stat(os.path.join(self.prompts_folder, file_name))
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    # Notification preferences
+
+    def load_notifications(self):
+        """
+        :return: Notification preferences keyed by user ID.
+        """
+        if os.path.exists(self.notify_file):
+            try:
+                return read_json(self.notify_file, "notifications") or {}
+            except json.JSONDecodeError:
+                pass
+        return {}
+
+    def set_notification(self, user_id, enabled):
+        """
+        Stores a user's notification preference.
+        """
+        notifications = self.load_notifications()
+        notifications[str(user_id)] = enabled
+        write_json(self.notify_file, notifications, "notifications")
+
+    # Private channels
+
+    def load_private_channels(self):
+        """
+        Loads the private channels from the snapshot and journal on first use.
+
+        :return: Private channel IDs keyed by guild ID and then member ID. The dictionary
+                 is kept by the storage and must not be modified by the caller.
+        """
+        if self.private_channels is None:
+            try:
+                self.private_channels = self.private_channels_journal.load(apply_private_channel)
+            except ValueError:
+                self.private_channels = self.private_channels_journal.load(apply_private_channel, {})
+        return self.private_channels
+
+    def set_private_channel(self, guild_id, member_id, channel_id):
+        """
+        Stores the private channel of a member, or removes it if channel_id is None.
+        Only the change is appended to the journal, so registering every member of a
+        large guild doesn't rewrite the whole file each time.
+        """
+        entry = {"guild_id": str(guild_id), "member_id": str(member_id), "channel_id": channel_id}
+        apply_private_channel(self.load_private_channels(), entry)
+        if self.private_channels_journal.append(entry):
+            self.private_channels_journal.compact(self.private_channels)
+
+    # Round schedule
+
+    def load_schedule(self):
+        """
+        :return: The guild's round schedule, or None if it has none.
+        """
+        if self.schedule_file and os.path.exists(self.schedule_file):
+            return read_json(self.schedule_file, "schedule")
+        return None
+
+    def set_schedule(self, schedule):
+        """
+        Stores the guild's round schedule, or removes it if schedule is None.
+        """
+        if schedule is None:
+            if self.schedule_file and os.path.exists(self.schedule_file):
+                os.remove(self.schedule_file)
+            return
+        write_json(self.schedule_file, schedule, "schedule", atomic=True)
+
+    def close(self):
+        """
+        Flushes pending journal entries into the in-progress and private channel snapshots.
+        """
+        self.journal.close(self.inprogress_prompts)
+        self.private_channels_journal.close(self.private_channels)
+
+
+class SQLiteStorage:
+    """
+    Stores state in a single SQLite database in WAL mode, so every change is a
+    row-level update and readers never block the writer.
+
+    Every guild's rows carry its guild_id; for_guild returns a view of the same
+    database limited to one guild.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS prompt_files (
+            file_name TEXT PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS prompts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_name TEXT NOT NULL REFERENCES prompt_files(file_name),
+            prompt_text TEXT NOT NULL,
+            UNIQUE (file_name, prompt_text)
+        );
+        CREATE TABLE IF NOT EXISTS rounds (
+            prompt_id TEXT PRIMARY KEY,
+            guild_id TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS rounds_guild_id ON rounds(guild_id);
+        CREATE TABLE IF NOT EXISTS round_messages (
+            message_id TEXT PRIMARY KEY,
+            prompt_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            timestamp REAL
+        );
+        CREATE INDEX IF NOT EXISTS round_messages_prompt_id ON round_messages(prompt_id);
+        CREATE INDEX IF NOT EXISTS round_messages_user_id ON round_messages(user_id);
+        CREATE TABLE IF NOT EXISTS round_responses (
+            prompt_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            response TEXT,
+            timestamp REAL,
+            PRIMARY KEY (prompt_id, user_id)
+        );
+        CREATE INDEX IF NOT EXISTS round_responses_user_id ON round_responses(user_id);
+        CREATE TABLE IF NOT EXISTS used_prompts (
+            prompt_id TEXT PRIMARY KEY,
+            guild_id TEXT,
+            selected_file TEXT,
+            timestamp TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS used_prompts_guild_id ON used_prompts(guild_id);
+        CREATE INDEX IF NOT EXISTS used_prompts_selected_file ON used_prompts(selected_file);
+        CREATE INDEX IF NOT EXISTS used_prompts_timestamp ON used_prompts(guild_id, timestamp);
+        CREATE TABLE IF NOT EXISTS notifications (
+            user_id TEXT PRIMARY KEY,
+            enabled INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS guild_notifications (
+            guild_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            enabled INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, user_id)
+        );
+        CREATE TABLE IF NOT EXISTS private_channels (
+            guild_id TEXT NOT NULL,
+            member_id TEXT NOT NULL,
+            channel_id INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, member_id)
+        );
+        CREATE INDEX IF NOT EXISTS private_channels_channel_id ON private_channels(channel_id);
+        CREATE TABLE IF NOT EXISTS schedules (
+            guild_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_file, guild_id=None, conn=None):
+        """
+        :param db_file: Path of the SQLite database file.
+        :param guild_id: The guild this view is limited to, or None for state not tied to a guild.
+        :param conn: A connection to share with another view of the same database.
+        """
+        self.db_file = db_file
+        self.guild_id = _optional_str(guild_id)
+        if conn is not None:
+            self.conn = conn
+            return
+        # The connection may be used from a worker thread; writes are serialized by the caller
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        # Preferences recorded before guilds were partitioned stay in notifications, the rest are in
+        # guild_notifications; older databases still have an unused guild_id column and index there
+        self.conn.execute("DROP INDEX IF EXISTS notifications_guild_id")
+        # Databases created before responses were timed lack the column
+        if "timestamp" not in {row[1] for row in self.conn.execute("PRAGMA table_info(round_responses)")}:
+            self.conn.execute("ALTER TABLE round_responses ADD COLUMN timestamp REAL")
+        self.conn.commit()
+
+    # Guild partitions
+
+    def for_guild(self, guild_id):
+        return SQLiteStorage(self.db_file, guild_id, self.conn)
+
+    def list_guilds(self):
+        return [
+            int(row[0]) for row in self.conn.execute(
+                "SELECT guild_id FROM rounds WHERE guild_id IS NOT NULL "
+                "UNION SELECT guild_id FROM guild_notifications "
+                "UNION SELECT guild_id FROM private_channels "
+                "UNION SELECT guild_id FROM schedules")
+        ]
+
+    def get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # In-progress prompts
+
+    def load_inprogress(self):
+        """
+        Rebuilds the in-progress rounds from the round tables.
+
+        :return: The in-progress rounds (Round objects) keyed by prompt ID.
+        """
+        inprogress_prompts = {}
+        for prompt_id, data in self.conn.execute(
+                "SELECT prompt_id, data FROM rounds WHERE guild_id IS ?", (self.guild_id,)):
+            inprogress_prompts[prompt_id] = Round.from_dict(json.loads(data))
+        for message_id, prompt_id, user_id, timestamp in self.conn.execute(
+                "SELECT m.message_id, m.prompt_id, m.user_id, m.timestamp FROM round_messages m "
+                "JOIN rounds r ON r.prompt_id = m.prompt_id WHERE r.guild_id IS ?", (self.guild_id,)):
+            if prompt_id in inprogress_prompts:
+                # user_id is JSON-encoded; rows written by earlier versions may hold it as a string
+                inprogress_prompts[prompt_id].add_message(int(message_id), int(json.loads(user_id)), timestamp)
+        for prompt_id, user_id, response, timestamp in self.conn.execute(
+                "SELECT s.prompt_id, s.user_id, s.response, s.timestamp FROM round_responses s "
+                "JOIN rounds r ON r.prompt_id = s.prompt_id WHERE r.guild_id IS ?", (self.guild_id,)):
+            if prompt_id in inprogress_prompts:
+                inprogress_prompts[prompt_id].responses[int(user_id)] = response
+                if timestamp is not None:
+                    inprogress_prompts[prompt_id].response_times[int(user_id)] = timestamp
+        return inprogress_prompts
+
+    def record(self, entry):
+        """
+        Persists an in-progress change as row-level updates.
+
+        :param entry: The entry describing the change.
+        """
+        op = entry["op"]
+        with self.conn:
+            if op == "start":
+                prompt_data = dict(entry["prompt"])
+                prompt_data.pop("message_ids", None)
+                prompt_data.pop("responses", None)
+                prompt_data.pop("response_times", None)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO rounds (prompt_id, guild_id, data) VALUES (?, ?, ?)",
+                    (prompt_data["prompt_id"], _optional_str(prompt_data.get("guild_id")), json.dumps(prompt_data))
+                )
+            elif op == "plan":
+                row = self.conn.execute("SELECT data FROM rounds WHERE prompt_id = ?", (entry["prompt_id"],)).fetchone()
+                if row:
+                    prompt_data = json.loads(row[0])
+                    prompt_data["recipients"] = entry["recipients"]
+                    self.conn.execute(
+                        "UPDATE rounds SET data = ? WHERE prompt_id = ?", (json.dumps(prompt_data), entry["prompt_id"]))
+            elif op == "recipient":
+                row = self.conn.execute("SELECT data FROM rounds WHERE prompt_id = ?", (entry["prompt_id"],)).fetchone()
+                if row:
+                    prompt_data = json.loads(row[0])
+                    recipients = {str(user_id): channel_id for user_id, channel_id in
+                                  int_keyed(prompt_data.get("recipients") or {}).items()}
+                    if entry["channel_id"] is None:
+                        recipients.pop(str(entry["user_id"]), None)
+                    else:
+                        recipients[str(entry["user_id"])] = entry["channel_id"]
+                    prompt_data["recipients"] = recipients
+                    self.conn.execute(
+                        "UPDATE rounds SET data = ? WHERE prompt_id = ?", (json.dumps(prompt_data), entry["prompt_id"]))
+            elif op == "reminded":
+                row = self.conn.execute("SELECT data FROM rounds WHERE prompt_id = ?", (entry["prompt_id"],)).fetchone()
+                if row:
+                    prompt_data = json.loads(row[0])
+                    prompt_data.setdefault("reminders", {}).update(entry["reminders"])
+                    self.conn.execute(
+                        "UPDATE rounds SET data = ? WHERE prompt_id = ?", (json.dumps(prompt_data), entry["prompt_id"]))
+            elif op == "message":
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO round_messages (message_id, prompt_id, user_id, timestamp) VALUES (?, ?, ?, ?)",
+                    # user_id is stored JSON-encoded, as it was when IDs could be strings
+                    (entry["message_id"], entry["prompt_id"], json.dumps(entry["user_id"]), entry["timestamp"])
+                )
+            elif op == "messages":
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO round_messages (message_id, prompt_id, user_id, timestamp) VALUES (?, ?, ?, ?)",
+                    [(message_id, entry["prompt_id"], json.dumps(user_id), entry["timestamp"])
+                     for message_id, user_id in entry["messages"]]
+                )
+            elif op == "response":
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO round_responses (prompt_id, user_id, response, timestamp) VALUES (?, ?, ?, ?)",
+                    (entry["prompt_id"], entry["user_id"], entry["response"], entry.get("timestamp"))
+                )
+            elif op == "remove":
+                self.conn.execute("DELETE FROM round_messages WHERE prompt_id = ?", (entry["prompt_id"],))
+                self.conn.execute("DELETE FROM round_responses WHERE prompt_id = ?", (entry["prompt_id"],))
+                self.conn.execute("DELETE FROM rounds WHERE prompt_id = ?", (entry["prompt_id"],))
+            else:
+                raise ValueError(f"Unknown in-progress operation '{op}'.")
+
+    def warm_up(self):
+        """
+        Nothing to load up front; rows are read on demand.
+        """
+
+    # Used prompts
+
+    def archive_prompt(self, prompt_id, prompt_data):
+        """
+        Adds a completed prompt to the used prompts.
+        """
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO used_prompts (prompt_id, guild_id, selected_file, timestamp, data) VALUES (?, ?, ?, ?, ?)",
+                (prompt_id, _optional_str(prompt_data.get("guild_id")), prompt_data.get("selected_file"),
+                 prompt_data.get("timestamp"), json.dumps(prompt_data))
+            )
+
+    def load_used_prompts(self):
+        """
+        :return: All used prompts keyed by prompt ID.
+        """
+        return {
+            prompt_id: json.loads(data)
+            for prompt_id, data in self.conn.execute(
+                "SELECT prompt_id, data FROM used_prompts WHERE guild_id IS ? ORDER BY timestamp", (self.guild_id,))
+        }
+
+    def get_used_prompts_page(self, page=0, per_page=10, selected_file=None, date=None):
+        """
+        :return: A (records, page, page_count) tuple for one page of used prompts, newest first.
+        """
+        conditions = "guild_id IS ?"
+        params = [self.guild_id]
+        if selected_file is not None:
+            conditions += " AND selected_file = ?"
+            params.append(selected_file)
+        if date is not None:
+            conditions += " AND timestamp LIKE ?"
+            params.append(date + "%")
+        count = self.conn.execute(f"SELECT COUNT(*) FROM used_prompts WHERE {conditions}", params).fetchone()[0]
+        page_count = max(1, -(-count // per_page))
+        page = min(max(page, 0), page_count - 1)
+        rows = self.conn.execute(
+            f"SELECT prompt_id, data FROM used_prompts WHERE {conditions} ORDER BY timestamp DESC, rowid DESC "
+            "LIMIT ? OFFSET ?", params + [per_page, page * per_page])
+        return [(prompt_id, json.loads(data)) for prompt_id, data in rows], page, page_count
+
+    def get_used_prompt(self, prompt_id):
+        row = self.conn.execute(
+            "SELECT data FROM used_prompts WHERE prompt_id = ? AND guild_id IS ?", (prompt_id, self.guild_id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # Prompt library
+
+    def list_prompt_files(self):
+        return [row[0] for row in self.conn.execute("SELECT file_name FROM prompt_files ORDER BY file_name")]
+
+    def load_prompts(self, file_name):
+        return [
+            row[0] for row in self.conn.execute(
+                "SELECT prompt_text FROM prompts WHERE file_name = ? ORDER BY id", (file_name,))
+        ]
+
+    def save_prompts(self, file_name, prompts):
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO prompt_files (file_name) VALUES (?)", (file_name,))
+            self.conn.execute("DELETE FROM prompts WHERE file_name = ?", (file_name,))
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO prompts (file_name, prompt_text) VALUES (?, ?)",
+                [(file_name, prompt_text) for prompt_text in prompts]
+            )
+
+    def add_prompts(self, file_name, prompt_texts):
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO prompt_files (file_name) VALUES (?)", (file_name,))
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO prompts (file_name, prompt_text) VALUES (?, ?)",
+                [(file_name, prompt_text) for prompt_text in prompt_texts]
+            )
+
+    def load_prompt_index(self):
+        saved = self.get_meta("prompt_index")
+        return json.loads(saved) if saved else {}
+
+    def save_prompt_index(self, index):
+        self.set_meta("prompt_index", json.dumps(index))
+
+    def remove_prompt(self, file_name, prompt_text):
+        self.remove_prompts(file_name, [prompt_text])
+
+    def remove_prompts(self, file_name, prompt_texts):
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM prompts WHERE file_name = ? AND prompt_text = ?",
+                [(file_name, prompt_text) for prompt_text in prompt_texts]
+            )
+
+    def create_prompt_file(self, file_name):
+        with self.conn:
+            cursor = self.conn.execute("INSERT OR IGNORE INTO prompt_files (file_name) VALUES (?)", (file_name,))
+        return cursor.rowcount > 0
+
+    def count_prompts(self, file_name):
+        return self.conn.execute("SELECT COUNT(*) FROM prompts WHERE file_name = ?", (file_name,)).fetchone()[0]
+
+    def get_prompt_file_info(self, file_name):
+        # Prompt files are rows here, so the size is the stored text and there is no modification time
+        size = self.conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(prompt_text)), 0) FROM prompts WHERE file_name = ?", (file_name,)).fetchone()[0]
+        return {"size": size, "mtime": None}
+
+    # Notification preferences
+
+    def load_notifications(self):
+        if self.guild_id is None:
+            rows = self.conn.execute("SELECT user_id, enabled FROM notifications")
+        else:
+            rows = self.conn.execute(
+                "SELECT user_id, enabled FROM guild_notifications WHERE guild_id = ?", (self.guild_id,))
+        return {user_id: bool(enabled) for user_id, enabled in rows}
+
+    def set_notification(self, user_id, enabled):
+        with self.conn:
+            if self.guild_id is None:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO notifications (user_id, enabled) VALUES (?, ?)",
+                    (str(user_id), int(enabled))
+                )
+            else:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO guild_notifications (guild_id, user_id, enabled) VALUES (?, ?, ?)",
+                    (self.guild_id, str(user_id), int(enabled))
+                )
+
+    # Private channels
+
+    def load_private_channels(self):
+        private_channels = {}
+        if self.guild_id is None:
+            rows = self.conn.execute("SELECT guild_id, member_id, channel_id FROM private_channels")
+        else:
+            rows = self.conn.execute(
+                "SELECT guild_id, member_id, channel_id FROM private_channels WHERE guild_id = ?", (self.guild_id,))
+        for guild_id, member_id, channel_id in rows:
+            private_channels.setdefault(guild_id, {})[member_id] = channel_id
+        return private_channels
+
+    def set_private_channel(self, guild_id, member_id, channel_id):
+        with self.conn:
+            if channel_id is None:
+                self.conn.execute(
+                    "DELETE FROM private_channels WHERE guild_id = ? AND member_id = ?", (str(guild_id), str(member_id)))
+            else:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO private_channels (guild_id, member_id, channel_id) VALUES (?, ?, ?)",
+                    (str(guild_id), str(member_id), channel_id)
+                )
+
+    # Round schedule
+
+    def load_schedule(self):
+        row = self.conn.execute("SELECT data FROM schedules WHERE guild_id IS ?", (self.guild_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_schedule(self, schedule):
+        with self.conn:
+            if schedule is None:
+                self.conn.execute("DELETE FROM schedules WHERE guild_id IS ?", (self.guild_id,))
+            else:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO schedules (guild_id, data) VALUES (?, ?)", (self.guild_id, json.dumps(schedule)))
+
+    def close(self):
+        if self.guild_id is None:
+            self.conn.close()  # Guild views share the connection of the top-level storage
+
+
+def _optional_str(value):
+    return None if value is None else str(value)
+
+
+def migrate_json_to_sqlite(json_storage, sqlite_storage):
+    """
+    Copies all state from the JSON files into the SQLite database. The migration
+    runs once; later calls are no-ops.
+
+    :param json_storage: The JsonStorage to read from.
+    :param sqlite_storage: The SQLiteStorage to write to.
+    :return: True if the migration ran, False if it had already been done.
+    """
+    if sqlite_storage.get_meta("migrated_from_json"):
+        return False
+
+    for file_name in json_storage.list_prompt_files():
+        sqlite_storage.save_prompts(file_name, json_storage.load_prompts(file_name))
+
+    _copy_state(json_storage, sqlite_storage)
+    for guild_id in json_storage.list_guilds():
+        _copy_state(json_storage.for_guild(guild_id), sqlite_storage.for_guild(guild_id))
+
+    sqlite_storage.set_meta("migrated_from_json", "1")
+    return True
+
+
+def _copy_state(source, target):
+    """
+    Copies the in-progress prompts, used prompts, notification preferences,
+    private channels and round schedule from one storage to another.
+    """
+    for prompt_round in source.load_inprogress().values():
+        prompt_data = prompt_round.to_dict()
+        target.record({
+            "op": "start",
+            "prompt": {k: v for k, v in prompt_data.items() if k not in ("message_ids", "responses", "response_times")}
+        })
+        for message_id, message_data in prompt_data["message_ids"].items():
+            target.record({
+                "op": "message",
+                "prompt_id": prompt_data["prompt_id"],
+                "message_id": message_id,
+                "user_id": message_data["user_id"],
+                "timestamp": message_data["timestamp"]
+            })
+        for user_id, response in prompt_data["responses"].items():
+            target.record({
+                "op": "response",
+                "prompt_id": prompt_data["prompt_id"],
+                "user_id": user_id,
+                "response": response,
+                "timestamp": prompt_data.get("response_times", {}).get(user_id)
+            })
+
+    for prompt_id, prompt_data in source.load_used_prompts().items():
+        target.archive_prompt(prompt_id, prompt_data)
+
+    for user_id, enabled in source.load_notifications().items():
+        target.set_notification(user_id, enabled)
+
+    for guild_id, guild_channels in source.load_private_channels().items():
+        for member_id, channel_id in guild_channels.items():
+            target.set_private_channel(guild_id, member_id, channel_id)
+
+    schedule = source.load_schedule()
+    if schedule:
+        target.set_schedule(schedule)
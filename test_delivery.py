@@ -0,0 +1,33 @@
+import asyncio
+from delivery import PromptDelivery
+
+
+class Manager:
+    def __init__(self):
+        self.planned = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def plan_delivery(self, prompt_id, recipients):
+        self.planned.set()
+        await self.release.wait()  # The delivery is still sending
+
+    async def get_undelivered(self, prompt_id):
+        raise AssertionError("A running delivery must not be resumed.")
+
+    async def add_message_ids(self, prompt_id, deliveries):
+        pass
+
+
+def test_running_delivery_is_not_resumed():
+    async def run():
+        manager = Manager()
+        delivery = PromptDelivery(manager, render=None, outbound=None)
+        task = asyncio.ensure_future(delivery.deliver("1", "How was your day?", []))
+        await manager.planned.wait()
+
+        assert await delivery.resume(None, "1") == 0
+        manager.release.set()
+        assert await task == 0
+        assert not delivery.active
+
+    asyncio.run(run())
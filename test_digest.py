@@ -0,0 +1,36 @@
+import asyncio
+from digest import DigestPublisher
+from outbound import OutboundDispatcher
+from rounds import Round
+
+
+class Names:
+    def get(self, guild, user_id):
+        return f"Member {user_id}"
+
+
+class FlakyChannel:
+    id = 1
+
+    def __init__(self):
+        self.uploads = []
+
+    async def send(self, content=None, file=None):
+        self.uploads.append(file.fp.read())
+        if len(self.uploads) == 1:
+            raise OSError("Connection reset")
+        return content
+
+
+def test_attachment_is_complete_when_the_send_is_retried():
+    async def run():
+        channel = FlakyChannel()
+        publisher = DigestPublisher(Names(), OutboundDispatcher(rate=None, channel_rate=None, backoff=0), max_chunks=0)
+        prompt_round = Round("1", "How was your day?")
+        prompt_round.responses = {10: "Fine", 11: "Great"}
+
+        await publisher._publish_file(channel, None, prompt_round)
+        assert len(channel.uploads) == 2
+        assert channel.uploads[1] == channel.uploads[0] and b"Great" in channel.uploads[1]
+
+    asyncio.run(run())
@@ -0,0 +1,59 @@
+import json
+from journal import Journal
+
+
+def apply(state, entry):
+    state[entry["key"]] = entry["value"]
+
+
+def test_torn_write_is_cut_off_before_new_entries(tmp_path):
+    journal = Journal(str(tmp_path / "state.json"))
+    journal.append({"key": "a", "value": 1})
+    journal.close()
+    with open(journal.journal_file, "a") as f:
+        f.write('{"key":"b","val')  # Crash in the middle of a write
+
+    journal = Journal(str(tmp_path / "state.json"))
+    assert journal.load(apply) == {"a": 1}
+    journal.append({"key": "c", "value": 3})
+    journal.close()
+
+    assert Journal(str(tmp_path / "state.json")).load(apply) == {"a": 1, "c": 3}
+
+
+def test_unterminated_last_entry_is_kept(tmp_path):
+    journal = Journal(str(tmp_path / "state.json"))
+    with open(journal.journal_file, "w") as f:
+        f.write(json.dumps({"key": "a", "value": 1}))  # Written, but the newline wasn't
+
+    assert journal.load(apply) == {"a": 1}
+    journal.append({"key": "b", "value": 2})
+    journal.close()
+
+    assert Journal(str(tmp_path / "state.json")).load(apply) == {"a": 1, "b": 2}
+
+
+def test_replay_skips_changes_to_completed_rounds(tmp_path):
+    from storage import JsonStorage
+
+    def storage():
+        return JsonStorage(str(tmp_path / "prompts"), str(tmp_path / "used_prompts.json"),
+                           str(tmp_path / "inprogress_prompts.bin"), str(tmp_path / "inprogress_prompts.journal"),
+                           str(tmp_path / "notifications.json"), str(tmp_path / "private_channels.json"))
+
+    entries = [
+        {"op": "plan", "prompt_id": "1", "recipients": [[10, 20]]},
+        {"op": "messages", "prompt_id": "1", "messages": [[30, 10]], "timestamp": 2.0},
+        {"op": "response", "prompt_id": "1", "user_id": 10, "response": "hi", "timestamp": 3.0},
+        {"op": "reminded", "prompt_id": "1", "reminders": [[10, 1]]},
+        {"op": "remove", "prompt_id": "1"},
+    ]
+    # The snapshot already reflects the entries (the round is complete), but the
+    # process stopped before the journal was truncated
+    target = storage()
+    target.load_inprogress()
+    target.journal.compact({})
+    with open(target.journal.journal_file, "w") as f:
+        f.writelines(json.dumps(entry) + "\n" for entry in entries)
+
+    assert storage().load_inprogress() == {}
@@ -0,0 +1,107 @@
+import json
+from prompt_manager import PromptManager
+from storage import JsonStorage
+
+
+def manager(tmp_path, create=True):
+    if create:
+        (tmp_path / "prompts").mkdir()
+        with open(tmp_path / "prompts" / "Questions.json", "w") as f:
+            json.dump(["How was your day?", "What made you laugh this week?"], f)
+    storage = JsonStorage(str(tmp_path / "prompts"), str(tmp_path / "used_prompts.json"),
+                          str(tmp_path / "inprogress_prompts.bin"), str(tmp_path / "inprogress_prompts.journal"),
+                          str(tmp_path / "notifications.json"), str(tmp_path / "private_channels.json"),
+                          guilds_folder=str(tmp_path / "guilds"))
+    return PromptManager(storage=storage)
+
+
+def test_recipients_of_unplanned_round_keep_delivered_members(tmp_path):
+    prompt_manager = manager(tmp_path)
+    _, prompt_id = prompt_manager.get_random_prompt(1)
+    prompt_manager.add_message_ids(prompt_id, [(100, 10), (101, 11)])
+    prompt_manager.get_prompt(prompt_id).recipients = None  # Started before deliveries were planned
+    prompt_manager.set_private_channel(1, 10, 20)
+
+    prompt_manager.add_recipient(prompt_id, 12, 22)
+
+    assert prompt_manager.get_prompt(prompt_id).recipients == {10: 20, 11: 0, 12: 22}
+    assert prompt_manager.get_undelivered(prompt_id) == {12: 22}
+
+
+def test_leaving_member_of_unplanned_round_is_removed(tmp_path):
+    prompt_manager = manager(tmp_path)
+    _, prompt_id = prompt_manager.get_random_prompt(1)
+    prompt_manager.add_message_ids(prompt_id, [(100, 10), (101, 11)])
+    prompt_manager.get_prompt(prompt_id).recipients = None
+
+    prompt_manager.remove_recipient(prompt_id, 11)
+
+    assert prompt_manager.get_prompt(prompt_id).expected_responders() == {10}
+
+
+def test_delivery_time_is_found_by_message_id(tmp_path):
+    prompt_manager = manager(tmp_path)
+    _, prompt_id = prompt_manager.get_random_prompt(1)
+    prompt_manager.add_message_ids(prompt_id, [(100, 10), (101, 11)])
+    prompt_manager.add_message_ids(prompt_id, [(102, 12)])
+    prompt_round = prompt_manager.get_prompt(prompt_id)
+
+    assert prompt_manager.get_delivery_time(102) == prompt_round.message_times[2]
+    assert prompt_manager.get_delivery_time(100) == prompt_round.message_times[0]
+    assert prompt_manager.get_delivery_time(999) is None
+
+    # Rebuilt the same way from the stored state after a restart
+    prompt_manager.close()
+    assert manager(tmp_path, create=False).get_delivery_time(102) == prompt_round.message_times[2]
+
+
+def test_recipient_changes_are_journaled_one_at_a_time(tmp_path):
+    prompt_manager = manager(tmp_path)
+    _, prompt_id = prompt_manager.get_random_prompt(1)
+    prompt_manager.plan_delivery(prompt_id, {10: 20, 11: 21})
+    prompt_manager.add_message_ids(prompt_id, [(100, 10), (101, 11)])
+    prompt_manager.add_recipient(prompt_id, 12, 22)
+    prompt_manager.add_response(prompt_id, 10, "Fine")
+
+    assert prompt_manager.pending[prompt_id] == {11, 12}
+    assert not prompt_manager.remove_recipient(prompt_id, 12)
+    assert prompt_manager.remove_recipient(prompt_id, 11)  # The prompt was only waiting on this member
+
+    with open(prompt_manager.get_storage(1).journal.journal_file) as f:
+        entries = [json.loads(line) for line in f]
+    assert [entry for entry in entries if entry["op"] == "recipient"] == [
+        {"op": "recipient", "prompt_id": prompt_id, "user_id": 12, "channel_id": 22},
+        {"op": "recipient", "prompt_id": prompt_id, "user_id": 12, "channel_id": None},
+        {"op": "recipient", "prompt_id": prompt_id, "user_id": 11, "channel_id": None},
+    ]
+    prompt_manager.close()
+    assert manager(tmp_path, create=False).get_prompt(prompt_id).recipients == {10: 20}
+
+
+def test_recipient_changes_are_stored_with_sqlite(tmp_path):
+    from storage import SQLiteStorage
+
+    storage = SQLiteStorage(str(tmp_path / "bot.db"))
+    storage.save_prompts("Questions.json", ["How was your day?"])
+    prompt_manager = PromptManager(storage=storage)
+    _, prompt_id = prompt_manager.get_random_prompt(1)
+    prompt_manager.plan_delivery(prompt_id, {10: 20})
+    prompt_manager.add_recipient(prompt_id, 11, 21)
+    prompt_manager.remove_recipient(prompt_id, 10)
+    prompt_manager.close()
+
+    reloaded = PromptManager(storage=SQLiteStorage(str(tmp_path / "bot.db")))
+    assert reloaded.get_prompt(prompt_id).recipients == {11: 21}
+
+
+def test_pending_follows_deliveries_and_plans(tmp_path):
+    prompt_manager = manager(tmp_path)
+    _, prompt_id = prompt_manager.get_random_prompt(1)
+    prompt_manager.add_message_ids(prompt_id, [(100, 10)])
+    prompt_manager.add_response(prompt_id, 10, "Fine")
+    prompt_manager.add_message_ids(prompt_id, [(101, 11), (102, 12)])
+    assert prompt_manager.pending[prompt_id] == {11, 12}  # Unplanned: everyone delivered to is expected
+
+    prompt_manager.plan_delivery(prompt_id, {10: 20, 11: 21, 13: 23})
+    prompt_manager.add_message_ids(prompt_id, [(103, 13)])
+    assert prompt_manager.pending[prompt_id] == {11, 13}  # Planned: deliveries don't change it
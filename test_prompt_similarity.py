@@ -0,0 +1,42 @@
+import json
+import os
+from prompt_similarity import SimilarityIndex
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+
+
+def library():
+    entries = []
+    for file_name in sorted(os.listdir(PROMPTS_DIR)):
+        if file_name.endswith(".json"):
+            with open(os.path.join(PROMPTS_DIR, file_name), "r") as f:
+                entries.extend((file_name, prompt_text) for prompt_text in json.load(f))
+    return entries
+
+
+FIRST = "What's a place you'd love to visit or an experience you'd like to have?"
+SECOND = ("What's a place you'd love to visit with me in the next five years, and what do you imagine "
+          "us doing there? (with kids or no, how long a visit, etc)")
+
+
+def test_rephrased_prompt_is_found():
+    index = SimilarityIndex()
+    index.add_entries(library())
+
+    similar = [prompt_text for _, _, prompt_text in index.find_similar(FIRST)]
+    assert SECOND in similar
+
+
+def test_scan_flags_rephrased_pair():
+    index = SimilarityIndex()
+    index.add_entries(library())
+
+    pairs = [{first[1], second[1]} for _, first, second in index.scan()]
+    assert {FIRST, SECOND} in pairs
+
+
+def test_unrelated_prompts_are_not_flagged():
+    index = SimilarityIndex()
+    index.add("a.json", ["What's your favorite season, and why?"])
+
+    assert index.find_similar("How did you sleep last night?") == []